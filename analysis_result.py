@@ -0,0 +1,344 @@
+"""Typed result of a document validation and the parsers that produce it.
+
+The validator asks Gemini for a JSON object matching ANALYSIS_SCHEMA and parses
+it once into a DocumentAnalysis. Free-text responses (older prompts, models
+without schema support, or ANALYSIS_OUTPUT=text) go through a single-pass
+header parser that tolerates markdown and numbered or renamed headers. Both the
+UI tabs and the Word export read from the same object.
+"""
+import re
+import json
+from dataclasses import dataclass, field
+
+SECTION_NAMES = ["Summary", "Discrepancies", "Incorrect Clauses", "Corrected Clauses", "Missing Clauses", "Draft"]
+SECTION_FIELDS = {
+    "Summary": "summary",
+    "Discrepancies": "discrepancies",
+    "Incorrect Clauses": "incorrect_clauses",
+    "Corrected Clauses": "corrected_clauses",
+    "Missing Clauses": "missing_clauses",
+    "Draft": "draft",
+}
+LIST_FIELDS = ("discrepancies", "incorrect_clauses", "corrected_clauses", "missing_clauses")
+
+# Response schema in the form accepted by Gemini's generation_config["response_schema"]
+ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "summary": {"type": "STRING"},
+        "discrepancies": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "incorrect_clauses": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "corrected_clauses": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "missing_clauses": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "draft": {"type": "STRING"},
+    },
+    "required": ["summary", "discrepancies", "incorrect_clauses", "corrected_clauses", "missing_clauses", "draft"],
+}
+
+# Header spellings accepted by the free-text parser, per section
+SECTION_ALIASES = {
+    "Summary": ("summary", "document summary"),
+    "Discrepancies": ("discrepancies", "discrepancy detection"),
+    "Incorrect Clauses": ("incorrect clauses", "identify incorrect clauses"),
+    "Corrected Clauses": ("corrected clauses", "provide corrected clauses"),
+    "Missing Clauses": ("missing clauses", "identify missing clauses", "identify missing clauses (if any)"),
+    "Draft": ("draft", "draft generation", "generated draft"),
+}
+_ALIAS_TO_SECTION = {alias: name for name, aliases in SECTION_ALIASES.items() for alias in aliases}
+# A header starts a line, optionally after markdown heading/bold markers or a number, and ends
+# with a colon or the end of the line.
+SECTION_HEADER = re.compile(
+    r"^[ \t#>*_]*(?:\d+[.)][ \t]*)?[*_]*("
+    + "|".join(re.escape(alias) for alias in sorted(_ALIAS_TO_SECTION, key=len, reverse=True))
+    + r")[ \t*_]*(?::[ \t*_]*|$)",
+    re.IGNORECASE | re.MULTILINE,
+)
+BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+
+
+@dataclass
+class DocumentAnalysis:
+    summary: str = ""
+    discrepancies: list = field(default_factory=list)
+    incorrect_clauses: list = field(default_factory=list)
+    corrected_clauses: list = field(default_factory=list)
+    missing_clauses: list = field(default_factory=list)
+    draft: str = ""
+    structured: bool = False  # True when parsed from a JSON response
+    truncated: bool = False  # True when the response was cut off and its JSON had to be closed
+
+    def section_text(self, section_name):
+        """Return a section as markdown, with list fields rendered as bullets."""
+        value = getattr(self, SECTION_FIELDS[section_name])
+        if isinstance(value, list):
+            return "\n".join(f"- {item}" for item in value)
+        return value
+
+    def sections(self):
+        """Return ``{section_name: markdown}`` for every section, in display order."""
+        return {name: self.section_text(name) for name in SECTION_NAMES}
+
+    def is_complete(self):
+        """Whether the response was parsed whole and produced both a summary and a draft."""
+        return not self.truncated and bool(self.summary.strip()) and bool(self.draft.strip())
+
+    def to_dict(self):
+        return {field_name: getattr(self, field_name) for field_name in SECTION_FIELDS.values()}
+
+    @classmethod
+    def from_dict(cls, data, structured=True):
+        values = {}
+        for field_name in SECTION_FIELDS.values():
+            value = data.get(field_name)
+            if field_name in LIST_FIELDS:
+                if value is None:
+                    value = []
+                elif not isinstance(value, list):
+                    value = [value]
+                values[field_name] = [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+                                      for item in value if item]
+            else:
+                values[field_name] = value if isinstance(value, str) else ("" if value is None else str(value))
+        return cls(structured=structured, **values)
+
+
+def _strip_fence(text):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def parse_json_analysis(text):
+    """Parse a JSON analysis response, returning None if it is not a JSON object."""
+    try:
+        data = json.loads(_strip_fence(text))
+    except ValueError:
+        return None
+    return DocumentAnalysis.from_dict(data) if isinstance(data, dict) else None
+
+
+def _split_items(body):
+    """Split a free-text section into items, one per top-level bullet."""
+    items = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        if BULLET.match(line) or not items:
+            items.append(BULLET.sub("", line, count=1).strip())
+        else:
+            items[-1] += "\n" + line.strip()
+    return items
+
+
+def parse_text_analysis(text):
+    """Parse a free-text analysis in one pass over its section headers."""
+    text = text.replace("**", "")
+    bodies = {}
+    current, start = None, 0
+    for match in SECTION_HEADER.finditer(text):
+        name = _ALIAS_TO_SECTION[match.group(1).lower()]
+        if name in bodies or name == current:
+            continue
+        if current is not None:
+            bodies[current] = text[start:match.start()].strip()
+        current, start = name, match.end()
+    if current is not None:
+        bodies[current] = text[start:].strip()
+
+    data = {}
+    for name, body in bodies.items():
+        field_name = SECTION_FIELDS[name]
+        data[field_name] = _split_items(body) if field_name in LIST_FIELDS else body
+    return DocumentAnalysis.from_dict(data, structured=False)
+
+
+def _scan_json(text):
+    """Return the bracket stack, string state and the safe cut points of possibly incomplete JSON.
+
+    A cut point is the position of a comma between members, with the stack at
+    that point; cutting there drops a member that was itself cut off.
+    """
+    stack, in_string, escape = [], False, False
+    cuts = []
+    for position, char in enumerate(text):
+        if escape:
+            escape = False
+        elif in_string:
+            if char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]" and stack:
+            stack.pop()
+        elif char == ",":
+            cuts.append((position, list(stack)))
+    return stack, in_string, escape, cuts
+
+
+def repair_json_analysis(text):
+    """Parse a JSON analysis that was cut off (e.g. at max_output_tokens), or return None.
+
+    The open string and brackets are closed; if that does not parse, members are
+    dropped from the end until it does. The result is marked ``truncated``.
+    """
+    text = _strip_fence(text)
+    stack, in_string, escape, cuts = _scan_json(text)
+    data = _close_partial_json(text, stack, in_string, escape)
+    for position, cut_stack in reversed(cuts):
+        if isinstance(data, dict):
+            break
+        data = _close_partial_json(text[:position], cut_stack, False, False)
+    if not isinstance(data, dict):
+        return None
+    analysis = DocumentAnalysis.from_dict(data)
+    analysis.truncated = True
+    return analysis
+
+
+def parse_analysis(text):
+    """Parse a validator response, preferring JSON and falling back to the header parser.
+
+    A JSON response that does not parse is repaired as a cut-off response; the
+    header parser is only used for text that is not JSON.
+    """
+    if _strip_fence(text).startswith("{"):
+        analysis = parse_json_analysis(text) or repair_json_analysis(text)
+        if analysis is None:
+            print("Could not parse or repair the JSON analysis response")
+            return DocumentAnalysis(structured=True, truncated=True)
+        if analysis.truncated:
+            print("The JSON analysis response was cut off; parsed the complete part of it")
+        return analysis
+    return parse_text_analysis(text)
+
+
+def _close_partial_json(text, stack, in_string, escape):
+    """Return `text` completed with the quotes and brackets needed to parse it, or None."""
+    if escape:
+        text = text[:-1]
+    suffix = '"' if in_string else ""
+    suffix += "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+    body = text.rstrip()
+    if not in_string:
+        if body.endswith(","):
+            body = body[:-1]
+        elif body.endswith(":"):
+            body += "null"
+    try:
+        return json.loads(body + suffix)
+    except ValueError:
+        return None
+
+
+def stream_json_sections(chunks, min_new_chars=200):
+    """Yield (section_name, text_so_far) while a JSON analysis streams in.
+
+    Bracket and string state is tracked incrementally, and the partial document
+    is closed and parsed at most once per `min_new_chars` new characters.
+    """
+    buffer = ""
+    stack, in_string, escape = [], False, False
+    parsed_at = 0
+    shown = {}
+    finished = False
+    chunks = iter(chunks)
+    while not finished:
+        chunk = next(chunks, None)
+        finished = chunk is None
+        for char in chunk or "":
+            if escape:
+                escape = False
+            elif in_string:
+                if char == "\\":
+                    escape = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                stack.append(char)
+            elif char in "}]" and stack:
+                stack.pop()
+        buffer += chunk or ""
+        if not finished and len(buffer) - parsed_at < min_new_chars:
+            continue
+        parsed_at = len(buffer)
+        if finished:
+            analysis = parse_analysis(buffer)
+        else:
+            data = _close_partial_json(_strip_fence(buffer), stack, in_string, escape)
+            if not isinstance(data, dict):
+                continue
+            analysis = DocumentAnalysis.from_dict(data)
+        for name, text in analysis.sections().items():
+            if text and shown.get(name) != text:
+                shown[name] = text
+                yield name, text
+
+
+def stream_text_sections(chunks):
+    """Yield (section_name, text_so_far) as each section of a streamed free-text analysis grows.
+
+    Only the newly arrived text is scanned for section headers, holding back a
+    few characters so a header split across two chunks is still recognised.
+    """
+    holdback = max(len(alias) for alias in _ALIAS_TO_SECTION) + 8
+    buffer, pending = "", ""
+    scanned = 0
+    current, section_start = None, 0
+    seen = set()
+    finished = False
+    chunks = iter(chunks)
+    while not finished:
+        chunk = next(chunks, None)
+        finished = chunk is None
+        # Markdown bold markers are stripped, keeping a trailing "*" until the next chunk.
+        text = (pending + (chunk or "")).replace("**", "")
+        pending = "" if finished or not text.endswith("*") else "*"
+        buffer += text[:-1] if pending else text
+
+        limit = len(buffer) if finished else max(scanned, len(buffer) - holdback)
+        # Headers are matched from the start of the line holding the first unscanned character.
+        line_start = buffer.rfind("\n", 0, scanned) + 1
+        for match in SECTION_HEADER.finditer(buffer, line_start):
+            if match.end() <= scanned:
+                continue
+            if match.start() >= limit or (not finished and match.end() >= len(buffer)):
+                break
+            limit = max(limit, match.end())
+            name = _ALIAS_TO_SECTION[match.group(1).lower()]
+            if name in seen:
+                continue
+            if current is not None:
+                yield current, buffer[section_start:match.start()].strip()
+            current, section_start = name, match.end()
+            seen.add(name)
+        scanned = limit
+        if current is not None:
+            yield current, buffer[section_start:limit].strip()
+
+
+def stream_sections(chunks):
+    """Yield (section_name, text_so_far) for a streamed analysis in either JSON or free-text form."""
+    chunks = iter(chunks)
+    head = []
+    for chunk in chunks:
+        head.append(chunk)
+        if chunk.strip():
+            break
+    first = "".join(head).lstrip()
+
+    def replay():
+        yield from head
+        yield from chunks
+
+    if first.startswith("{") or first.startswith("```"):
+        return stream_json_sections(replay())
+    return stream_text_sections(replay())
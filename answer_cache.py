@@ -0,0 +1,152 @@
+"""Semantic cache of Legal Query Assistant answers.
+
+Users ask many near-identical BNS questions ("punishment for theft", "theft
+punishment BNS"). The query embedding is computed anyway for retrieval, so a
+stored answer is returned when a new query's embedding is close enough to a
+previous one, skipping retrieval and generation entirely. Every entry carries
+the namespace of the configuration that produced it (see
+legal_engine.answer_namespace: LLM backend and model, query prompt and index
+version), and a lookup only compares entries from the current namespace.
+"""
+import os
+import json
+import time
+import threading
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_CACHE_PATH = "answer_cache.json"
+SAVE_EVERY = 20
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """Answer cache keyed by query embedding with cosine-similarity lookup.
+
+    Entries older than `ttl_seconds` are ignored and dropped; once more than
+    `max_entries` are stored the least recently used one is evicted. When
+    `path` is set the cache is loaded from and written back to that JSON file,
+    tagged with `model_name` so vectors from another embedding model are never
+    compared. The file is rewritten every SAVE_EVERY stored answers and by
+    ``save()``, which the shared cache also calls at exit.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl_seconds=DEFAULT_TTL_SECONDS, path=None, model_name=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._entries = []  # dicts with query, answer, namespace, created_at, last_used
+        self._matrix = None  # unit query embeddings, one row per entry
+        self._unsaved = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable answer cache '{self.path}': {e}")
+            return
+        if data.get("model_name") != self.model_name:
+            return
+        now = time.time()
+        entries = [entry for entry in data.get("entries", []) if now - entry["created_at"] < self.ttl_seconds]
+        entries = sorted(entries, key=lambda entry: entry["last_used"])[-self.max_entries:]
+        self._entries = [{k: v for k, v in entry.items() if k != "embedding"} for entry in entries]
+        if entries:
+            self._matrix = np.array([entry["embedding"] for entry in entries], dtype=np.float32)
+
+    def save(self):
+        """Write the entries to `path`; the file is serialized outside the lookup lock."""
+        if not self.path:
+            return
+        with self._lock:
+            entries = [
+                dict(entry, embedding=row.tolist())
+                for entry, row in zip(self._entries, self._matrix if self._matrix is not None else [])
+            ]
+            self._unsaved = 0
+        tmp_path = f"{self.path}.tmp"
+        with self._save_lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model_name": self.model_name, "entries": entries}, f)
+            os.replace(tmp_path, self.path)
+
+    def _remove(self, positions):
+        doomed = set(positions)
+        keep = [i for i in range(len(self._entries)) if i not in doomed]
+        self._entries = [self._entries[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+
+    def lookup(self, embedding, namespace=None):
+        """Return ``(answer, similarity)`` for the closest fresh entry in `namespace`, or ``(None, similarity)``."""
+        query = _unit(embedding)
+        with self._lock:
+            if self._matrix is not None:
+                now = time.time()
+                expired = [i for i, entry in enumerate(self._entries) if now - entry["created_at"] >= self.ttl_seconds]
+                if expired:
+                    self._remove(expired)
+            if self._matrix is None:
+                self.misses += 1
+                return None, 0.0
+            similarities = self._matrix @ query
+            other = [i for i, entry in enumerate(self._entries) if entry.get("namespace") != namespace]
+            similarities[other] = -1.0
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, similarity
+            entry = self._entries[best]
+            entry["last_used"] = time.time()
+            self.hits += 1
+            return entry["answer"], similarity
+
+    def store(self, query, embedding, answer, namespace=None):
+        """Remember `answer` for `query` under `namespace`, evicting the least recently used entry if full."""
+        row = _unit(embedding)[None, :]
+        now = time.time()
+        with self._lock:
+            self._entries.append({"query": query, "answer": answer, "namespace": namespace, "created_at": now,
+                                  "last_used": now})
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+            if len(self._entries) > self.max_entries:
+                oldest = min(range(len(self._entries)), key=lambda i: self._entries[i]["last_used"])
+                self._remove([oldest])
+            self._unsaved += 1
+            due = self._unsaved >= SAVE_EVERY
+        if due:
+            self.save()
+
+    def clear(self):
+        """Drop every entry and the persisted file."""
+        with self._lock:
+            self._entries = []
+            self._matrix = None
+            self.hits = 0
+            self.misses = 0
+            self._unsaved = 0
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def stats(self):
+        """Return hit/miss counters and the number of stored answers."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
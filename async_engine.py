@@ -0,0 +1,239 @@
+"""Asyncio versions of the engine functions, driven by one event loop shared across sessions.
+
+The loop runs forever in a daemon thread created through the resource registry,
+so it survives Streamlit reruns. Blocking work (embedding, vector queries and
+the cached upload) runs in the loop's default executor; Gemini calls use the
+SDK's native async methods. These are the only implementations of retrieval,
+answering and validation: the synchronous functions in legal_engine run them
+here with run() and run_stream(). A stream whose reader stops early is
+cancelled; the validator cancels a session's previous job when it submits a
+new one.
+
+Document validation overlaps independent steps: the upload, the precomputed
+BNS context bundles and any clause refinement run while the document type is
+detected, and the bundle for the detected type is used once it is known.
+"""
+import queue
+import asyncio
+import threading
+
+from prompts import DOCUMENT_TYPE_PROMPT
+from telemetry import span, start_trace
+from resources import get_answer_cache, get_resource, get_vector_store
+from context_bundles import get_context_bundles
+from reranker import rerank, rerank_candidates
+from legal_engine import (ANALYSIS_MESSAGE, QUERY_MESSAGE, analysis_model, answer_namespace, build_document_prompt,
+                          build_legal_context, classify_document_type, dense_top_k, document_analysis_model,
+                          document_clause_matches, document_context_matches, embed, estimate_tokens, fuse_lexical,
+                          lookup_answer, map_document_type, process_results, query_model,
+                          structured_output, upload_to_gemini)
+
+
+def _start_loop(config):
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="legal-engine-loop", daemon=True).start()
+    return loop
+
+
+def get_loop():
+    """Return the process-wide event loop, starting its thread on first use."""
+    return get_resource("event_loop", _start_loop)
+
+
+def submit(coro):
+    """Schedule `coro` on the shared loop and return a concurrent.futures.Future.
+
+    The coroutine runs in a copy of the caller's context, so it keeps the
+    caller's trace id.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def _check_off_loop():
+    # Blocking on the shared loop from its own thread would wait forever for itself.
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    if running is get_loop():
+        raise RuntimeError("A blocking engine call was made on the shared event loop; await the async version.")
+
+
+def run(coro, timeout=None):
+    """Run `coro` on the shared loop and block until it returns."""
+    try:
+        _check_off_loop()
+    except RuntimeError:
+        coro.close()
+        raise
+    return submit(coro).result(timeout)
+
+
+def run_stream(start):
+    """Run ``start()``, which returns ``(async iterator, info)``, on the shared loop.
+
+    Returns ``(iterator, info)`` for the calling thread. Items are handed over
+    through a queue as they are produced. If the caller stops iterating early
+    (for example because Streamlit reran the script) the request is cancelled.
+    """
+    _check_off_loop()
+    items = queue.Queue()
+
+    async def pump():
+        chunks, info = await start()
+        items.put(("info", info))
+        async for chunk in chunks:
+            items.put(("item", chunk))
+
+    future = submit(pump())
+    future.add_done_callback(lambda f: items.put(("end", f)))
+
+    def finish(done_future):
+        if not done_future.cancelled() and done_future.exception() is not None:
+            raise done_future.exception()
+
+    kind, value = items.get()
+    if kind == "end":
+        finish(value)
+        return iter(()), None
+    info = value
+
+    def chunks():
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == "item":
+                    yield value
+                else:
+                    finish(value)
+                    return
+        finally:
+            future.cancel()
+
+    return chunks(), info
+
+
+async def retrieve_documents_async(query, top_k=10, query_embedding=None):
+    """Async retrieve_documents: embedding and vector query run off the event loop."""
+    if query_embedding is None:
+        query_embedding = await asyncio.to_thread(embed, query)
+    candidates = rerank_candidates(top_k)
+    with span("vector_query", top_k=candidates) as s:
+        results = await asyncio.to_thread(
+            get_vector_store().query, vector=list(map(float, query_embedding)), top_k=dense_top_k(query, candidates),
+            include_metadata=True)
+        s.set(chunks=len(results["matches"]))
+    fused = fuse_lexical(query, results["matches"], candidates)
+    return await asyncio.to_thread(rerank, query, fused, top_k, results["matches"])
+
+
+async def query_llm_stream_async(query, context):
+    """Async query_llm_stream: yield the answer text as Gemini generates it."""
+    message = QUERY_MESSAGE.format(context=context, query=query)
+    with span("generation", kind="query", prompt_estimate=estimate_tokens(message)) as s:
+        response = await query_model().generate_content_async(message, stream=True)
+        parts = []
+        async for chunk in response:
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+        s.set(chunks=len(parts))
+        s.set_tokens(response, message, "".join(parts))
+
+
+async def query_llm_async(query, context):
+    """Async query_llm."""
+    return "".join([chunk async for chunk in query_llm_stream_async(query, context)])
+
+
+async def _single(text):
+    yield text
+
+
+async def answer_query_stream_async(query):
+    """Async answer_query_stream: return ``(async iterator of text, from_cache)``."""
+    start_trace()
+    query_embedding = await asyncio.to_thread(embed, query)
+    namespace = answer_namespace()
+    cached_answer = lookup_answer(query_embedding, namespace)
+    if cached_answer is not None:
+        return _single(cached_answer), True
+
+    async def generate():
+        results = await retrieve_documents_async(query, query_embedding=query_embedding)
+        context = process_results(results)
+        parts = []
+        async for chunk in query_llm_stream_async(query, context):
+            parts.append(chunk)
+            yield chunk
+        get_answer_cache().store(query, query_embedding, "".join(parts), namespace)
+
+    return generate(), False
+
+
+async def upload_to_gemini_async(path, mime_type=None):
+    """Async upload_to_gemini, sharing the content-hash upload cache."""
+    return await asyncio.to_thread(upload_to_gemini, path, mime_type)
+
+
+async def detect_document_type_async(file_path):
+    """Async detect_document_type: classify locally, falling back to Gemini when unsure."""
+    doc_type = await asyncio.to_thread(classify_document_type, file_path)
+    if doc_type is not None:
+        return doc_type
+    file = await upload_to_gemini_async(file_path, mime_type="application/pdf")
+    with span("type_detection") as s:
+        response = await analysis_model().generate_content_async([file, DOCUMENT_TYPE_PROMPT])
+        doc_type = map_document_type(response.text)
+        s.set(doc_type=doc_type)
+        s.set_tokens(response, DOCUMENT_TYPE_PROMPT, response.text)
+    return doc_type
+
+
+async def process_document_stream_async(file_path):
+    """Async process_document_stream: return ``(async iterator of analysis text, doc_type)``."""
+    start_trace()
+    # Imported here because long_document builds on this module.
+    from long_document import long_document_pages, long_document_stream_async
+    pages = await asyncio.to_thread(long_document_pages, file_path)
+    if pages:
+        return await long_document_stream_async(file_path, pages)
+
+    # The upload, the context bundles and clause refinement do not depend on the document type,
+    # so they run while it is detected.
+    upload = asyncio.ensure_future(upload_to_gemini_async(file_path, mime_type="application/pdf"))
+    bundles = asyncio.ensure_future(asyncio.to_thread(get_context_bundles))
+    refinement = asyncio.ensure_future(asyncio.to_thread(document_clause_matches, file_path))
+    try:
+        doc_type = await detect_document_type_async(file_path)
+        file = await upload
+        await bundles
+        extra_matches = await refinement
+    finally:
+        for task in (upload, bundles, refinement):
+            task.cancel()
+
+    legal_context_results = document_context_matches(doc_type, extra_matches)
+    legal_context, _ = build_legal_context(legal_context_results)
+    document_prompt = build_document_prompt(doc_type, legal_context, structured=structured_output())
+
+    async def generate():
+        with span("generation", kind="analysis", doc_type=doc_type,
+                  prompt_estimate=estimate_tokens(document_prompt)) as s:
+            chat_session = document_analysis_model().start_chat(history=[{"role": "user", "parts": [file, document_prompt]}])
+            response = await chat_session.send_message_async(ANALYSIS_MESSAGE, stream=True)
+            parts = []
+            async for chunk in response:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield chunk.text
+            s.set(chunks=len(parts))
+            s.set_tokens(response, document_prompt + ANALYSIS_MESSAGE, "".join(parts))
+
+    return generate(), doc_type
+
+
+async def process_document_async(file_path):
+    """Async process_document: return ``(analysis text, doc_type)``."""
+    chunks, doc_type = await process_document_stream_async(file_path)
+    return "".join([chunk async for chunk in chunks]), doc_type
@@ -0,0 +1,194 @@
+"""Answer a JSONL file of legal questions headlessly, e.g. for nightly regression runs.
+
+Usage:
+    python batch_query.py questions.jsonl answers.jsonl [--concurrency 8] [--retries 5]
+
+Each input line is a JSON object with an id and a query (field names are
+configurable). All pending queries are embedded in one batched encode call,
+then retrieval and generation fan out over a bounded thread pool with
+exponential backoff on rate-limit and transient errors. Results are appended
+to the output file in input order as they complete; on a re-run, ids that
+already have a successful answer in the output file are skipped.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+
+# Errors worth retrying: quota/rate limits and transient upstream failures.
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "ConnectionError", "Timeout", "ReadTimeout",
+}
+
+
+def is_retryable(error):
+    """Return True for rate-limit and transient errors from Gemini or Pinecone."""
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status", None)
+    return status in (429, 500, 502, 503, 504)
+
+
+def with_retries(fn, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF_SECONDS):
+    """Call `fn()`, retrying retryable errors with jittered exponential backoff.
+
+    Returns ``(result, attempts)``.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fn(), attempt
+        except Exception as e:
+            if attempt > retries or not is_retryable(e):
+                raise
+            delay = min(MAX_BACKOFF_SECONDS, backoff * 2 ** (attempt - 1))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+def read_queries(path, id_field="id", query_field="query"):
+    """Return ``[(id, query)]`` from a JSONL file, using the line number when no id is given."""
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            queries.append((str(record.get(id_field, line_number)), record[query_field]))
+    return queries
+
+
+def completed_ids(path):
+    """Return ids that already have a successful answer in an output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A run killed mid-write can leave a truncated last line.
+                continue
+            if "error" not in record:
+                done.add(record["id"])
+    return done
+
+
+def run_batch(input_path, output_path, concurrency=DEFAULT_CONCURRENCY, retries=DEFAULT_RETRIES,
+              top_k=10, id_field="id", query_field="query", use_cache=False):
+    """Answer every pending query in `input_path`, appending results to `output_path`.
+
+    Returns counts of answered, failed and skipped queries.
+    """
+    from legal_engine import answer_namespace, check_config, embed, process_results, query_llm, retrieve_documents
+    from resources import get_answer_cache
+    from telemetry import start_trace
+
+    check_config()
+    queries = read_queries(input_path, id_field, query_field)
+    done = completed_ids(output_path)
+    pending = [(query_id, query) for query_id, query in queries if query_id not in done]
+    totals = {"answered": 0, "failed": 0, "skipped": len(queries) - len(pending)}
+    if not pending:
+        return totals
+
+    print(f"Encoding {len(pending)} queries...")
+    embeddings = embed([query for _, query in pending], cache=False)  # one-off queries must not evict user ones
+    answer_cache = get_answer_cache() if use_cache else None
+    namespace = answer_namespace()
+
+    def answer(position):
+        query_id, query = pending[position]
+        embedding = embeddings[position]
+        start_trace()
+        started = time.perf_counter()
+        record = {"id": query_id, "query": query}
+        try:
+            cached = answer_cache.lookup(embedding, namespace)[0] if answer_cache else None
+            if cached is not None:
+                record["answer"], record["attempts"], record["cached"] = cached, 0, True
+            else:
+                matches, retrieval_attempts = with_retries(
+                    lambda: retrieve_documents(query, top_k=top_k, query_embedding=embedding), retries)
+                context = process_results(matches)
+                response, llm_attempts = with_retries(lambda: query_llm(query, context), retries)
+                record["answer"] = response
+                record["attempts"] = retrieval_attempts + llm_attempts
+                if answer_cache:
+                    answer_cache.store(query, embedding, response, namespace)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["latency_s"] = round(time.perf_counter() - started, 3)
+        return position, record
+
+    # Results are buffered until every earlier query is written, keeping the output in input order.
+    finished = {}
+    next_to_write = 0
+    window = concurrency * 4
+    with open(output_path, "a+", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Start on a fresh line if a previous run was killed mid-write.
+        if out.tell() > 0:
+            out.seek(out.tell() - 1)
+            if out.read(1) != "\n":
+                out.write("\n")
+        in_flight = set()
+        next_to_submit = 0
+        while next_to_write < len(pending):
+            while next_to_submit < len(pending) and next_to_submit - next_to_write < window:
+                in_flight.add(pool.submit(answer, next_to_submit))
+                next_to_submit += 1
+            written_before = next_to_write
+            done_futures, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                position, record = future.result()
+                finished[position] = record
+            while next_to_write in finished:
+                record = finished.pop(next_to_write)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                totals["failed" if "error" in record else "answered"] += 1
+                next_to_write += 1
+            out.flush()
+            if next_to_write // 50 != written_before // 50 or next_to_write == len(pending):
+                print(f"{next_to_write}/{len(pending)} written")
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of legal queries.")
+    parser.add_argument("input", help="JSONL file with one query object per line")
+    parser.add_argument("output", help="JSONL file to append answers to (also used to resume)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="queries answered in parallel")
+    parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="retries per call on rate-limit errors")
+    parser.add_argument("--top-k", type=int, default=10, help="chunks retrieved per query")
+    parser.add_argument("--id-field", default="id", help="input field holding the query id")
+    parser.add_argument("--query-field", default="query", help="input field holding the query text")
+    parser.add_argument("--use-cache", action="store_true", help="serve and fill the semantic answer cache")
+    args = parser.parse_args(argv)
+
+    totals = run_batch(
+        args.input,
+        args.output,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        top_k=args.top_k,
+        id_field=args.id_field,
+        query_field=args.query_field,
+        use_cache=args.use_cache,
+    )
+    print(f"Answered {totals['answered']}, failed {totals['failed']}, skipped {totals['skipped']}")
+    return 1 if totals["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
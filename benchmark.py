@@ -0,0 +1,196 @@
+"""End-to-end latency benchmark for retrieval, query answering and document validation.
+
+Usage:
+    python benchmark.py [--iterations 20] [--sessions 1 4 16] [--pdf FILE]
+                        [--real-embedder] [--live] [--json results.json]
+                        [--baseline baseline.json] [--tolerance 0.25]
+
+By default every remote client is replaced by the stand-ins in standins.py,
+so the run needs no keys or network and measures our own overhead plus the
+configured stand-in latencies. --real-embedder keeps the SentenceTransformer
+and --live uses the configured Gemini and vector backends.
+
+QUERY_SET is small, so the same queries repeat and would be answered from the
+caches after the first pass. Every stage is therefore measured cold, with the
+embedding cache off and the upload cache emptied before each document, and
+the retrieval and document stages again warm (":warm" rows) with the caches
+on. Throughput runs cold.
+
+Reports p50/p95/p99 per stage, throughput of the full query flow at each
+concurrency level and the process memory high-water mark. With --baseline the
+run fails (exit code 1) when a stage's p95 or a throughput figure is worse than
+the baseline by more than --tolerance.
+"""
+import sys
+import json
+import math
+import importlib.util
+import time
+import argparse
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt_tokens import QUERY_SET
+from resources import get_config, set_config_overrides
+
+DEFAULT_PDF = "fault_PRENUPTIAL AGREEMENT.pdf"
+DEFAULT_ITERATIONS = 20
+DEFAULT_SESSIONS = (1, 4, 16)
+DEFAULT_TOLERANCE = 0.25
+STANDIN_CONFIG = {"LLM_BACKEND": "standin", "VECTOR_BACKEND": "standin", "EMBEDDING_BACKEND": "standin"}
+CACHES_OFF_CONFIG = {"EMBEDDING_CACHE_SIZE": "0"}
+
+
+def percentile(samples, pct):
+    """Return the nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, min(len(ordered), math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+def time_calls(fn, args_list):
+    """Call `fn(*args)` for each entry and return the durations in seconds."""
+    durations = []
+    for args in args_list:
+        started = time.perf_counter()
+        fn(*args)
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def memory_high_water_mb():
+    """Return the process peak RSS in MB, or the traced Python heap peak where RSS is unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def run_benchmark(iterations=DEFAULT_ITERATIONS, sessions=DEFAULT_SESSIONS, pdf_path=DEFAULT_PDF):
+    """Run every stage cold and warm and every concurrency level, returning a JSON-serialisable report."""
+    from legal_engine import check_config, process_document, process_results, query_llm, retrieve_documents
+    from resources import get_upload_cache
+
+    check_config()
+    # Tracing every allocation slows the run down, so it is only used where getrusage is missing (Windows).
+    traced = importlib.util.find_spec("resource") is None
+    if traced:
+        tracemalloc.start()
+    queries = [QUERY_SET[i % len(QUERY_SET)] for i in range(iterations)]
+    previous = {key: get_config().get(key) for key in CACHES_OFF_CONFIG}
+
+    def uncached_document(path):
+        get_upload_cache().clear()
+        process_document(path)
+
+    # Warm-up loads the shared clients so load time is not attributed to the first sample.
+    context = process_results(retrieve_documents(queries[0]))
+    query_llm(queries[0], context)
+
+    report = {"stages": {}, "throughput": {}}
+    set_config_overrides(CACHES_OFF_CONFIG)
+    report["stages"]["retrieve_documents"] = summarize(time_calls(retrieve_documents, [(q,) for q in queries]))
+    contexts = [process_results(retrieve_documents(q)) for q in queries]
+    report["stages"]["query_llm"] = summarize(time_calls(query_llm, list(zip(queries, contexts))))
+    documents = [(pdf_path,)] * max(1, iterations // 4)
+    report["stages"]["process_document"] = summarize(time_calls(uncached_document, documents))
+
+    def query_flow(query):
+        started = time.perf_counter()
+        query_llm(query, process_results(retrieve_documents(query)))
+        return time.perf_counter() - started
+
+    for concurrency in sessions:
+        flows = [QUERY_SET[i % len(QUERY_SET)] for i in range(concurrency * max(1, iterations // 4))]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(query_flow, flows))
+        elapsed = time.perf_counter() - started
+        report["throughput"][str(concurrency)] = dict(
+            summarize(latencies), requests_per_second=round(len(flows) / elapsed, 2))
+
+    set_config_overrides(previous)
+    retrieve_documents(queries[0])
+    process_document(pdf_path)
+    report["stages"]["retrieve_documents:warm"] = summarize(time_calls(retrieve_documents, [(q,) for q in queries]))
+    report["stages"]["process_document:warm"] = summarize(time_calls(process_document, documents))
+
+    report["memory_high_water_mb"] = memory_high_water_mb()
+    if traced:
+        tracemalloc.stop()
+    return report
+
+
+def find_regressions(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return human-readable descriptions of figures worse than `baseline` by more than `tolerance`."""
+    regressions = []
+    for stage, stats in report["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if base and stats["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{stage} p95 {stats['p95_ms']}ms > baseline {base['p95_ms']}ms")
+    for concurrency, stats in report["throughput"].items():
+        base = baseline.get("throughput", {}).get(concurrency)
+        if base and stats["requests_per_second"] < base["requests_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{concurrency} sessions {stats['requests_per_second']} req/s < baseline {base['requests_per_second']} req/s")
+    return regressions
+
+
+def print_report(report):
+    print(f"{'stage':<24} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<24} {stats['count']:>4} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+    print(f"\n{'sessions':<10} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for concurrency, stats in report["throughput"].items():
+        print(f"{concurrency:<10} {stats['requests_per_second']:>8} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+    print(f"\nMemory high-water mark: {report['memory_high_water_mb']} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark retrieval, query answering and document validation.")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="samples per stage")
+    parser.add_argument("--sessions", type=int, nargs="+", default=list(DEFAULT_SESSIONS), help="concurrency levels")
+    parser.add_argument("--pdf", default=DEFAULT_PDF, help="PDF used for the process_document stage")
+    parser.add_argument("--real-embedder", action="store_true", help="use the configured SentenceTransformer")
+    parser.add_argument("--live", action="store_true", help="use the configured Gemini and vector backends")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    overrides = {} if args.live else dict(STANDIN_CONFIG)
+    if args.real_embedder:
+        overrides.pop("EMBEDDING_BACKEND", None)
+    set_config_overrides(overrides)
+
+    report = run_benchmark(args.iterations, args.sessions, args.pdf)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Assemble retrieved BNS chunks into a deduplicated, size-bounded prompt context.
+
+Matches are taken highest score first. Chunks whose text repeats or largely
+overlaps an already selected chunk (for example the overlapping tails produced
+by ingestion) are dropped, and selection stops adding chunks once the token
+budget is spent. Each chunk appears once, prefixed with its section citation.
+"""
+import re
+
+DEFAULT_TOKEN_BUDGET = 3000
+DEFAULT_OVERLAP_THRESHOLD = 0.8
+CHARS_PER_TOKEN = 4
+SHINGLE_SIZE = 3
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    """Rough token count for Gemini-style tokenizers (about four characters per token)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _shingles(text):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def citation(match):
+    """Return a short citation label for a match from its metadata."""
+    metadata = match.get("metadata") or {}
+    if metadata.get("section"):
+        return f"BNS Section {metadata['section']}"
+    return metadata.get("source") or match.get("id") or "BNS"
+
+
+def build_context(matches, token_budget=DEFAULT_TOKEN_BUDGET, overlap_threshold=DEFAULT_OVERLAP_THRESHOLD):
+    """Return ``(context, report)`` for a list of Pinecone-style matches.
+
+    `report` records how many chunks came in, how many were used, how many
+    were dropped as duplicates or for the budget, and the estimated context
+    tokens.
+    """
+    ordered = sorted(matches, key=lambda match: match.get("score") or 0.0, reverse=True)
+    selected, kept_shingles = [], []
+    report = {"chunks_in": len(ordered), "chunks_used": 0, "duplicates": 0, "over_budget": 0, "context_tokens": 0}
+    used_tokens = 0
+
+    for match in ordered:
+        text = ((match.get("metadata") or {}).get("text") or "").strip()
+        if not text:
+            continue
+        shingles = _shingles(text)
+        is_duplicate = False
+        for other in kept_shingles:
+            smaller = min(len(shingles), len(other)) or 1
+            if len(shingles & other) / smaller >= overlap_threshold:
+                is_duplicate = True
+                break
+        if is_duplicate:
+            report["duplicates"] += 1
+            continue
+
+        entry = f"[{citation(match)}] {text}"
+        tokens = estimate_tokens(entry) + 1
+        if used_tokens + tokens > token_budget:
+            # A lower-scoring but shorter chunk may still fit, so keep looking.
+            report["over_budget"] += 1
+            continue
+        selected.append(entry)
+        kept_shingles.append(shingles)
+        used_tokens += tokens
+
+    report["chunks_used"] = len(selected)
+    report["context_tokens"] = used_tokens
+    return "\n".join(selected), report
@@ -0,0 +1,163 @@
+"""Precomputed BNS context for each document type.
+
+Every rental agreement (or divorce petition) used to re-embed and re-run the
+same fixed retrieval query. The matches for each type in DOCUMENT_QUERY_TERMS
+are now computed once per index version, kept in memory and persisted to
+``CONTEXT_BUNDLE_PATH`` (default context_bundles.json) so restarts and other
+processes reuse them. ingest.py rewrites the file after changing the index.
+Stores without a version (Pinecone unless PINECONE_INDEX_VERSION is set) fall
+back to rebuilding every ``CONTEXT_BUNDLE_TTL`` seconds.
+
+With ``CONTEXT_REFINEMENT`` enabled, a document's own key clauses are also
+used as queries and their matches are added to the bundle for its type.
+"""
+import os
+import re
+import json
+import time
+
+from prompts import DOCUMENT_QUERY_TERMS
+from resources import (DEFAULT_EMBEDDING_MODEL, file_stamp, get_config, get_embedding_model, get_resource,
+                       get_vector_store, index_version)
+from vector_store import plain_match
+
+DEFAULT_BUNDLE_PATH = "context_bundles.json"
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+BUNDLE_TOP_K = 15
+REFINE_CLAUSES = 4
+REFINE_TOP_K = 3
+MIN_CLAUSE_CHARS = 40
+MAX_CLAUSE_CHARS = 400
+
+SENTENCE_END = re.compile(r"(?<=[.;:])\s+")
+# Sentences with these words usually carry the obligations the BNS context should cover.
+CLAUSE_CUES = re.compile(
+    r"\b(shall|agrees?|liable|terminat\w*|penalt\w*|deposit|evict\w*|custody|maintenance|alimony|indemnif\w*)\b",
+    re.IGNORECASE,
+)
+
+
+def compute_bundles(store, embedding_model, top_k=BUNDLE_TOP_K):
+    """Return ``{doc_type: [match, ...]}`` for every type, embedding the queries in one batch."""
+    doc_types = list(DOCUMENT_QUERY_TERMS)
+    embeddings = embedding_model.encode([DOCUMENT_QUERY_TERMS[t] for t in doc_types])
+    bundles = {}
+    for doc_type, embedding in zip(doc_types, embeddings):
+        results = store.query(vector=list(map(float, embedding)), top_k=top_k, include_metadata=True)
+        bundles[doc_type] = [plain_match(match) for match in results["matches"]]
+    return bundles
+
+
+def save_bundles(bundles, version, model_name, path=DEFAULT_BUNDLE_PATH):
+    """Write bundles atomically, tagged with the index version and embedding model they came from."""
+    payload = {"version": version, "model": model_name, "built_at": time.time(),
+               "queries": DOCUMENT_QUERY_TERMS, "bundles": bundles}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_bundles(version, model_name, path=DEFAULT_BUNDLE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS):
+    """Return persisted bundles if they match the index version, model and queries, else None."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (payload.get("version") != version or payload.get("model") != model_name
+            or payload.get("queries") != DOCUMENT_QUERY_TERMS):
+        return None
+    if version is None and time.time() - payload.get("built_at", 0) >= ttl_seconds:
+        return None
+    return payload["bundles"]
+
+
+def refresh_context_bundles(store, embedding_model, model_name, path=DEFAULT_BUNDLE_PATH):
+    """Recompute and persist the bundles for the store's current version, e.g. after ingestion."""
+    bundles = compute_bundles(store, embedding_model)
+    save_bundles(bundles, getattr(store, "version", None), model_name, path)
+    return bundles
+
+
+def get_context_bundles():
+    """Return the shared ``{doc_type: matches}`` bundles for the current index version.
+
+    Bundles persisted for the current version are loaded from disk. Bundles are
+    only computed and written from a store at the version on disk, so a
+    process still holding an older index never overwrites the file ingest.py
+    wrote for the new one.
+    """
+    config = get_config()
+    store = get_vector_store()
+    version = getattr(store, "version", None)
+    path = config.get("CONTEXT_BUNDLE_PATH", DEFAULT_BUNDLE_PATH)
+    ttl_seconds = float(config.get("CONTEXT_BUNDLE_TTL") or DEFAULT_TTL_SECONDS)
+    # Rebuild when the index version changes, when ingest.py rewrites the file, or (unversioned) on expiry.
+    extra_key = (version, file_stamp(path) if path else None,
+                 None if version is not None else int(time.time() // ttl_seconds))
+
+    def build(config):
+        model_name = config.get("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODEL
+        bundles = load_bundles(version, model_name, path, ttl_seconds) if path else None
+        if bundles is None:
+            current = index_version(config)
+            if current != version:
+                # The store reloads on its next lookup; serve the bundles written for the current version.
+                bundles = load_bundles(current, model_name, path, ttl_seconds) if path else None
+                if bundles is not None:
+                    return bundles
+            bundles = compute_bundles(store, get_embedding_model())
+            if path and current == version:
+                save_bundles(bundles, version, model_name, path)
+        return bundles
+
+    return get_resource(
+        "context_bundles",
+        build,
+        ("CONTEXT_BUNDLE_PATH", "CONTEXT_BUNDLE_TTL", "VECTOR_BACKEND", "EMBEDDING_MODEL", "EMBEDDING_BACKEND",
+         "EMBEDDING_ENGINE"),
+        extra_key=extra_key,
+    )
+
+
+def refinement_enabled(config=None):
+    config = config or get_config()
+    return (config.get("CONTEXT_REFINEMENT") or "").lower() in ("1", "true", "yes", "on")
+
+
+def key_clauses(text, limit=REFINE_CLAUSES):
+    """Pick up to `limit` obligation-bearing sentences from document text."""
+    clauses = []
+    for sentence in SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if len(sentence) >= MIN_CLAUSE_CHARS and CLAUSE_CUES.search(sentence):
+            clauses.append(sentence[:MAX_CLAUSE_CHARS])
+            if len(clauses) >= limit:
+                break
+    return clauses
+
+
+def clause_matches(text, store=None, embedding_model=None, top_k=REFINE_TOP_K):
+    """Return matches retrieved with the document's key clauses as queries."""
+    clauses = key_clauses(text)
+    if not clauses:
+        return []
+    store = store or get_vector_store()
+    embeddings = (embedding_model or get_embedding_model()).encode(clauses)
+    matches = []
+    for embedding in embeddings:
+        results = store.query(vector=list(map(float, embedding)), top_k=top_k, include_metadata=True)
+        matches.extend(plain_match(match) for match in results["matches"])
+    return matches
+
+
+def merge_matches(base, extra):
+    """Append matches from `extra` whose ids are not already in `base`."""
+    seen = {match["id"] for match in base}
+    merged = list(base)
+    for match in extra:
+        if match["id"] not in seen:
+            seen.add(match["id"])
+            merged.append(match)
+    return merged
@@ -0,0 +1,118 @@
+"""Local document type classifier for the Document Validator.
+
+The first pages of the PDF are scored against an embedded prototype of each
+template in DOCUMENT_TEMPLATES and against that template's phrases in
+DOCUMENT_KEYWORDS, matched as whole words. A type is only chosen locally when
+at least MIN_KEYWORD_HITS of its phrases occur, more than for any other type,
+so a merely similar document (a prenuptial agreement that mentions "divorce")
+is not given that template. Confident results skip the Gemini detection call;
+when the evidence is thin, the scores are close or the PDF has no extractable
+text the caller falls back to the LLM. Adding a template
+type only needs a template and its keywords in prompts.py.
+"""
+import re
+
+import numpy as np
+
+from prompts import DOCUMENT_KEYWORDS, DOCUMENT_TEMPLATES
+from resources import get_embedding_model, get_resource
+
+DEFAULT_PAGES = 2
+MAX_CHARS = 4000
+WINDOW_CHARS = 800
+MIN_TEXT_CHARS = 200
+
+SIMILARITY_WEIGHT = 0.5
+KEYWORD_SATURATION = 3  # keyword hits that count as full keyword evidence
+MIN_KEYWORD_HITS = 2  # distinct keyword phrases a type needs before it can be chosen without the LLM
+KEYWORD_MARGIN = 1  # ... and how many more than the runner-up type
+CONFIDENT_SCORE = 0.5
+CONFIDENT_MARGIN = 0.1
+GENERAL_MAX_SIMILARITY = 0.45
+
+# Whole-word, case-insensitive pattern per keyword phrase; "lease" must not match "release" or "please".
+KEYWORD_PATTERNS = {
+    doc_type: [re.compile(r"\b" + r"\s+".join(map(re.escape, phrase.split())) + r"\b", re.IGNORECASE)
+               for phrase in phrases]
+    for doc_type, phrases in DOCUMENT_KEYWORDS.items()
+}
+
+
+def extract_leading_text(path, pages=DEFAULT_PAGES, max_chars=MAX_CHARS):
+    """Return whitespace-normalised text from the first pages of a PDF ("" if none can be extracted)."""
+    from pypdf import PdfReader
+    try:
+        reader = PdfReader(path)
+        texts = [page.extract_text() or "" for page in reader.pages[:pages]]
+    except Exception as e:
+        print(f"Could not extract text from '{path}': {e}")
+        return ""
+    return " ".join(" ".join(texts).split())[:max_chars]
+
+
+def _windows(text, size=WINDOW_CHARS):
+    # The embedding model truncates long inputs, so long text is embedded in windows and averaged.
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _embed_text(model, text):
+    vectors = np.asarray(model.encode(_windows(text)), dtype=np.float32)
+    mean = vectors.mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return mean / norm if norm else mean
+
+
+def get_prototypes():
+    """Return ``{doc_type: unit vector}`` for every template, built once per embedding model."""
+    def build(config):
+        model = get_embedding_model()
+        return {
+            doc_type: _embed_text(model, " ".join(DOCUMENT_KEYWORDS.get(doc_type, [])) + " " + " ".join(template.split()))
+            for doc_type, template in DOCUMENT_TEMPLATES.items()
+        }
+
+    return get_resource("document_type_prototypes", build, ("EMBEDDING_MODEL", "EMBEDDING_BACKEND", "EMBEDDING_ENGINE"))
+
+
+def keyword_hits(text, doc_type):
+    return sum(1 for pattern in KEYWORD_PATTERNS.get(doc_type, []) if pattern.search(text))
+
+
+def score_text(text):
+    """Return ``{doc_type: {"similarity", "keywords", "score"}}`` for every template type."""
+    document = _embed_text(get_embedding_model(), text)
+    scores = {}
+    for doc_type, prototype in get_prototypes().items():
+        similarity = float(document @ prototype)
+        hits = keyword_hits(text, doc_type)
+        keyword_score = min(1.0, hits / KEYWORD_SATURATION)
+        scores[doc_type] = {
+            "similarity": similarity,
+            "keywords": hits,
+            "score": SIMILARITY_WEIGHT * similarity + (1 - SIMILARITY_WEIGHT) * keyword_score,
+        }
+    return scores
+
+
+def classify_text(text):
+    """Return ``(doc_type, confidence)``, with doc_type None when the text is not conclusive."""
+    if len(text) < MIN_TEXT_CHARS:
+        return None, 0.0
+    scores = score_text(text)
+    ranked = sorted(scores, key=lambda t: scores[t]["score"], reverse=True)
+    best = scores[ranked[0]]
+    runner_up = scores[ranked[1]]["score"] if len(ranked) > 1 else 0.0
+    other_hits = max((scores[t]["keywords"] for t in ranked[1:]), default=0)
+
+    if (best["keywords"] >= MIN_KEYWORD_HITS and best["keywords"] - other_hits >= KEYWORD_MARGIN
+            and best["score"] >= CONFIDENT_SCORE and best["score"] - runner_up >= CONFIDENT_MARGIN):
+        return ranked[0], best["score"]
+    # Nothing resembles any template: a document without a specific template.
+    if all(s["keywords"] == 0 and s["similarity"] < GENERAL_MAX_SIMILARITY for s in scores.values()):
+        return "general", 1.0 - max(s["similarity"] for s in scores.values())
+    return None, best["score"]
+
+
+def classify_document(path, pages=DEFAULT_PAGES):
+    """Classify a PDF from its first pages; see classify_text()."""
+    return classify_text(extract_leading_text(path, pages=pages))
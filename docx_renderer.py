@@ -0,0 +1,270 @@
+"""Render validator drafts to structured Word documents in memory.
+
+The draft used to go into one ``doc.add_paragraph`` and be saved to a fixed
+filename in the working directory, which sessions raced on. Drafts are now
+rendered straight to bytes, line by line, following the structure of the
+DOCUMENT_TEMPLATES they were drafted from:
+
+    title / headings      the first all-caps line uses "Title"; the template's
+                          all-caps lines and other short all-caps lines use
+                          "Heading 1"; captioned clauses ("1. RENT:") "Heading 2"
+    numbered clauses      "1. ...", "a) ..." and bullets get hanging indents
+    signature blocks      columns separated by runs of spaces ("LESSOR    LESSEE")
+                          become borderless tables; signature lines are kept together
+
+Rendered bytes are cached per (doc_type, draft) in a ``DOCX_CACHE_ENTRIES``
+LRU (default 64), so repeated downloads and reruns do not render again.
+
+Bulk mode renders many drafts in a process pool:
+    python docx_renderer.py drafts.jsonl out_dir [--processes N]
+where each line holds an "id", a "doc_type" and a "draft" (or a full
+validator "response", whose draft is parsed out).
+"""
+import io
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from docx import Document
+from docx.enum.style import WD_STYLE_TYPE
+from docx.shared import Inches, Pt
+
+from prompts import DOCUMENT_TEMPLATES
+from telemetry import span
+from resources import get_resource
+
+DEFAULT_CACHE_ENTRIES = 64
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+DOCX_FILENAMES = {
+    "divorce_petition": "mutual_consent_divorce_petition.docx",
+    "rental_agreement": "rental_agreement.docx",
+    "general": "legal_document.docx",
+}
+
+NUMBERED = re.compile(r"^(\d+(?:\.\d+)*[.)])\s+(.*)$")
+LETTERED = re.compile(r"^(\(?[a-z][.)])\s+(.*)$")
+BULLET = re.compile(r"^[-*•]\s+(.*)$")
+COLUMNS = re.compile(r"\s{3,}")
+SIGNATURE = re.compile(r"(\(signature\)|^signature\b|^advocate$|^solemnly declared|^on this\b|^witnesses?\b"
+                       r"|^name:|^address:)", re.IGNORECASE)
+BLANK = re.compile(r"^(?:\d+[.)]\s*)?_{3,}$")  # a signature or witness line left blank
+FORM_FIELD = re.compile(r"^[A-Z]+(?: [A-Z]+)?\s*:$")  # "NAME :", "AGE :"
+MAX_HEADING_WORDS = 10
+
+
+def docx_filename(doc_type):
+    return DOCX_FILENAMES.get(doc_type, "legal_document.docx")
+
+
+def _is_caps(text):
+    letters = [char for char in text if char.isalpha()]
+    return bool(letters) and all(char.isupper() for char in letters)
+
+
+def template_headings(doc_type):
+    """Return the all-caps lines of a document type's template, normalized for lookup."""
+    return {" ".join(line.split()).rstrip(":") for line in DOCUMENT_TEMPLATES.get(doc_type, "").splitlines()
+            if _is_caps(line) and not NUMBERED.match(line.strip())}
+
+
+def classify_line(line, headings):
+    """Return ``(kind, marker, text)`` for one draft line."""
+    stripped = line.strip()
+    normalized = " ".join(stripped.split()).rstrip(":")
+    cells = COLUMNS.split(stripped)
+    if len(cells) > 1 and any(SIGNATURE.search(cell) or BLANK.match(cell) or _is_caps(cell) for cell in cells):
+        return "columns", "", stripped
+    if SIGNATURE.search(stripped) or BLANK.match(stripped):
+        return "signature", "", stripped
+    if FORM_FIELD.match(stripped):
+        return "body", "", stripped
+    numbered = NUMBERED.match(stripped)
+    if numbered:
+        caption = numbered.group(2)
+        if _is_caps(caption) and len(caption.split()) <= MAX_HEADING_WORDS:
+            return "caption", numbered.group(1), caption
+        return "clause", numbered.group(1), caption
+    lettered = LETTERED.match(stripped)
+    if lettered:
+        return "subclause", lettered.group(1), lettered.group(2)
+    bullet = BULLET.match(stripped)
+    if bullet:
+        return "bullet", "", bullet.group(1)
+    if normalized in headings or (_is_caps(stripped) and len(stripped.split()) <= MAX_HEADING_WORDS):
+        return "heading", "", stripped
+    if line[:1].isspace():
+        return "continuation", "", stripped
+    return "body", "", stripped
+
+
+def _paragraph_style(document, name, left, hanging=0.0, space_before=0, keep_with_next=False):
+    style = document.styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+    style.base_style = document.styles["Normal"]
+    style.paragraph_format.left_indent = Inches(left)
+    style.paragraph_format.first_line_indent = Inches(-hanging) if hanging else None
+    style.paragraph_format.space_before = Pt(space_before)
+    style.paragraph_format.keep_with_next = keep_with_next
+    return style
+
+
+def _new_document():
+    document = Document()
+    _paragraph_style(document, "Clause", left=0.4, hanging=0.4, space_before=6)
+    _paragraph_style(document, "Clause Body", left=0.4)
+    _paragraph_style(document, "Sub Clause", left=0.8, hanging=0.4)
+    _paragraph_style(document, "Signature Line", left=0.0, keep_with_next=True)
+    return document
+
+
+def _add_columns(document, rows):
+    table = document.add_table(rows=0, cols=max(len(row) for row in rows))
+    for row in rows:
+        cells = table.add_row().cells
+        for cell, text in zip(cells, row):
+            cell.text = text
+            cell.paragraphs[0].style = document.styles["Signature Line"]
+
+
+def render_docx(draft, doc_type="general"):
+    """Render a draft to .docx bytes with Word styles for its headings, clauses and signature blocks."""
+    document = _new_document()
+    headings = template_headings(doc_type)
+    titled = False
+    columns = []
+    for line in draft.replace("\r\n", "\n").split("\n"):
+        if not line.strip():
+            if columns:
+                _add_columns(document, columns)
+                columns = []
+            continue
+        kind, marker, text = classify_line(line, headings)
+        if kind == "columns":
+            columns.append(COLUMNS.split(text))
+            continue
+        if columns:
+            _add_columns(document, columns)
+            columns = []
+        if kind == "heading":
+            document.add_paragraph(text, style="Heading 1" if titled else "Title")
+            titled = True
+        elif kind == "caption":
+            document.add_paragraph(f"{marker} {text}", style="Heading 2")
+        elif kind in ("clause", "subclause"):
+            paragraph = document.add_paragraph(style="Clause" if kind == "clause" else "Sub Clause")
+            paragraph.add_run(f"{marker}\t").bold = True
+            paragraph.add_run(text)
+        elif kind == "bullet":
+            document.add_paragraph(text, style="List Bullet")
+        elif kind == "continuation":
+            document.add_paragraph(text, style="Clause Body")
+        elif kind == "signature":
+            document.add_paragraph(text, style="Signature Line")
+        else:
+            document.add_paragraph(text)
+    if columns:
+        _add_columns(document, columns)
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+class RenderCache:
+    """LRU of rendered .docx bytes by draft hash."""
+
+    def __init__(self, max_entries=DEFAULT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def get_render_cache():
+    return get_resource(
+        "docx_renders",
+        lambda config: RenderCache(int(config.get("DOCX_CACHE_ENTRIES") or DEFAULT_CACHE_ENTRIES)),
+        ("DOCX_CACHE_ENTRIES",),
+    )
+
+
+def _draft_text(draft):
+    # Accept a DocumentAnalysis as well as plain draft text.
+    return getattr(draft, "draft", draft)
+
+
+def _cache_key(draft, doc_type):
+    return hashlib.sha256(f"{doc_type}\0{draft}".encode("utf-8")).hexdigest()
+
+
+def render_draft(draft, doc_type="general"):
+    """Return the .docx bytes for a draft (or DocumentAnalysis), rendering it once per distinct draft."""
+    draft = _draft_text(draft)
+    key = _cache_key(draft, doc_type)
+    cache = get_render_cache()
+    with span("docx_render", chars=len(draft)) as s:
+        data = cache.get(key)
+        s.set(cache="hit" if data is not None else "miss")
+        if data is None:
+            data = render_docx(draft, doc_type)
+            cache.put(key, data)
+    return data
+
+
+def render_many(items, processes=None):
+    """Render ``[(draft, doc_type), ...]`` in a process pool, returning the bytes in order."""
+    items = [(_draft_text(draft), doc_type) for draft, doc_type in items]
+    with span("docx_render_bulk", drafts=len(items)):
+        if len(items) <= 1:
+            return [render_docx(draft, doc_type) for draft, doc_type in items]
+        drafts, doc_types = zip(*items)
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            return list(pool.map(render_docx, drafts, doc_types, chunksize=4))
+
+
+def main(argv=None):
+    from analysis_result import parse_analysis
+    parser = argparse.ArgumentParser(description="Render validator drafts to Word documents in bulk.")
+    parser.add_argument("input", help="JSONL file with id, doc_type and draft (or response) fields")
+    parser.add_argument("output_dir", help="directory for the .docx files")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    records = []
+    with open(args.input, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if "draft" not in record:
+                    record["draft"] = parse_analysis(record.get("response", "")).draft
+                records.append(record)
+    os.makedirs(args.output_dir, exist_ok=True)
+    rendered = render_many([(record["draft"], record.get("doc_type", "general")) for record in records],
+                           args.processes)
+    for position, (record, data) in enumerate(zip(records, rendered)):
+        with open(os.path.join(args.output_dir, f"{record.get('id', position)}.docx"), "wb") as f:
+            f.write(data)
+    print(f"Rendered {len(rendered)} drafts to {args.output_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
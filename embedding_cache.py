@@ -0,0 +1,161 @@
+"""Bounded LRU cache of query embeddings.
+
+Users repeat the same questions, and a few fixed strings (the document-type
+retrieval queries) are embedded again and again. Vectors are cached by
+normalized text for one embedding model and engine, in a preallocated
+float16 (or float32) array with an LRU slot map, so the cache's memory is
+fixed. The most frequently used entries are persisted to ``path`` (an .npz
+file) and loaded back at startup together with the document-type queries.
+Ingestion does not go through the cache; chunk texts are embedded once.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_DTYPE = "float16"
+DEFAULT_CACHE_PATH = "embedding_cache.npz"
+DEFAULT_PERSIST_ENTRIES = 1000
+SAVE_EVERY = 50
+
+
+def normalize_text(text):
+    # MiniLM is uncased, so case and spacing differences embed identically.
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """LRU map from normalized text to an embedding row.
+
+    `model_key` names the model and engine the vectors came from; a persisted
+    file written for another model is ignored. Up to `persist_entries` of the
+    most used entries are written back every SAVE_EVERY new entries and at exit.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, dtype=DEFAULT_DTYPE, path=None, model_key=None,
+                 persist_entries=DEFAULT_PERSIST_ENTRIES):
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.model_key = model_key
+        self.persist_entries = persist_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._slots = OrderedDict()  # normalized text -> row, least recently used first
+        self._uses = {}  # normalized text -> lookups served, for choosing what to persist
+        self._vectors = None  # allocated on the first put, once the dimension is known
+        self._unsaved = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                if str(data["model_key"]) != str(self.model_key):
+                    return
+                texts, vectors, uses = list(data["texts"]), data["vectors"], data["uses"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable embedding cache '{self.path}': {e}")
+            return
+        # Least used first, so the most used entries are also the most recently used.
+        for position in np.argsort(uses, kind="stable")[-self.max_entries:]:
+            self._put(str(texts[position]), vectors[position])
+            self._uses[str(texts[position])] = int(uses[position])
+        self._unsaved = 0
+
+    def save(self):
+        """Persist the most used entries to `path`."""
+        if not self.path:
+            return
+        with self._lock:
+            texts = sorted(self._slots, key=lambda text: self._uses.get(text, 0), reverse=True)
+            texts = texts[:self.persist_entries]
+            if not texts:
+                return
+            vectors = self._vectors[[self._slots[text] for text in texts]]
+            uses = np.array([self._uses.get(text, 0) for text in texts], dtype=np.int64)
+            self._unsaved = 0
+        tmp_path = f"{self.path}.tmp"
+        with self._save_lock:
+            with open(tmp_path, "wb") as f:
+                np.savez(f, model_key=np.array(str(self.model_key)), texts=np.array(texts), vectors=vectors,
+                         uses=uses)
+            os.replace(tmp_path, self.path)
+
+    def _put(self, key, vector):
+        vector = np.asarray(vector)
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, vector.shape[-1]), dtype=self.dtype)
+        if key in self._slots:
+            row = self._slots[key]
+            self._slots.move_to_end(key)
+        elif len(self._slots) < self.max_entries:
+            row = len(self._slots)
+            self._slots[key] = row
+        else:
+            evicted, row = self._slots.popitem(last=False)
+            self._uses.pop(evicted, None)
+            self._slots[key] = row
+        self._vectors[row] = vector
+        self._unsaved += 1
+
+    def get(self, text):
+        """Return the cached float32 embedding for `text`, or None."""
+        key = normalize_text(text)
+        with self._lock:
+            row = self._slots.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            self._slots.move_to_end(key)
+            self._uses[key] = self._uses.get(key, 0) + 1
+            self.hits += 1
+            return self._vectors[row].astype(np.float32)
+
+    def put(self, text, vector):
+        with self._lock:
+            self._put(normalize_text(text), vector)
+            due = self._unsaved >= SAVE_EVERY
+        if due:
+            self.save()
+
+    def encode(self, texts, embedding_model):
+        """Embed a text or list of texts, encoding only the cache misses (in one batch).
+
+        Returns the embedding(s) and the number of texts that were not cached.
+        """
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        vectors = [self.get(text) for text in texts]
+        missed = sum(1 for vector in vectors if vector is None)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            encoded = embedding_model.encode(missing[0] if len(missing) == 1 else missing)
+            encoded = np.asarray(encoded, dtype=np.float32).reshape(len(missing), -1)
+            fresh = dict(zip(missing, encoded))
+            for text, vector in fresh.items():
+                self.put(text, vector)
+            vectors = [fresh[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return (vectors[0] if single else np.array(vectors, dtype=np.float32)), missed
+
+    def warm(self, texts, embedding_model):
+        """Make sure `texts` are cached, encoding the missing ones in one batch."""
+        with self._lock:
+            missing = [text for text in texts if normalize_text(text) not in self._slots]
+        if missing:
+            self.encode(missing, embedding_model)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def stats(self):
+        """Return hit/miss counters, the number of cached vectors and their memory in MB."""
+        with self._lock:
+            size = self._vectors.nbytes if self._vectors is not None else 0
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._slots),
+                    "megabytes": round(size / (1024 * 1024), 2)}
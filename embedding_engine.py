@@ -0,0 +1,166 @@
+"""CPU embedding engines behind ``resources.get_embedding_model()``.
+
+``EMBEDDING_ENGINE`` selects how the sentence-transformers model runs:
+
+    torch       full-precision PyTorch (default, the original behaviour)
+    quantized   PyTorch with its Linear layers dynamically quantized to int8
+    onnx        ONNX Runtime (pip install "sentence-transformers[onnx]"); set
+                ONNX_MODEL_FILE to a quantized export such as
+                onnx/model_qint8_avx512_vnni.onnx to use int8 weights
+
+``EMBEDDING_THREADS`` caps the intra-op threads of either runtime. Single-text
+``encode`` calls from concurrent sessions are coalesced by a micro-batcher into
+one forward pass: the first request waits up to ``EMBEDDING_BATCH_WAIT_MS``
+(default 2; 0 disables batching) for up to ``EMBEDDING_MAX_BATCH`` others.
+A backend that cannot be loaded falls back to torch with a message.
+
+embedding_parity.py checks an engine's vectors against the torch model's.
+"""
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from telemetry import span
+
+ENGINES = ("torch", "quantized", "onnx")
+DEFAULT_BATCH_WAIT_MS = 2.0
+DEFAULT_MAX_BATCH = 32
+
+
+def load_model(model_name, engine="torch", threads=None, onnx_file=None):
+    """Load a SentenceTransformer on CPU with the given engine."""
+    from sentence_transformers import SentenceTransformer
+    if engine == "onnx":
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+        if onnx_file:
+            model_kwargs["file_name"] = onnx_file
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    if engine == "quantized":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+class MicroBatcher:
+    """Coalesce single-text encode calls from concurrent threads into one batch."""
+
+    def __init__(self, encode_batch, max_batch=DEFAULT_MAX_BATCH, max_wait=DEFAULT_BATCH_WAIT_MS / 1000):
+        self._encode_batch = encode_batch
+        self._queue = queue.Queue()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._closed = False
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="embedding-batcher", daemon=True).start()
+
+    def encode(self, text):
+        future = Future()
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._queue.put((text, future))
+        if closed:
+            return self._encode_batch([text])[0]
+        return future.result()
+
+    def close(self):
+        """Stop the batching thread once the texts already queued are encoded; later calls encode directly."""
+        with self._lock:
+            self._closed = True
+            self._queue.put(None)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stop = None in batch
+            batch = [item for item in batch if item is not None]
+            if batch:
+                self._encode(batch)
+            if stop:
+                return
+
+    def _encode(self, batch):
+        try:
+            with span("embedding_batch", texts=len(batch)):
+                vectors = self._encode_batch([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+
+class EmbeddingEngine:
+    """SentenceTransformer-compatible ``encode`` over a loaded model, micro-batching single texts."""
+
+    def __init__(self, model, name="torch", max_batch=DEFAULT_MAX_BATCH, batch_wait_ms=DEFAULT_BATCH_WAIT_MS):
+        self.model = model
+        self.name = name
+        self.batcher = MicroBatcher(model.encode, max_batch, batch_wait_ms / 1000) if batch_wait_ms > 0 else None
+
+    def close(self):
+        """Stop the micro-batcher thread, e.g. when a config change replaces this engine."""
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def encode(self, sentences, **kwargs):
+        # Calls with extra options bypass the batcher so every text in a batch is encoded alike.
+        if isinstance(sentences, str) and self.batcher is not None and not kwargs:
+            return self.batcher.encode(sentences)
+        return self.model.encode(sentences, **kwargs)
+
+    def __getattr__(self, name):
+        # Anything else (tokenizer, get_sentence_embedding_dimension, ...) comes from the model.
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+def build_embedding_engine(config, model_name):
+    """Build the engine selected by EMBEDDING_ENGINE for `model_name`."""
+    engine = (config.get("EMBEDDING_ENGINE") or "torch").lower()
+    if engine not in ENGINES:
+        print(f"Unknown EMBEDDING_ENGINE '{engine}', using torch")
+        engine = "torch"
+    threads = int(config.get("EMBEDDING_THREADS") or 0) or None
+    try:
+        model = load_model(model_name, engine, threads, config.get("ONNX_MODEL_FILE"))
+    except Exception as e:
+        if engine == "torch":
+            raise
+        print(f"Embedding engine '{engine}' unavailable, using torch instead: {e}")
+        engine = "torch"
+        model = load_model(model_name, engine, threads)
+    return wrap_model(model, config, engine)
+
+
+def wrap_model(model, config, name="torch"):
+    """Wrap an already loaded model (or stand-in) with the configured micro-batcher."""
+    wait_ms = config.get("EMBEDDING_BATCH_WAIT_MS")
+    return EmbeddingEngine(
+        model,
+        name,
+        max_batch=int(config.get("EMBEDDING_MAX_BATCH") or DEFAULT_MAX_BATCH),
+        batch_wait_ms=float(wait_ms) if wait_ms not in (None, "") else DEFAULT_BATCH_WAIT_MS,
+    )
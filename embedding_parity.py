@@ -0,0 +1,190 @@
+"""Check an embedding engine against the full-precision model before serving with it.
+
+Usage:
+    python embedding_parity.py [--engine quantized|onnx] [--onnx-file onnx/model_qint8_avx512_vnni.onnx]
+                               [--threads N] [--min-cosine 0.99] [--store] [--sessions 8] [--json out.json]
+
+Encodes the benchmark queries, the document-type retrieval queries and chunk
+texts from the lexical index with the torch model and with the candidate
+engine, then reports the cosine similarity of each pair of vectors, the load
+time and RSS of each model, single-query latency and the throughput of
+concurrent single-query calls for both engines, with and without the
+micro-batcher, so the engine and the batching are compared separately. Each
+model is also loaded once in its own subprocess for the load figures, so one
+engine's load does not count the other's libraries or allocator growth. With --store it also
+compares the top-k ids each engine retrieves from the configured vector store,
+which was built with the torch model. Exits with status 1 when any cosine
+similarity is below --min-cosine.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmark import percentile
+from embedding_engine import DEFAULT_BATCH_WAIT_MS, EmbeddingEngine, load_model
+from lexical_index import DEFAULT_INDEX_PATH, LexicalIndex
+from prompt_tokens import QUERY_SET
+from prompts import DOCUMENT_QUERY_TERMS
+from resources import DEFAULT_EMBEDDING_MODEL, get_config, get_vector_store
+
+DEFAULT_MIN_COSINE = 0.99
+DEFAULT_CHUNK_TEXTS = 200
+
+
+def current_rss_mb():
+    """Return the current resident set size in MB (Linux), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    import resource
+    return round(pages * resource.getpagesize() / (1024 * 1024), 1)
+
+
+def timed_load(model_name, engine, threads=None, onnx_file=None):
+    """Load a model, returning it with the seconds and RSS megabytes the load took."""
+    rss_before = current_rss_mb()
+    started = time.perf_counter()
+    model = load_model(model_name, engine, threads, onnx_file)
+    elapsed = time.perf_counter() - started
+    rss_after = current_rss_mb()
+    rss = round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None
+    return model, round(elapsed, 2), rss
+
+
+def isolated_load(model_name, engine, threads=None, onnx_file=None):
+    """Run timed_load in a fresh interpreter and return ``(seconds, rss_mb)``; both None if it failed."""
+    command = [sys.executable, os.path.abspath(__file__), "--load-only", engine, "--model", model_name]
+    if threads:
+        command += ["--threads", str(threads)]
+    if onnx_file:
+        command += ["--onnx-file", onnx_file]
+    finished = subprocess.run(command, capture_output=True, text=True)
+    try:
+        result = json.loads(finished.stdout.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        print(f"Loading {engine} in a subprocess failed: {finished.stderr.strip()[-500:]}")
+        return None, None
+    return result["seconds"], result["rss_mb"]
+
+
+def parity_texts(limit=DEFAULT_CHUNK_TEXTS):
+    texts = list(QUERY_SET) + list(DOCUMENT_QUERY_TERMS.values())
+    index = LexicalIndex.load(get_config().get("LEXICAL_INDEX_PATH", DEFAULT_INDEX_PATH))
+    texts += [metadata.get("text", "") for metadata in list(index.documents.values())[:limit]]
+    return [text for text in texts if text.strip()]
+
+
+def cosine_similarities(reference, candidate):
+    reference = np.asarray(reference, dtype=np.float32)
+    candidate = np.asarray(candidate, dtype=np.float32)
+    norms = np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1)
+    return (reference * candidate).sum(axis=1) / np.maximum(norms, 1e-12)
+
+
+def single_query_latency(model, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        model.encode(query)
+        latencies.append(time.perf_counter() - started)
+    return {"p50_ms": round(percentile(latencies, 50) * 1000, 2), "p95_ms": round(percentile(latencies, 95) * 1000, 2)}
+
+
+def concurrent_throughput(engine, queries, sessions):
+    """Queries per second when `sessions` threads issue single-query encodes at once."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        list(pool.map(engine.encode, queries))
+    return round(len(queries) / (time.perf_counter() - started), 1)
+
+
+def topk_overlap(reference_vectors, candidate_vectors, top_k):
+    """Mean share of the reference top-k ids that the candidate vectors also retrieve."""
+    store = get_vector_store()
+    overlaps = []
+    for reference, candidate in zip(reference_vectors, candidate_vectors):
+        expected = {m["id"] for m in store.query(vector=list(map(float, reference)), top_k=top_k)["matches"]}
+        found = {m["id"] for m in store.query(vector=list(map(float, candidate)), top_k=top_k)["matches"]}
+        overlaps.append(len(expected & found) / max(len(expected), 1))
+    return round(sum(overlaps) / len(overlaps), 3) if overlaps else None
+
+
+def main(argv=None):
+    config = get_config()
+    parser = argparse.ArgumentParser(description="Compare an embedding engine with the full-precision model.")
+    parser.add_argument("--engine", default=config.get("EMBEDDING_ENGINE") or "quantized",
+                        choices=["torch", "quantized", "onnx"])
+    parser.add_argument("--model", default=config.get("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--onnx-file", default=config.get("ONNX_MODEL_FILE"), help="ONNX file inside the model repo")
+    parser.add_argument("--threads", type=int, default=int(config.get("EMBEDDING_THREADS") or 0) or None)
+    parser.add_argument("--min-cosine", type=float, default=DEFAULT_MIN_COSINE)
+    parser.add_argument("--chunks", type=int, default=DEFAULT_CHUNK_TEXTS, help="chunk texts taken from the index")
+    parser.add_argument("--sessions", type=int, default=8, help="threads for the micro-batching throughput test")
+    parser.add_argument("--store", action="store_true", help="compare top-k retrieval from the vector store")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--load-only", metavar="ENGINE", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    model_name = args.model
+    if args.load_only:
+        # Child of isolated_load: load one model in this fresh process and report the cost.
+        _, seconds, rss = timed_load(model_name, args.load_only, args.threads, args.onnx_file)
+        print(json.dumps({"seconds": seconds, "rss_mb": rss}))
+        return 0
+
+    texts = parity_texts(args.chunks)
+    loads = {"torch": isolated_load(model_name, "torch", args.threads),
+             args.engine: isolated_load(model_name, args.engine, args.threads, args.onnx_file)}
+    candidate = load_model(model_name, args.engine, args.threads, args.onnx_file)
+    reference = load_model(model_name, "torch", args.threads)
+
+    reference_vectors = reference.encode(texts)
+    candidate_vectors = candidate.encode(texts)
+    similarities = cosine_similarities(reference_vectors, candidate_vectors)
+
+    queries = [text for text in texts if len(text) < 300] * 4
+    report = {
+        "engine": args.engine,
+        "model": model_name,
+        "texts": len(texts),
+        "cosine_min": round(float(similarities.min()), 5),
+        "cosine_mean": round(float(similarities.mean()), 5),
+        "load_seconds": {engine: seconds for engine, (seconds, _) in loads.items()},
+        "load_rss_mb": {engine: rss for engine, (_, rss) in loads.items()},
+        "single_query": {"torch": single_query_latency(reference, queries),
+                         args.engine: single_query_latency(candidate, queries)},
+        "concurrent_qps": {
+            f"{engine} {mode}": concurrent_throughput(EmbeddingEngine(model, engine, batch_wait_ms=wait), queries,
+                                                      args.sessions)
+            for engine, model in (("torch", reference), (args.engine, candidate))
+            for mode, wait in (("unbatched", 0), ("micro-batched", DEFAULT_BATCH_WAIT_MS))
+        },
+    }
+    if args.store:
+        query_count = len(QUERY_SET) + len(DOCUMENT_QUERY_TERMS)
+        report[f"top{args.top_k}_overlap"] = topk_overlap(reference_vectors[:query_count],
+                                                          candidate_vectors[:query_count], args.top_k)
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if report["cosine_min"] < args.min_cosine:
+        worst = texts[int(similarities.argmin())]
+        print(f"FAIL: cosine {report['cosine_min']} < {args.min_cosine} for: {worst[:80]!r}")
+        return 1
+    print(f"OK: every vector within cosine {args.min_cosine} of the torch model")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
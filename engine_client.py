@@ -0,0 +1,144 @@
+"""Client for the engine service (engine_service.py), used by the Streamlit app.
+
+The app only renders; every query and validation goes to the service at
+``ENGINE_URL``. When ENGINE_URL is not set the service is started inside the
+app's own process on a free local port, so a single ``streamlit run`` still
+works. The client itself uses only the standard library and analysis_result.
+"""
+import json
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from analysis_result import DocumentAnalysis
+from resources import get_resource
+
+DEFAULT_TIMEOUT = 600
+
+
+class EngineError(RuntimeError):
+    """Raised for an error response from the engine service; `status` holds the HTTP status."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class EngineClient:
+    """Calls the engine service over HTTP; streams are read line by line as they arrive."""
+
+    def __init__(self, url, timeout=DEFAULT_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _open(self, path, payload=None, data=None, headers=None, method=None):
+        headers = dict(headers or {})
+        if payload is not None:
+            data = json.dumps(payload).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        request = Request(f"{self.url}{path}", data=data, headers=headers, method=method)
+        try:
+            return urlopen(request, timeout=self.timeout)
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error") or e.reason
+            except ValueError:
+                message = e.reason
+            raise EngineError(message, e.code) from None
+
+    def _json(self, path, payload=None, **kwargs):
+        with self._open(path, payload, **kwargs) as response:
+            return json.loads(response.read())
+
+    def _lines(self, response):
+        with response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+    def health(self):
+        return self._json("/health").get("ok", False)
+
+    def stats(self):
+        return self._json("/stats")
+
+    def retrieve(self, query, top_k=10):
+        return self._json("/retrieve", {"query": query, "top_k": top_k})["matches"]
+
+    def answer_stream(self, query):
+        """Return ``(iterator of answer text, from_cache)``; the request is shared with identical ones in flight."""
+        lines = self._lines(self._open("/query", {"query": query}))
+        first = next(lines, {})
+        if "error" in first:
+            raise EngineError(first["error"])
+
+        def chunks():
+            # Closing this early (a Streamlit rerun) closes the connection, and the service stops
+            # the computation once no request is following it.
+            try:
+                for line in lines:
+                    if "text" in line:
+                        yield line["text"]
+                    elif "error" in line:
+                        raise EngineError(line["error"])
+            finally:
+                lines.close()
+
+        return chunks(), first.get("from_cache", False)
+
+    def submit_validation(self, session_id, data, name):
+        """Upload a PDF for validation and return the job's progress; raises EngineError(status=429) when busy."""
+        headers = {"Content-Type": "application/pdf", "X-Session-Id": session_id, "X-Filename": quote(name)}
+        return self._json("/validate", data=bytes(data), headers=headers)["job"]
+
+    def job(self, job_id):
+        """Return a job's progress, or None if the service does not know it."""
+        try:
+            return self._json(f"/jobs/{quote(job_id)}")["job"]
+        except EngineError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def follow_job(self, job_id, on_progress=None):
+        """Yield the job's response text as it streams in, calling ``on_progress(progress)`` on updates."""
+        for line in self._lines(self._open(f"/jobs/{quote(job_id)}/events")):
+            if "text" in line:
+                yield line["text"]
+            elif "progress" in line and on_progress is not None:
+                on_progress(line["progress"])
+            elif "done" in line:
+                if on_progress is not None:
+                    on_progress(line["done"])
+                return
+
+    def job_result(self, job_id):
+        """Return ``(response text, DocumentAnalysis)`` for a finished job, or None."""
+        try:
+            payload = self._json(f"/jobs/{quote(job_id)}/result")
+        except EngineError as e:
+            if e.status == 404:
+                return None
+            raise
+        return payload["text"], DocumentAnalysis.from_dict(payload["analysis"])
+
+    def job_draft(self, job_id):
+        """Return the rendered .docx bytes of a finished job."""
+        with self._open(f"/jobs/{quote(job_id)}/draft") as response:
+            return response.read()
+
+    def cancel_job(self, job_id):
+        self._json(f"/jobs/{quote(job_id)}", method="DELETE")
+
+
+def get_engine_client():
+    """Return the client for ENGINE_URL, starting an in-process service when it is not set."""
+    def build(config):
+        url = config.get("ENGINE_URL")
+        if not url:
+            from engine_service import serve_engine
+            host, port = serve_engine(port=0).server_address[:2]
+            url = f"http://{host}:{port}"
+        return EngineClient(url, timeout=float(config.get("ENGINE_TIMEOUT") or DEFAULT_TIMEOUT))
+
+    return get_resource("engine_client", build, ("ENGINE_URL", "ENGINE_TIMEOUT"))
@@ -0,0 +1,446 @@
+"""Headless HTTP service for the query and validation engine.
+
+The Streamlit script used to call the engine in-process, so the engine could
+only scale with the UI and nothing else could use it. This module serves the
+same paths over HTTP with the standard library's ThreadingHTTPServer:
+
+    python engine_service.py [--host 127.0.0.1] [--port 8765]
+
+The process keeps one set of upstream clients (Gemini, the vector store, the
+embedding model) in the resource registry, shared by every request. Requests
+are JSON; streams are newline-delimited JSON objects.
+
+    GET    /health                 {"ok": true}
+    GET    /stats                  load timings, cache, result store, coalescing and stage statistics
+    GET    /metrics                Prometheus text (the telemetry metrics)
+    POST   /retrieve               {"query", "top_k"} -> {"matches": [...]}
+    POST   /query                  {"query"} -> stream of {"from_cache"}, {"text"}..., then {"done"} or {"error"}
+    POST   /validate               PDF body with X-Session-Id and X-Filename headers -> {"job": progress};
+                                   429 when admission control rejects it
+    GET    /jobs/<id>              {"job": progress}
+    GET    /jobs/<id>/events       stream of {"progress"} and {"text"} until the job ends, then {"done": progress}
+    GET    /jobs/<id>/result       {"text", "doc_type", "analysis"} of a finished job
+    GET    /jobs/<id>/draft        the rendered .docx
+    DELETE /jobs/<id>              cancel the job
+
+Identical concurrent requests share one in-flight computation: /query by
+normalized query text and /retrieve by normalized query and top_k. A request
+that arrives while the same one is running replays the chunks produced so far
+and follows the rest; the computation is cancelled only when every reader has
+disconnected. A session's repeated validations of the same PDF content share
+one job (see validation_jobs); other sessions get their own.
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from resources import get_answer_cache, get_config, get_embedding_cache, get_resource, load_timings
+from telemetry import prometheus_text, serve_metrics, stage_summary
+from embedding_cache import normalize_text
+from vector_store import plain_match
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_UPLOAD_MB = 50
+UPLOAD_BLOCK_BYTES = 1024 * 1024  # uploads are copied to disk in blocks of this size
+
+_server = None  # the running engine server, shut down when a config change rebuilds it
+
+
+class SharedStream:
+    """One in-flight streamed computation that any number of readers replay and follow."""
+
+    def __init__(self):
+        self.info = None
+        self.chunks = []
+        self.started = False
+        self.done = False
+        self.error = None
+        self.readers = 0
+        self.closed = False  # no new readers once the computation has ended or been cancelled
+        self.future = None
+        self._changed = threading.Condition()
+
+    def _update(self, chunk=None, **fields):
+        with self._changed:
+            if chunk is not None:
+                self.chunks.append(chunk)
+            for name, value in fields.items():
+                setattr(self, name, value)
+            if self.done:
+                self.closed = True
+            self._changed.notify_all()
+
+    def join(self):
+        """Register a reader; False once the computation has finished or been cancelled."""
+        with self._changed:
+            if self.closed:
+                return False
+            self.readers += 1
+            return True
+
+    def leave(self):
+        """Unregister a reader. When the last one leaves early the computation is cancelled."""
+        with self._changed:
+            self.readers -= 1
+            abandoned = self.readers == 0 and not self.done
+            if abandoned:
+                self.closed = True
+        if abandoned and self.future is not None:
+            self.future.cancel()
+
+    def wait_info(self):
+        """Block until the computation has started streaming (or ended), and return its info."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.started or self.done)
+            if self.error and not self.started:
+                raise RuntimeError(self.error)
+            return self.info
+
+    def follow(self):
+        """Yield every chunk from the first one on, until the computation ends."""
+        position = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: len(self.chunks) > position or self.done)
+                new, done, error = self.chunks[position:], self.done, self.error
+            position += len(new)
+            yield from new
+            if done:
+                if error:
+                    raise RuntimeError(error)
+                return
+
+
+class Coalescer:
+    """Runs at most one computation per key on the shared event loop; later callers join it."""
+
+    def __init__(self):
+        self.started = 0
+        self.joined = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _forget(self, key, shared):
+        with self._lock:
+            if self._inflight.get(key) is shared:
+                del self._inflight[key]
+
+    def stream(self, key, start):
+        """Return ``(SharedStream, joined)`` for `key`; ``start()`` returns ``(async iterator, info)``.
+
+        The caller is registered as a reader and must call ``leave()`` when done. A stream
+        that has finished or been cancelled is never joined; a fresh computation starts instead.
+        """
+        import asyncio
+        from async_engine import submit
+
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is not None and shared.join():
+                self.joined += 1
+                return shared, True
+            shared = self._inflight[key] = SharedStream()
+            shared.join()
+            self.started += 1
+
+        async def pump():
+            try:
+                chunks, info = await start()
+                shared._update(info=info, started=True)
+                async for chunk in chunks:
+                    shared._update(chunk)
+                shared._update(done=True)
+            except asyncio.CancelledError:
+                shared._update(done=True, error="cancelled")
+                raise
+            except Exception as e:
+                print(f"Shared request {key!r} failed: {e}")
+                shared._update(done=True, error=f"{type(e).__name__}: {e}")
+            finally:
+                self._forget(key, shared)
+
+        shared.future = submit(pump())
+        return shared, False
+
+    def call(self, key, start):
+        """Return ``(concurrent.futures.Future, joined)`` for the coroutine ``start()``, shared per `key`."""
+        from async_engine import submit
+
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.joined += 1
+                return future, True
+            future = self._inflight[key] = submit(start())
+            self.started += 1
+        future.add_done_callback(lambda done: self._forget(key, done))
+        return future, False
+
+    def stats(self):
+        with self._lock:
+            return {"started": self.started, "joined": self.joined, "in_flight": len(self._inflight)}
+
+
+def get_coalescer():
+    return get_resource("request_coalescer", lambda config: Coalescer())
+
+
+def engine_stats():
+    """Return the statistics the app shows in its sidebar."""
+    from result_store import get_result_store
+    embedding_cache = get_embedding_cache()
+    result_store = get_result_store()
+    return {
+        "load_timings": load_timings(),
+        "answer_cache": get_answer_cache().stats(),
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "result_store": result_store.stats() if result_store is not None else None,
+        "coalescing": get_coalescer().stats(),
+        "stages": stage_summary(),
+    }
+
+
+class EngineHandler(BaseHTTPRequestHandler):
+    """Routes the endpoints listed in the module docstring."""
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self):
+        # HTTP/1.0 without a Content-Length: the stream ends when the connection closes.
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+    def _send_line(self, payload):
+        self.wfile.write(json.dumps(payload).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _read_json(self):
+        try:
+            return json.loads(self._read_body() or b"{}")
+        except ValueError:
+            return None
+
+    def _route(self):
+        parts = [unquote(part) for part in self.path.split("?")[0].strip("/").split("/")]
+        return parts + [""] * (3 - len(parts))
+
+    def do_GET(self):
+        section, job_id, action = self._route()[:3]
+        if section == "health":
+            self._send_json({"ok": True})
+        elif section == "stats":
+            self._send_json(engine_stats())
+        elif section == "metrics":
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif section == "jobs" and job_id:
+            self._get_job(job_id, action)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        section = self._route()[0]
+        if section == "query":
+            self._query()
+        elif section == "retrieve":
+            self._retrieve()
+        elif section == "validate":
+            self._validate()
+        else:
+            self.send_error(404)
+
+    def do_DELETE(self):
+        section, job_id = self._route()[:2]
+        if section != "jobs" or not job_id:
+            self.send_error(404)
+            return
+        from validation_jobs import get_job_manager
+        get_job_manager().cancel(job_id)
+        self._send_json({"cancelled": job_id})
+
+    def _query(self):
+        from async_engine import answer_query_stream_async
+        query = (self._read_json() or {}).get("query", "").strip()
+        if not query:
+            self._send_json({"error": "query is required"}, 400)
+            return
+        shared, joined = get_coalescer().stream(f"query:{normalize_text(query)}", lambda: answer_query_stream_async(query))
+        try:
+            try:
+                from_cache = shared.wait_info()
+            except RuntimeError as e:
+                self._send_json({"error": str(e)}, 502)
+                return
+            self._start_stream()
+            self._send_line({"from_cache": bool(from_cache), "shared": joined})
+            for chunk in shared.follow():
+                self._send_line({"text": chunk})
+            self._send_line({"done": True})
+        except RuntimeError as e:
+            self._send_line({"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client went away; leaving may cancel the computation
+        finally:
+            shared.leave()
+
+    def _retrieve(self):
+        from async_engine import retrieve_documents_async
+        request = self._read_json() or {}
+        query = request.get("query", "").strip()
+        if not query:
+            self._send_json({"error": "query is required"}, 400)
+            return
+        top_k = int(request.get("top_k") or 10)
+        future, joined = get_coalescer().call(f"retrieve:{top_k}:{normalize_text(query)}",
+                                              lambda: retrieve_documents_async(query, top_k))
+        try:
+            matches = future.result()
+        except Exception as e:
+            self._send_json({"error": f"{type(e).__name__}: {e}"}, 502)
+            return
+        self._send_json({"matches": [plain_match(match) for match in matches], "shared": joined})
+
+    def _validate(self):
+        from validation_jobs import JobRejected, get_job_manager
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            self._send_json({"error": "a PDF body is required"}, 400)
+            return
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            self._send_json({"error": f"uploads are limited to {MAX_UPLOAD_MB} MB"}, 413)
+            return
+        session_id = self.headers.get("X-Session-Id") or self.client_address[0]
+        name = unquote(self.headers.get("X-Filename") or "document.pdf")
+        # The job manager copies the document into the job's directory.
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as upload:
+            remaining = length
+            while remaining:
+                block = self.rfile.read(min(remaining, UPLOAD_BLOCK_BYTES))
+                if not block:
+                    self._send_json({"error": "the upload ended before Content-Length bytes"}, 400)
+                    return
+                upload.write(block)
+                remaining -= len(block)
+            upload.flush()
+            try:
+                job = get_job_manager().submit(session_id, upload.name, name)
+            except JobRejected as e:
+                self._send_json({"error": str(e)}, 429)
+                return
+        self._send_json({"job": job.progress()})
+
+    def _get_job(self, job_id, action):
+        from validation_jobs import follow_job, get_job_manager
+        job = get_job_manager().get(job_id)
+        if job is None:
+            self._send_json({"error": f"unknown job {job_id}"}, 404)
+        elif not action:
+            self._send_json({"job": job.progress()})
+        elif action == "events":
+            self._start_stream()
+            try:
+                for text in follow_job(job, lambda progress: self._send_line({"progress": progress}), interval=0.5):
+                    self._send_line({"text": text})
+                self._send_line({"done": job.progress()})
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the job keeps running; the client can reattach
+        elif action == "result":
+            result = job.result()
+            if result is None:
+                self._send_json({"error": f"job {job_id} has no result ({job.status})"}, 404)
+                return
+            text, analysis = result
+            self._send_json({"text": text, "doc_type": job.doc_type, "analysis": analysis.to_dict()})
+        elif action == "draft" and os.path.exists(job.docx_path):
+            from docx_renderer import DOCX_MIME_TYPE, docx_filename
+            with open(job.docx_path, "rb") as f:
+                body = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", DOCX_MIME_TYPE)
+            self.send_header("Content-Disposition", f'attachment; filename="{docx_filename(job.doc_type)}"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def warm_engine():
+    """Load the shared clients and caches before the first request arrives."""
+    from legal_engine import check_config
+    from context_bundles import get_context_bundles
+    check_config()
+    get_answer_cache()
+    get_embedding_cache()
+    get_context_bundles()
+    serve_metrics()
+
+
+def serve_engine(host=None, port=None):
+    """Start the engine service in a background thread once per process and return the server.
+
+    Port 0 picks a free port; ``server.server_address`` has the one in use.
+    A change to ENGINE_HOST or ENGINE_PORT stops the previous server and
+    starts one on the new address.
+    """
+    def build(config):
+        global _server
+        warm_engine()
+        if _server is not None:
+            _server.shutdown()
+            _server.server_close()
+            _server = None
+        server = ThreadingHTTPServer((host or config.get("ENGINE_HOST") or DEFAULT_HOST,
+                                      int(port if port is not None else config.get("ENGINE_PORT") or DEFAULT_PORT)),
+                                     EngineHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="engine-server", daemon=True).start()
+        print(f"Serving the legal engine on http://{server.server_address[0]}:{server.server_address[1]}")
+        _server = server
+        return server
+
+    return get_resource("engine_server", build, ("ENGINE_HOST", "ENGINE_PORT"), extra_key=f"{host}:{port}")
+
+
+def main(argv=None):
+    config = get_config()
+    parser = argparse.ArgumentParser(description="Serve the legal query and validation engine over HTTP.")
+    parser.add_argument("--host", default=config.get("ENGINE_HOST") or DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=int(config.get("ENGINE_PORT") or DEFAULT_PORT))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    server = serve_engine(args.host, args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
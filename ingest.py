@@ -0,0 +1,275 @@
+"""Build or refresh the BNS vector index from statute PDFs and DOCX files.
+
+Usage:
+    python ingest.py bns.pdf [more.pdf docs_dir/ ...] [--batch-size 64] [--full] [--root .]
+
+Documents are streamed page by page (PDF) or paragraph by paragraph (DOCX),
+split into section-aware chunks, encoded in batches with the shared embedding
+model and upserted into the vector store selected by VECTOR_BACKEND. A state
+file records a content hash per chunk, so a re-run only embeds and upserts
+sections that are new or changed, and deletes chunks that disappeared. Files
+are identified by their path relative to the ingest root (--root, default the
+working directory), so two files with the same name in different directories
+keep separate state and chunk ids. The
+local store is written once at the end of the run (see LocalVectorStore.batch),
+and the state file only after that write, so an interrupted run re-embeds what
+was not written. The BM25 lexical index used for hybrid retrieval is rebuilt
+from the same chunks.
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from contextlib import nullcontext
+
+DEFAULT_STATE_FILE = "ingest_state.json"
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_MAX_CHARS = 1000
+DEFAULT_OVERLAP_CHARS = 150
+SUPPORTED_SUFFIXES = (".pdf", ".docx")
+
+# "CHAPTER XVII" style headings give the chapter a section belongs to.
+CHAPTER_PATTERN = re.compile(r"^\s*CHAPTER\s+([IVXLC]+)\b.*$", re.IGNORECASE)
+# "303. (1) Whoever ..." or "Section 303. ..." starts a new section.
+SECTION_PATTERN = re.compile(r"^\s*(?:Section\s+)?(\d{1,3}[A-Z]?)\.\s+(?=\S)", re.IGNORECASE)
+SENTENCE_END = re.compile(r"(?<=[.;:])\s+")
+
+
+def iter_document_lines(path):
+    """Yield text lines from a PDF or DOCX file without loading it all at once."""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".pdf":
+        from pypdf import PdfReader
+        reader = PdfReader(path)
+        for page in reader.pages:
+            try:
+                text = page.extract_text(extraction_mode="layout")
+            except TypeError:
+                text = page.extract_text()
+            yield from (text or "").splitlines()
+    elif suffix == ".docx":
+        from docx import Document
+        for paragraph in Document(path).paragraphs:
+            yield from paragraph.text.splitlines()
+    else:
+        raise ValueError(f"Unsupported file type '{suffix}'. Expected one of {SUPPORTED_SUFFIXES}.")
+
+
+def iter_sections(lines):
+    """Group lines into (chapter, section, text) tuples using statute headings."""
+    chapter, section, buffer = None, None, []
+    for line in lines:
+        chapter_match = CHAPTER_PATTERN.match(line)
+        section_match = SECTION_PATTERN.match(line)
+        if chapter_match or section_match:
+            text = " ".join(buffer).strip()
+            if text:
+                yield chapter, section, text
+            buffer = []
+            if chapter_match:
+                chapter = chapter_match.group(1).upper()
+                section = None
+                continue
+            section = section_match.group(1)
+        stripped = re.sub(r"\s+", " ", line).strip()
+        if stripped:
+            buffer.append(stripped)
+    text = " ".join(buffer).strip()
+    if text:
+        yield chapter, section, text
+
+
+def split_text(text, max_chars=DEFAULT_MAX_CHARS, overlap_chars=DEFAULT_OVERLAP_CHARS):
+    """Split text into pieces of at most `max_chars`, breaking on sentence ends."""
+    if len(text) <= max_chars:
+        return [text]
+    pieces, current = [], ""
+    for sentence in SENTENCE_END.split(text):
+        while len(sentence) > max_chars:
+            head, sentence = sentence[:max_chars], sentence[max_chars:]
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(head)
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            pieces.append(current)
+            # Carry the tail of the previous piece so clauses spanning a cut stay searchable.
+            current = current[-overlap_chars:] if overlap_chars else ""
+        current = f"{current} {sentence}".strip()
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_hash(text):
+    """Return a stable content hash for a chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def source_key(path, root="."):
+    """Identify a document by its path relative to the ingest root, e.g. ``acts/bns.pdf``."""
+    return Path(os.path.relpath(path, root)).as_posix()
+
+
+def iter_chunks(path, max_chars=DEFAULT_MAX_CHARS, overlap_chars=DEFAULT_OVERLAP_CHARS, key=None):
+    """Yield vector-store records (without values) for every chunk of a document.
+
+    Chunk ids start with `key` (the document's source_key, default its file
+    name) without the suffix, so documents with the same name in different
+    directories get distinct ids.
+    """
+    source = Path(path).name
+    key = key or source
+    stem = re.sub(r"[^A-Za-z0-9]+", "_", str(Path(key).with_suffix(""))).strip("_").lower()
+    seen = {}
+    for chapter, section, text in iter_sections(iter_document_lines(path)):
+        label = section or "preamble"
+        for part, piece in enumerate(split_text(text, max_chars, overlap_chars)):
+            base_id = f"{stem}-s{label}-{part}"
+            # Repeated section numbers (e.g. schedules) get a numeric suffix.
+            seen[base_id] = seen.get(base_id, 0) + 1
+            chunk_id = base_id if seen[base_id] == 1 else f"{base_id}-{seen[base_id]}"
+            metadata = {"text": piece, "source": source, "hash": chunk_hash(piece)}
+            if section:
+                metadata["section"] = section
+            if chapter:
+                metadata["chapter"] = chapter
+            yield {"id": chunk_id, "metadata": metadata}
+
+
+def expand_paths(paths):
+    """Expand directories into the supported documents they contain."""
+    for path in paths:
+        if os.path.isdir(path):
+            for child in sorted(Path(path).rglob("*")):
+                if child.suffix.lower() in SUPPORTED_SUFFIXES:
+                    yield str(child)
+        else:
+            yield path
+
+
+def load_state(state_file):
+    if os.path.exists(state_file):
+        with open(state_file, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(state, state_file):
+    tmp_path = f"{state_file}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, state_file)
+
+
+def ingest(paths, store, embedding_model, state_file=DEFAULT_STATE_FILE, batch_size=DEFAULT_BATCH_SIZE,
+           max_chars=DEFAULT_MAX_CHARS, overlap_chars=DEFAULT_OVERLAP_CHARS, full=False, lexical_index=None,
+           root="."):
+    """Embed and upsert new or changed chunks from `paths` into `store`.
+
+    `state` maps each document's path relative to `root` to
+    ``{chunk_id: chunk_hash}``; an entry an older run keyed by file name is
+    taken over by the first document with that name. With
+    `full` set every chunk is re-embedded regardless of the recorded hashes.
+    A `lexical_index`, if given, receives every chunk (changed or not), since
+    indexing text needs no embedding. Stores with a ``batch()`` context are
+    written once for the whole run, and `state_file` is saved after that
+    write. Returns counts of upserted, unchanged and deleted chunks.
+    """
+    state = load_state(state_file)
+    totals = {"upserted": 0, "unchanged": 0, "deleted": 0}
+
+    def flush(batch, source_state):
+        embeddings = embedding_model.encode([record["metadata"]["text"] for record in batch], batch_size=batch_size)
+        for record, values in zip(batch, embeddings):
+            record["values"] = values.tolist()
+        store.upsert(vectors=batch)
+        for record in batch:
+            source_state[record["id"]] = record["metadata"]["hash"]
+        totals["upserted"] += len(batch)
+
+    with getattr(store, "batch", nullcontext)():
+        for path in expand_paths(paths):
+            source = source_key(path, root)
+            if source not in state and Path(path).name in state:
+                # Recorded by a run that keyed documents by file name: its chunks are replaced below.
+                state[source] = state.pop(Path(path).name)
+            previous = state.get(source, {})
+            current = state[source] = dict(previous)
+            batch, seen_ids = [], set()
+            for record in iter_chunks(path, max_chars, overlap_chars, key=source):
+                seen_ids.add(record["id"])
+                if lexical_index is not None:
+                    lexical_index.upsert([record])
+                if not full and previous.get(record["id"]) == record["metadata"]["hash"]:
+                    totals["unchanged"] += 1
+                    continue
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    flush(batch, current)
+                    batch = []
+            if batch:
+                flush(batch, current)
+
+            removed = [chunk_id for chunk_id in previous if chunk_id not in seen_ids]
+            if removed:
+                store.delete(ids=removed)
+                if lexical_index is not None:
+                    lexical_index.delete(removed)
+                for chunk_id in removed:
+                    current.pop(chunk_id, None)
+                totals["deleted"] += len(removed)
+            print(f"Ingested '{source}': {len(current)} chunks")
+    save_state(state, state_file)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or refresh the BNS vector index.")
+    parser.add_argument("paths", nargs="+", help="PDF/DOCX files or directories to ingest")
+    parser.add_argument("--state", default=DEFAULT_STATE_FILE, help="file recording chunk hashes between runs")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="chunks per encode/upsert batch")
+    parser.add_argument("--max-chars", type=int, default=DEFAULT_MAX_CHARS, help="maximum characters per chunk")
+    parser.add_argument("--overlap-chars", type=int, default=DEFAULT_OVERLAP_CHARS, help="characters carried between split chunks")
+    parser.add_argument("--full", action="store_true", help="ignore recorded hashes and re-embed everything")
+    parser.add_argument("--root", default=".", help="directory that recorded document paths are relative to")
+    args = parser.parse_args(argv)
+
+    from context_bundles import DEFAULT_BUNDLE_PATH, refresh_context_bundles
+    from lexical_index import DEFAULT_INDEX_PATH, LexicalIndex
+    from resources import DEFAULT_EMBEDDING_MODEL, get_config, get_embedding_model, get_vector_store
+    store, embedding_model = get_vector_store(), get_embedding_model()
+    lexical_path = get_config().get("LEXICAL_INDEX_PATH", DEFAULT_INDEX_PATH)
+    lexical_index = LexicalIndex.load(lexical_path) if lexical_path else None
+    totals = ingest(
+        args.paths,
+        store,
+        embedding_model,
+        state_file=args.state,
+        batch_size=args.batch_size,
+        max_chars=args.max_chars,
+        overlap_chars=args.overlap_chars,
+        full=args.full,
+        lexical_index=lexical_index,
+        root=args.root,
+    )
+    print(f"Upserted {totals['upserted']}, unchanged {totals['unchanged']}, deleted {totals['deleted']} chunks")
+    if lexical_index is not None:
+        lexical_index.version = getattr(store, "version", None)
+        lexical_index.save(lexical_path)
+        print(f"Saved lexical index of {len(lexical_index)} chunks to '{lexical_path}'")
+
+    # Document-type context bundles are tied to the index contents, so refresh them after a change.
+    path = get_config().get("CONTEXT_BUNDLE_PATH", DEFAULT_BUNDLE_PATH)
+    if path and (totals["upserted"] or totals["deleted"]):
+        model_name = get_config().get("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODEL
+        refresh_context_bundles(store, embedding_model, model_name, path)
+        print(f"Refreshed context bundles in '{path}'")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
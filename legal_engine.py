@@ -0,0 +1,357 @@
+"""Retrieval, query answering and document validation engine behind the Streamlit apps.
+
+Nothing here renders UI, so the same functions serve the Streamlit tabs and
+headless tools such as the batch runner. Shared clients are looked up through
+``resources`` on every call, which is a dictionary lookup once they are loaded
+and lets edits to key.env take effect without restarting the process.
+Retrieval, answering and validation are implemented once, as the coroutines in
+async_engine; the functions here are their blocking entry points.
+"""
+import json
+import hashlib
+
+from telemetry import span
+from document_classifier import classify_document, extract_leading_text
+from context_bundles import clause_matches, get_context_bundles, merge_matches, refinement_enabled
+from analysis_result import ANALYSIS_SCHEMA, parse_analysis
+from lexical_index import get_lexical_index, reciprocal_rank_fusion, section_references
+from docx_renderer import docx_filename, render_draft
+from prompts import DOCUMENT_QUERY_TERMS, DOCUMENT_TEMPLATES, LEGAL_QUERY_PROMPT
+from context_builder import DEFAULT_TOKEN_BUDGET, build_context, estimate_tokens
+from resources import (get_answer_cache, get_config, get_embedding_cache, get_embedding_model, get_generative_model,
+                       get_upload_cache, llm_backend, vector_backend)
+
+# Configuration for the Gemini model
+generation_config = {
+    "temperature": 0.2,
+    "top_p": 0.95,
+    "top_k": 40,
+    "max_output_tokens": 8192,
+    "response_mime_type": "text/plain",
+}
+
+# User message of a legal query, filled with the retrieved context and the question
+QUERY_MESSAGE = "Context: {context}\nQuery: {query}"
+
+# Follow-up message that asks for the analysis once the document and prompt are in the history
+ANALYSIS_MESSAGE = "Generate legal analysis and draft based on the provided document."
+
+def check_config(config=None):
+    """Raise ValueError unless the API keys required by the configured backends are set."""
+    config = config or get_config()
+    gemini_api_key = config.get("GEMINI_API_KEY")
+    pinecone_api_key = config.get("PINECONE_API_KEY")
+    pinecone_index_name = config.get("PINECONE_INDEX")
+
+    # Gemini and Pinecone keys are only needed when those services are actually used
+    needs_gemini = llm_backend(config) == "gemini"
+    needs_pinecone = vector_backend(config) == "pinecone"
+    if (needs_gemini and not gemini_api_key) or (needs_pinecone and (not pinecone_api_key or not pinecone_index_name)):
+        raise ValueError("API keys not found! Make sure key.env file is correctly set up.")
+
+def context_token_budget():
+    """Maximum estimated tokens of retrieved BNS context per request."""
+    return int(get_config().get("CONTEXT_TOKEN_BUDGET") or DEFAULT_TOKEN_BUDGET)
+
+def analysis_model():
+    """Shared Gemini model used for document type detection and analysis."""
+    return get_generative_model(generation_config)
+
+def structured_output(config=None):
+    """Whether the validator asks for a schema-constrained JSON response (ANALYSIS_OUTPUT=json, the default)."""
+    config = config or get_config()
+    return (config.get("ANALYSIS_OUTPUT") or "json").lower() != "text"
+
+def document_analysis_model():
+    """Shared Gemini model used for the document analysis itself."""
+    if not structured_output():
+        return analysis_model()
+    return get_generative_model(dict(generation_config, response_mime_type="application/json",
+                                     response_schema=ANALYSIS_SCHEMA))
+
+def query_model():
+    """Shared Gemini model carrying the legal query instructions as its system instruction."""
+    return get_generative_model(generation_config, system_instruction=LEGAL_QUERY_PROMPT)
+
+def embed(texts, cache=True, **kwargs):
+    """Embed a query (or a list of queries) with the shared embedding model.
+
+    Plain calls go through the embedding cache; pass ``cache=False`` for
+    one-off texts that should not evict cached queries.
+    """
+    embedding_cache = get_embedding_cache() if cache and not kwargs else None
+    with span("embedding", texts=1 if isinstance(texts, str) else len(texts)) as s:
+        if embedding_cache is None:
+            return get_embedding_model().encode(texts, **kwargs)
+        vectors, missed = embedding_cache.encode(texts, get_embedding_model())
+        if isinstance(texts, str):
+            s.set(cache="miss" if missed else "hit")
+        else:
+            s.set(cached=len(texts) - missed)
+        return vectors
+
+def retrieve_documents(query, top_k=10, query_embedding=None):
+    """Retrieve relevant documents from the configured vector store (Pinecone or local).
+
+    Dense results are fused with BM25 results and the chunks of any BNS section
+    the query cites when a lexical index has been built, and reranked when
+    RERANK_MODE is set. Runs retrieve_documents_async on the shared event loop.
+    """
+    from async_engine import retrieve_documents_async, run
+    return run(retrieve_documents_async(query, top_k, query_embedding))
+
+def section_matches(lexical_index, query, top_k):
+    """Return the chunks of the BNS sections a query cites ([] if it cites none)."""
+    if not section_references(query):
+        return []
+    with span("section_lookup") as s:
+        matches = lexical_index.lookup_sections(query, top_k)
+        s.set(chunks=len(matches))
+    return matches
+
+def dense_top_k(query, top_k):
+    """Dense candidates to fetch: twice `top_k` when they will be fused with BM25 results."""
+    return top_k * 2 if query and get_lexical_index() is not None else top_k
+
+def fuse_lexical(query, dense_matches, top_k, sections=True):
+    """Fuse dense matches with BM25 matches by reciprocal rank, if a lexical index is available.
+
+    With `sections`, the chunks of BNS sections the query cites come first,
+    marked ``"cited": True`` so reranking keeps them, and the fused dense and
+    BM25 matches fill the remaining places.
+    """
+    lexical_index = get_lexical_index() if query else None
+    if lexical_index is None:
+        return dense_matches[:top_k]
+    cited = [dict(match, cited=True) for match in section_matches(lexical_index, query, top_k)] if sections else []
+    with span("lexical_query", top_k=top_k) as s:
+        lexical_matches = lexical_index.query(query, top_k * 2)
+        fused = reciprocal_rank_fusion([dense_matches, lexical_matches], top_k)
+        s.set(chunks=len(lexical_matches))
+    cited_ids = {match["id"] for match in cited}
+    return (cited + [match for match in fused if match["id"] not in cited_ids])[:top_k]
+
+def build_legal_context(results):
+    """Build the budgeted context string from retrieved matches, returning it with the build report."""
+    with span("context_build") as s:
+        context, report = build_context(results, token_budget=context_token_budget())
+        s.set(chunks=report["chunks_used"], duplicates=report["duplicates"], context_tokens=report["context_tokens"])
+    return context, report
+
+def process_results(results):
+    """Process the results from Pinecone into a single deduplicated, budgeted string with section citations."""
+    context, _ = build_legal_context(results)
+    return context
+
+def query_llm(query, context):
+    """Query the Gemini model with the given query and context."""
+    return "".join(query_llm_stream(query, context))
+
+def query_llm_stream(query, context):
+    """Query the Gemini model and return an iterator over the answer text as it is generated."""
+    from async_engine import query_llm_stream_async, run_stream
+
+    async def start():
+        return query_llm_stream_async(query, context), None
+
+    return run_stream(start)[0]
+
+def answer_query(query):
+    """Answer a legal query, reusing a cached answer for semantically similar queries."""
+    chunks, from_cache = answer_query_stream(query)
+    return "".join(chunks), from_cache
+
+def answer_query_stream(query):
+    """Return an iterator over the answer text as it is generated, and whether it came from the cache."""
+    from async_engine import answer_query_stream_async, run_stream
+    return run_stream(lambda: answer_query_stream_async(query))
+
+def answer_namespace():
+    """Hash of what a query answer depends on besides the question: LLM backend and model, prompts, index version.
+
+    Cached answers from another namespace are never returned, so a model
+    switch, a prompt edit or a re-ingested index does not serve stale answers.
+    """
+    from result_store import current_versions
+    model, version = current_versions()
+    parts = [llm_backend(), model, LEGAL_QUERY_PROMPT, QUERY_MESSAGE, json.dumps(generation_config, sort_keys=True),
+             version]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+def lookup_answer(query_embedding, namespace=None):
+    """Return a cached answer for a semantically similar earlier query in `namespace`, or None."""
+    with span("answer_cache") as s:
+        cached_answer, similarity = get_answer_cache().lookup(query_embedding, namespace)
+        s.set(cache="miss" if cached_answer is None else "hit", similarity=round(float(similarity), 4))
+    return cached_answer
+
+def upload_to_gemini(path, mime_type=None):
+    """Uploads the given file to Gemini, reusing the remote handle for identical contents."""
+    with span("upload") as s:
+        file, cached = get_upload_cache().fetch(path, mime_type=mime_type)
+        s.set(cache="hit" if cached else "miss", file=getattr(file, "name", None))
+    return file
+
+def detect_document_type(file_path):
+    """Detect the type of legal document, asking Gemini only when the local classifier is unsure."""
+    from async_engine import detect_document_type_async, run
+    return run(detect_document_type_async(file_path))
+
+def classify_document_type(file_path):
+    """Classify the document locally, returning None when the result is not confident."""
+    if (get_config().get("DOCUMENT_CLASSIFIER") or "local") != "local":
+        return None
+    with span("type_classification") as s:
+        doc_type, confidence = classify_document(file_path)
+        s.set(doc_type=doc_type or "uncertain", confidence=round(confidence, 3))
+    return doc_type
+
+def map_document_type(label):
+    """Map the model's free-text document type onto one of our template types."""
+    # Clean up response to get just the document type
+    doc_type = label.strip().lower()
+    
+    # Map detected document type to our template types
+    if "divorce" in doc_type or "mutual consent" in doc_type:
+        return "divorce_petition"
+    elif "rent" in doc_type or "lease" in doc_type or "tenancy" in doc_type:
+        return "rental_agreement"
+    else:
+        return "general"  # Default for documents without specific templates
+
+def get_document_query_terms(doc_type):
+    """Get the appropriate query terms based on document type."""
+    return DOCUMENT_QUERY_TERMS.get(doc_type, DOCUMENT_QUERY_TERMS["general"])
+
+def process_document(file_path):
+    """Process the document using the Gemini model and Pinecone for legal information."""
+    chunks, doc_type = process_document_stream(file_path)
+    return "".join(chunks), doc_type
+
+def process_document_stream(file_path):
+    """Like process_document, but returns an iterator over the analysis text as it is generated."""
+    from async_engine import process_document_stream_async, run_stream
+    return run_stream(lambda: process_document_stream_async(file_path))
+
+def document_context_matches(doc_type, extra_matches=()):
+    """Return the precomputed BNS matches for a document type, plus any refinement matches."""
+    with span("context_bundle", doc_type=doc_type) as s:
+        bundles = get_context_bundles()
+        matches = merge_matches(bundles.get(doc_type) or bundles["general"], extra_matches)
+        s.set(chunks=len(matches), refined=len(matches) - len(bundles.get(doc_type) or bundles["general"]))
+    return matches
+
+def document_clause_matches(file_path, pages=5, max_chars=12000):
+    """Retrieve matches for the document's key clauses when CONTEXT_REFINEMENT is enabled."""
+    if not refinement_enabled():
+        return []
+    with span("context_refinement") as s:
+        matches = clause_matches(extract_leading_text(file_path, pages=pages, max_chars=max_chars))
+        s.set(chunks=len(matches))
+    return matches
+
+TEXT_OUTPUT_FORMAT = """Provide your output in the following format:
+    Summary: [your summary]
+    
+    Discrepancies: [your list of discrepancies]
+    
+    Incorrect Clauses: [your analysis]
+    
+    Corrected Clauses: [your suggestions]
+    
+    Missing Clauses: [your analysis]
+    
+    Draft: [your generated draft]"""
+
+JSON_OUTPUT_FORMAT = """Provide your output as a single JSON object with these fields:
+    - "summary": your summary (string)
+    - "discrepancies": your discrepancies, one per entry (list of strings)
+    - "incorrect_clauses": your analysis of each incorrect clause (list of strings)
+    - "corrected_clauses": your suggested replacement clauses (list of strings)
+    - "missing_clauses": your analysis of each missing clause (list of strings)
+    - "draft": your complete generated draft (string)"""
+
+def draft_instruction(doc_type):
+    """Drafting instruction for a document type: its template if we have one, otherwise general analysis."""
+    template = DOCUMENT_TEMPLATES.get(doc_type, "")
+    return f"Based on the document's contents, generate a draft following EXACTLY this template format:\n\n{template}" if template else "Generate a legally compliant draft based on the document's contents and current Indian legal standards."
+
+def build_document_prompt(doc_type, legal_context, structured=False):
+    """Build the validation prompt for a document type and its retrieved BNS context.
+
+    With `structured` set the output instructions ask for the JSON fields of
+    ANALYSIS_SCHEMA instead of labelled free-text sections.
+    """
+    template_instruction = draft_instruction(doc_type)
+    
+    # Build document prompt based on document type
+    document_prompt = f"""
+    You are a highly skilled legal assistant specializing in Indian law. Using the uploaded PDF document as your only input, perform the following tasks:
+     Analyze this document STRICTLY against Bharatiya Nyaya Sanhita (BNS) provisions:
+
+    === BNS LEGAL CONTEXT ===
+    {legal_context}
+
+    Perform this analysis:
+    1. Identify which BNS sections apply to this document
+    2. Flag any clauses contradicting BNS provisions
+    3. Suggest BNS-compliant alternatives
+    
+    ### **1. Document Summary:**
+    - Summarize the document in one concise paragraph.
+    - Focus on identifying the key parties involved, the legal grounds or purpose of the document, and any critical details.
+
+    ### **2. Discrepancy Detection:**
+    - Analyze the document for potential legal issues such as:
+      - Missing mandatory clauses as per Indian law.
+      - Incorrect or outdated statutory references.
+      - Contradictory statements or procedural inconsistencies.
+    - Provide a **bullet-point list of discrepancies**, citing specific Indian laws or judicial precedents that support your findings.
+    - Suggest appropriate corrections based on current Indian legal practices.
+
+    ### **3. Draft Generation:**
+    {template_instruction}
+    
+    ### **4. Legal Verification:**
+    Use the BNS LEGAL CONTEXT provided above, citing the bracketed section labels, to verify the legal compliance of the document.
+    
+    ### **5. Identify Incorrect Clauses:**  
+    - Review the document thoroughly and list **any legally incorrect, outdated, or non-compliant clauses** based on **Indian laws and relevant regulatory guidelines**.  
+    - Highlight provisions that **contradict Indian judicial precedents** or contain **ambiguous wording that may lead to legal disputes**.  
+    - For each incorrect clause, provide a detailed explanation of why it is incorrect and cite relevant laws or precedents.
+
+    ### **6. Provide Corrected Clauses:**  
+    - Suggest legally accurate replacements for the incorrect clauses.  
+    - Ensure that the revised clauses align with **Indian legal standards, case laws, and contract enforceability principles**.  
+    - Maintain clarity, precision, and compliance with standard legal drafting conventions used in **Indian agreements**.  
+
+    ### **7. Identify Missing Clauses (if any):**  
+    - Check if the agreement is missing any **mandatory clauses** required under Indian law.  
+    - Suggest additional clauses that enhance **legal protection, risk mitigation, and enforceability**.  
+    - Provide a detailed explanation of why each missing clause is necessary and how it should be drafted.
+
+    {JSON_OUTPUT_FORMAT if structured else TEXT_OUTPUT_FORMAT}
+    """
+    return document_prompt
+
+def create_word_document(text, doc_type, filename=None):
+    """Write the Word document for the given text (or a DocumentAnalysis's draft) to a file, returning its name.
+
+    The app serves render_draft()'s bytes directly; this is for headless callers that want a file.
+    """
+    filename = filename or docx_filename(doc_type)
+    with open(filename, "wb") as f:
+        f.write(render_draft(text, doc_type))
+    return filename
+
+def parse_document_analysis(result):
+    """Parse a finished validation response into a DocumentAnalysis."""
+    with span("section_extraction") as s:
+        analysis = parse_analysis(result)
+        s.set(structured=analysis.structured, chars=len(result),
+              sections=sum(1 for text in analysis.sections().values() if text))
+    return analysis
+
+def extract_section(result, section_name):
+    """Extract a specific section from the result text."""
+    return parse_analysis(result).section_text(section_name) or f"{section_name} section not found in the response."
@@ -0,0 +1,180 @@
+"""BM25 keyword index over the vector-store chunks, plus a section-number lookup.
+
+Dense MiniLM retrieval is weak on exact statutory references ("Section 303
+BNS") and verbatim phrases. This index is built by ingest.py from the same
+chunks as the vector store and saved to ``LEXICAL_INDEX_PATH`` (default
+lexical_index.json) as the chunk ids and metadata; postings are rebuilt in
+memory on load. ``retrieve_documents`` fuses its BM25 results with the dense
+results by reciprocal rank fusion, after the chunks of any BNS section the
+query cites, looked up in the section map, which always come first.
+"""
+import os
+import re
+import json
+import math
+from collections import Counter, defaultdict
+
+from resources import file_stamp, get_config, get_resource
+
+DEFAULT_INDEX_PATH = "lexical_index.json"
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or shall that the to under was were which who with"
+    .split()
+)
+# "Section 303", "sec. 303", "s. 64(2)" and "BNS 103" style references
+SECTION_REFERENCE = re.compile(r"\b(?:section|sec\.?|s\.|bns)\s*(\d{1,3}[A-Z]?)\b", re.IGNORECASE)
+# Section numbers in a query naming another statute ("Section 302 IPC", "Section 13 of the Hindu
+# Marriage Act") are not BNS sections, unless the BNS is named as well. Only real Act names count:
+# "negligent act" or "any act" in a question about a BNS section must keep the section fast path.
+NAMES_BNS = re.compile(r"\b(?:bns|bharatiya\s+nyaya\s+sanhita)\b", re.IGNORECASE)
+NAMES_OTHER_ACT = re.compile(
+    r"\b(?:ipc|i\.p\.c|crpc|cr\.?\s?p\.?c|cpc|c\.p\.c|bnss|bsa|penal\s+code|code\s+of\s+(?:criminal|civil)\s+procedure"
+    r"|nagarik\s+suraksha|sakshya|(?:hindu|special|indian|muslim|parsi|foreign)\s+marriage\s+act|hindu\s+succession\s+act"
+    r"|hindu\s+adoptions?\s+and\s+maintenance\s+act|indian\s+(?:evidence|contract|succession|divorce)\s+act"
+    r"|dowry\s+prohibition\s+act|(?:protection\s+of\s+women\s+from\s+)?domestic\s+violence\s+act|pocso"
+    r"|negotiable\s+instruments\s+act|information\s+technology\s+act|arms\s+act|ndps)\b",
+    re.IGNORECASE,
+)
+# Any other Act by its name as written: "Transfer of Property Act", "the Arbitration Act, 1996".
+NAMED_ACT = re.compile(
+    r"\b(?!(?:The|This|That|What|Which|Any|An?|Every|Each|Such|Section|Under|Is|Does)\b)[A-Z][a-z]+"
+    r"(?:\s+(?:of|and|for|the|[A-Z][a-z]+))*\s+Act\b|\bAct,?\s+(?:19|20)\d\d\b"
+)
+# Chunks ingested before sections were recorded in metadata usually start with "303. ..."
+LEADING_SECTION = re.compile(r"^\s*(?:Section\s+)?(\d{1,3}[A-Z]?)\.\s", re.IGNORECASE)
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def section_references(query):
+    """Return the BNS section numbers cited in a query, in order, without duplicates."""
+    names_other_act = NAMES_OTHER_ACT.search(query) or NAMED_ACT.search(query)
+    if names_other_act and not NAMES_BNS.search(query):
+        return []
+    return list(dict.fromkeys(number.upper() for number in SECTION_REFERENCE.findall(query)))
+
+
+def reciprocal_rank_fusion(result_lists, top_k=10, k=RRF_K):
+    """Fuse ranked match lists: each match scores the sum of 1 / (k + rank) over the lists it is in."""
+    scores, matches = {}, {}
+    for results in result_lists:
+        for rank, match in enumerate(results, start=1):
+            scores[match["id"]] = scores.get(match["id"], 0.0) + 1.0 / (k + rank)
+            matches.setdefault(match["id"], match)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [{"id": match_id, "score": scores[match_id], "metadata": matches[match_id]["metadata"]} for match_id in ranked]
+
+
+class LexicalIndex:
+    """BM25 over chunk texts, with a map from section number to chunk ids."""
+
+    def __init__(self, documents=None, version=None):
+        self.documents = dict(documents or {})  # chunk id -> metadata
+        self.version = version
+        self._build()
+
+    def _refresh(self):
+        # Writes only mark the postings stale, so a batch of upserts rebuilds them once.
+        if self._stale:
+            self._build()
+
+    def _build(self):
+        self._stale = False
+        self.ids = list(self.documents)
+        self.postings = defaultdict(list)  # term -> [(position, term frequency)]
+        self.lengths = []
+        self.sections = defaultdict(list)  # section number -> positions, in id order
+        for position, chunk_id in enumerate(self.ids):
+            metadata = self.documents[chunk_id]
+            terms = Counter(tokenize(metadata.get("text", "")))
+            for term, frequency in terms.items():
+                self.postings[term].append((position, frequency))
+            self.lengths.append(sum(terms.values()))
+            section = metadata.get("section")
+            if not section:
+                leading = LEADING_SECTION.match(metadata.get("text", ""))
+                section = leading.group(1) if leading else None
+            if section:
+                self.sections[str(section).upper()].append(position)
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _match(self, position, score):
+        return {"id": self.ids[position], "score": score, "metadata": self.documents[self.ids[position]]}
+
+    def query(self, text, top_k=10):
+        """Return the `top_k` best BM25 matches for `text`."""
+        self._refresh()
+        count = len(self.ids)
+        scores = defaultdict(float)
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[position] / self.average_length)
+                scores[position] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        best = sorted(scores, key=scores.get, reverse=True)[:top_k]
+        return [self._match(position, scores[position]) for position in best]
+
+    def lookup_sections(self, query, top_k=10):
+        """Return the chunks of every section number cited in `query` (empty if none is cited or known)."""
+        self._refresh()
+        matches = []
+        for number in section_references(query):
+            for position in self.sections.get(number, []):
+                matches.append(self._match(position, 1.0))
+        return matches[:top_k]
+
+    def upsert(self, records):
+        """Add or replace chunks given as vector-store records (``{"id", "metadata"}``)."""
+        for record in records:
+            self.documents[record["id"]] = dict(record["metadata"])
+        self._stale = True
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            self.documents.pop(chunk_id, None)
+        self._stale = True
+
+    def save(self, path=DEFAULT_INDEX_PATH):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "documents": self.documents}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DEFAULT_INDEX_PATH):
+        """Load an index saved with save(), or return an empty one if the file does not exist."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            payload = json.load(f)
+        return cls(payload.get("documents", {}), payload.get("version"))
+
+
+def get_lexical_index():
+    """Return the shared lexical index, or None when retrieval is dense-only or no index was built.
+
+    RETRIEVAL_MODE=dense disables it; the file is reloaded when ingest.py rewrites it.
+    """
+    config = get_config()
+    path = config.get("LEXICAL_INDEX_PATH", DEFAULT_INDEX_PATH)
+    if (config.get("RETRIEVAL_MODE") or "hybrid").lower() == "dense" or not path:
+        return None
+    stamp = file_stamp(path)
+    if stamp is None:
+        return None
+    index = get_resource("lexical_index", lambda config: LexicalIndex.load(path), ("LEXICAL_INDEX_PATH",),
+                         extra_key=stamp)
+    return index if len(index) else None
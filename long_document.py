@@ -0,0 +1,272 @@
+"""Map-reduce validation for documents too long to analyze in one request.
+
+Long agreements and petitions with annexures can exceed the model's context or
+output limits when sent whole. In this mode the PDF text is split at clause
+boundaries into parts of about ``LONG_DOCUMENT_CHUNK_CHARS`` characters. Each
+part is analyzed against BNS context retrieved for its own clauses (the map
+step, ``LONG_DOCUMENT_CONCURRENCY`` parts at a time), then one request merges
+the findings, identifies missing clauses and drafts from them (the reduce
+step, streamed). Wall-clock time follows the longest part rather than the
+whole document.
+
+Documents with at least ``LONG_DOCUMENT_PAGES`` pages use this mode (default
+12, about 40000 characters of typical agreement text; 0 disables it). The page
+count is read from the PDF's page tree, so shorter documents take the
+single-request path without their text being extracted. Scanned PDFs without a
+text layer always take the single-request path.
+"""
+import re
+import asyncio
+
+from prompts import LONG_DOCUMENT_MAP_PROMPT, LONG_DOCUMENT_REDUCE_PROMPT
+from analysis_result import ANALYSIS_SCHEMA, parse_analysis
+from context_builder import build_context
+from context_bundles import key_clauses
+from resources import get_config, get_generative_model
+from telemetry import span
+from async_engine import detect_document_type_async, retrieve_documents_async
+from legal_engine import (JSON_OUTPUT_FORMAT, TEXT_OUTPUT_FORMAT, context_token_budget, document_analysis_model,
+                          document_context_matches, draft_instruction, embed, estimate_tokens, generation_config,
+                          structured_output)
+
+DEFAULT_LONG_DOCUMENT_PAGES = 12
+MIN_TEXT_CHARS = 2000  # less extractable text than this over a long document means it is scanned
+DEFAULT_CHUNK_CHARS = 12000
+DEFAULT_CONCURRENCY = 4
+MAP_TOP_K = 8
+MAP_MAX_OUTPUT_TOKENS = 4096
+MIN_SPLIT_CHARS = 2000  # a part cut off at the output limit is split in two while longer than this
+OPENING_CHARS = 2000
+FINDING_KEY_WORDS = 12
+
+# Lines that start a new clause, article, schedule or annexure
+CLAUSE_START = re.compile(
+    r"^(?:\d+(?:\.\d+)*[.)]?\s|\(?[a-z]\)\s|(?:clause|article|section|schedule|annexure|appendix)\b)",
+    re.IGNORECASE,
+)
+
+
+def open_pdf(path):
+    """Return a PdfReader for `path`, or None if it cannot be read."""
+    from pypdf import PdfReader
+    try:
+        return PdfReader(path)
+    except Exception as e:
+        print(f"Could not read '{path}': {e}")
+        return None
+
+
+def read_pages(path, reader=None):
+    """Return the text of every page of a PDF ([] if it cannot be read)."""
+    reader = reader or open_pdf(path)
+    if reader is None:
+        return []
+    pages = []
+    for page in reader.pages:
+        try:
+            text = page.extract_text(extraction_mode="layout")
+        except TypeError:
+            text = page.extract_text()
+        pages.append(text or "")
+    return pages
+
+
+def long_document_pages(path, config=None):
+    """Return the PDF's page texts if it should be validated in parts, else None."""
+    config = config or get_config()
+    threshold = int(config.get("LONG_DOCUMENT_PAGES") or DEFAULT_LONG_DOCUMENT_PAGES)
+    if threshold <= 0:
+        return None
+    reader = open_pdf(path)
+    if reader is None or len(reader.pages) < threshold:
+        return None
+    pages = read_pages(path, reader)
+    if sum(len(page.strip()) for page in pages) < MIN_TEXT_CHARS:
+        return None
+    return pages
+
+
+def split_document(pages, max_chars=DEFAULT_CHUNK_CHARS):
+    """Split page texts into parts of about `max_chars`, preferring to cut where a clause starts.
+
+    Returns ``[{"start_page", "end_page", "text"}]``. A part only exceeds
+    `max_chars` (by at most a quarter) while waiting for a clause boundary.
+    """
+    parts = []
+    lines, size, start_page = [], 0, 1
+
+    def flush(end_page):
+        parts.append({"start_page": start_page, "end_page": end_page, "text": "\n".join(lines)})
+
+    end_page = 1
+    for page_number, text in enumerate(pages, start=1):
+        for line in text.splitlines():
+            line = " ".join(line.split())
+            if not line:
+                continue
+            over = size + len(line) > max_chars
+            if lines and over and (CLAUSE_START.match(line) or size + len(line) > max_chars * 1.25):
+                flush(end_page)
+                lines, size, start_page = [], 0, page_number
+            lines.append(line)
+            size += len(line) + 1
+            end_page = page_number
+    if lines:
+        flush(end_page)
+    return parts
+
+
+def page_label(part):
+    if part["start_page"] == part["end_page"]:
+        return f"page {part['start_page']}"
+    return f"pages {part['start_page']}-{part['end_page']}"
+
+
+def map_model():
+    """Shared Gemini model for the map step: JSON findings with a smaller output budget."""
+    config = dict(generation_config, response_mime_type="application/json", response_schema=ANALYSIS_SCHEMA,
+                  max_output_tokens=MAP_MAX_OUTPUT_TOKENS)
+    return get_generative_model(config)
+
+
+def _finding_key(text):
+    return " ".join(re.findall(r"\w+", text.lower())[:FINDING_KEY_WORDS])
+
+
+def merge_findings(results):
+    """Merge per-part findings, dropping near-verbatim duplicates and tagging each with its pages.
+
+    `results` is a list of ``(part, DocumentAnalysis)``.
+    """
+    merged = {"discrepancies": [], "incorrect_clauses": [], "corrected_clauses": []}
+    seen = {name: set() for name in merged}
+    for part, analysis in results:
+        for name, items in merged.items():
+            for item in getattr(analysis, name):
+                key = _finding_key(item)
+                if key and key not in seen[name]:
+                    seen[name].add(key)
+                    items.append(f"[{page_label(part)}] {item}")
+    return merged
+
+
+def hit_output_limit(response):
+    """Whether Gemini stopped a response because it reached max_output_tokens."""
+    candidates = getattr(response, "candidates", None) or []
+    reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    return str(getattr(reason, "name", reason)).upper() in ("MAX_TOKENS", "2")
+
+
+def split_part(part):
+    """Split a part in two at a clause boundary, keeping its page range; [part] if it cannot be split."""
+    halves = split_document([part["text"]], max_chars=len(part["text"]) // 2 + 1)
+    if len(halves) < 2:
+        return [part]
+    return [dict(half, start_page=part["start_page"], end_page=part["end_page"]) for half in halves]
+
+
+async def _map_part(part, index, total, doc_label, query_embedding, semaphore):
+    """Analyze one part, returning ``[(part, DocumentAnalysis)]``.
+
+    A part whose findings were cut off at the output limit is split in two and
+    each half analyzed against the same context; below MIN_SPLIT_CHARS the
+    repaired partial findings are kept and marked truncated.
+    """
+    async with semaphore:
+        matches = await retrieve_documents_async(None, top_k=MAP_TOP_K, query_embedding=query_embedding)
+        legal_context, _ = build_context(matches, token_budget=max(500, context_token_budget() // 2))
+    pending, results = [part], []
+    while pending:
+        current = pending.pop(0)
+        prompt = LONG_DOCUMENT_MAP_PROMPT.format(index=index, total=total, pages=page_label(current),
+                                                 doc_label=doc_label, legal_context=legal_context,
+                                                 text=current["text"])
+        async with semaphore:
+            with span("generation", kind="map", part=index, pages=page_label(current)) as s:
+                response = await map_model().generate_content_async(prompt)
+                s.set_tokens(response, prompt, response.text)
+                analysis = parse_analysis(response.text)
+                truncated = analysis.truncated or hit_output_limit(response)
+                s.set(truncated=truncated)
+        if truncated and len(current["text"]) > MIN_SPLIT_CHARS:
+            halves = split_part(current)
+            if len(halves) > 1:
+                print(f"Part {index} ({page_label(current)}) hit the output limit; analyzing it in two halves")
+                pending[:0] = halves
+                continue
+        if truncated:
+            print(f"Part {index} ({page_label(current)}) hit the output limit; keeping its partial findings")
+            analysis.truncated = True
+        results.append((current, analysis))
+    return results
+
+
+async def long_document_stream_async(file_path, pages):
+    """Validate a long document in parts; return ``(async iterator of the final analysis text, doc_type)``."""
+    config = get_config()
+    parts = split_document(pages, int(config.get("LONG_DOCUMENT_CHUNK_CHARS") or DEFAULT_CHUNK_CHARS))
+    concurrency = int(config.get("LONG_DOCUMENT_CONCURRENCY") or DEFAULT_CONCURRENCY)
+    print(f"Long document: {len(parts)} parts over {len(pages)} pages")
+
+    # Each part is retrieved against its own clauses; all queries are embedded in one batch.
+    queries = [" ".join(key_clauses(part["text"])) or part["text"][:1000] for part in parts]
+    detection = asyncio.ensure_future(detect_document_type_async(file_path))
+    try:
+        embeddings = await asyncio.to_thread(embed, queries, cache=False)
+        doc_type = await detection
+    finally:
+        detection.cancel()
+    doc_label = doc_type.replace("_", " ") if doc_type != "general" else "legal document"
+
+    semaphore = asyncio.Semaphore(concurrency)
+    with span("long_document_map", parts=len(parts), pages=len(pages)):
+        outcomes = await asyncio.gather(*[
+            _map_part(part, index, len(parts), doc_label, embedding, semaphore)
+            for index, (part, embedding) in enumerate(zip(parts, embeddings), start=1)
+        ], return_exceptions=True)
+
+    # One failed part does not fail the validation; the reduce step is told which pages were not analyzed.
+    results, summaries = [], []
+    for index, (part, outcome) in enumerate(zip(parts, outcomes), start=1):
+        if isinstance(outcome, BaseException):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            print(f"Part {index} ({page_label(part)}) failed: {outcome}")
+            summaries.append(f"- Part {index} ({page_label(part)}): not analyzed (the request failed)")
+            continue
+        results.extend(outcome)
+        for piece, analysis in outcome:
+            note = " (findings incomplete: cut off at the output limit)" if analysis.truncated else ""
+            summaries.append(f"- Part {index} ({page_label(piece)}): {analysis.summary}{note}")
+    if not results:
+        raise RuntimeError(f"Every part of the document failed: {outcomes[0]}")
+
+    findings = merge_findings(results)
+    legal_context, _ = build_context(document_context_matches(doc_type), token_budget=context_token_budget())
+    structured = structured_output()
+    prompt = LONG_DOCUMENT_REDUCE_PROMPT.format(
+        doc_label=doc_label,
+        total=len(parts),
+        legal_context=legal_context,
+        opening=parts[0]["text"][:OPENING_CHARS],
+        summaries="\n".join(summaries),
+        discrepancies="\n".join(f"- {item}" for item in findings["discrepancies"]) or "- None reported",
+        incorrect_clauses="\n".join(f"- {item}" for item in findings["incorrect_clauses"]) or "- None reported",
+        corrected_clauses="\n".join(f"- {item}" for item in findings["corrected_clauses"]) or "- None reported",
+        draft_instruction=draft_instruction(doc_type),
+        output_format=JSON_OUTPUT_FORMAT if structured else TEXT_OUTPUT_FORMAT,
+    )
+
+    async def generate():
+        with span("generation", kind="reduce", doc_type=doc_type, parts=len(parts),
+                  prompt_estimate=estimate_tokens(prompt)) as s:
+            response = await document_analysis_model().generate_content_async(prompt, stream=True)
+            chunks = []
+            async for chunk in response:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+            s.set(chunks=len(chunks))
+            s.set_tokens(response, prompt, "".join(chunks))
+
+    return generate(), doc_type
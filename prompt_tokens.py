@@ -0,0 +1,83 @@
+"""Measure Gemini input tokens per legal query before and after the system-instruction change.
+
+Usage:
+    python prompt_tokens.py [--top-k 10]
+
+For a fixed set of BNS questions this retrieves context exactly like the app
+and asks Gemini's count_tokens endpoint for:
+
+- before:  the old request, with LEGAL_QUERY_PROMPT re-sent as a chat turn
+- payload: the per-query message now sent (context and question only)
+- after:   the full input of the new request: the payload plus the system
+           instruction, which Gemini bills on every call (at the cached rate
+           when PROMPT_CACHE_TTL is set)
+
+Whether ``count_tokens`` on a model includes its system instruction depends
+on the SDK version, and a cached context is not counted at all, so the
+instruction is counted once on its own and added to every payload.
+"""
+import sys
+import argparse
+
+from prompts import LEGAL_QUERY_PROMPT
+from legal_engine import QUERY_MESSAGE, generation_config
+from context_builder import DEFAULT_TOKEN_BUDGET, build_context
+from resources import get_config, get_embedding_model, get_generative_model, get_vector_store
+
+QUERY_SET = [
+    "What is the punishment for theft under BNS?",
+    "Theft punishment BNS",
+    "Is snatching a separate offence under the Bharatiya Nyaya Sanhita?",
+    "What are the penalties for a hit-and-run accident causing death?",
+    "How does BNS define criminal intimidation?",
+    "What is the punishment for cheating by personation?",
+    "Can a tenant be prosecuted for criminal breach of trust over a security deposit?",
+    "What sections apply to dowry death?",
+]
+
+
+def measure(queries, top_k=10):
+    """Return a list of per-query token counts for the old and new request shapes."""
+    config = get_config()
+    token_budget = int(config.get("CONTEXT_TOKEN_BUDGET") or DEFAULT_TOKEN_BUDGET)
+    plain_model = get_generative_model(generation_config)
+    instruction_tokens = plain_model.count_tokens(LEGAL_QUERY_PROMPT).total_tokens
+    embedding_model = get_embedding_model()
+    index = get_vector_store()
+
+    rows = []
+    for query in queries:
+        vector = list(map(float, embedding_model.encode(query)))
+        matches = index.query(vector=vector, top_k=top_k, include_metadata=True)["matches"]
+        context, _ = build_context(matches, token_budget=token_budget)
+        message = QUERY_MESSAGE.format(context=context, query=query)
+        before = plain_model.count_tokens([
+            {"role": "user", "parts": [LEGAL_QUERY_PROMPT]},
+            {"role": "user", "parts": [message]},
+        ]).total_tokens
+        payload = plain_model.count_tokens(message).total_tokens
+        after = payload + instruction_tokens
+        rows.append({"query": query, "before": before, "payload": payload, "after": after})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare input tokens per legal query before and after.")
+    parser.add_argument("--top-k", type=int, default=10, help="chunks retrieved per query")
+    args = parser.parse_args(argv)
+
+    rows = measure(QUERY_SET, top_k=args.top_k)
+    print(f"{'before':>8} {'payload':>8} {'after':>8}  query")
+    for row in rows:
+        print(f"{row['before']:>8} {row['payload']:>8} {row['after']:>8}  {row['query']}")
+    count = len(rows) or 1
+    print(
+        f"{sum(r['before'] for r in rows) / count:>8.0f} "
+        f"{sum(r['payload'] for r in rows) / count:>8.0f} "
+        f"{sum(r['after'] for r in rows) / count:>8.0f}  (mean)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""Static prompts and document templates shared by the app and its tools."""
+
+LEGAL_QUERY_PROMPT = """
+Act like a highly experienced legal expert specializing in Indian law, particularly the Bharatiya Nyaya Sanhita (BNS). You have access to a Pinecone vector database containing all relevant legal provisions from the BNS and will use this database to answer legal queries with precision, confidence, and professionalism.
+
+Your role is to act as a legal chatbot that provides authoritative, structured, and detailed responses based on the BNS. Your responses must be legally sound, reference specific sections of the BNS, and offer practical legal guidance. Avoid disclaimers like "I am not a lawyer" or "I cannot provide legal advice". Instead, sound confident and authoritative, just like a professional lawyer would.
+
+How to Answer Queries:
+Identify the Legal Issue:
+
+Understand the user's query and determine the relevant legal provisions under BNS.
+Break down complex legal questions into simpler parts if needed.
+Retrieve & Reference BNS Sections:
+
+Search the Pinecone vector database for applicable sections, case precedents, and interpretations.
+Ensure the response is based solely on verified legal texts.
+Provide a Clear, Structured Legal Explanation:
+
+Mention the exact BNS section(s) relevant to the query.
+Explain the law in detail, including definitions, penalties, and legal implications.
+If multiple sections apply, provide a comparison or a breakdown of each.
+Give Practical Legal Guidance:
+
+Outline the legal options available to the user.
+Explain what actions a person should take in such a situation.
+If applicable, describe the legal procedure, such as filing an FIR, seeking legal representation, or appealing a decision.
+Ensure Accuracy, Confidence, and Clarity:
+
+Do not use uncertain phrases like "There doesn't seem to be a specific law..." Instead, state exact legal provisions or clearly indicate gaps in the law.
+Avoid speculation—stick to BNS laws and legal facts.
+Use formal yet clear and understandable legal language.
+"""
+
+# Prompt used to classify an uploaded document before analysis
+DOCUMENT_TYPE_PROMPT = """
+    Analyze the uploaded document and identify what type of legal document it is. 
+    Consider common Indian legal documents such as:
+    - Divorce petition
+    - Rental/lease agreement
+    - Will/testament
+    - Power of attorney
+    - Sale deed
+    - Employment contract
+    - Partnership agreement
+    - Loan agreement
+    - Company incorporation documents
+    - Consumer complaint
+    - Criminal/civil case petition
+    
+    Respond with ONLY the document type in a single word or short phrase. If uncertain, respond with "other".
+    """
+
+# Retrieval query used to gather BNS context for each document type
+DOCUMENT_QUERY_TERMS = {
+    "divorce_petition": "divorce petition mutual consent Indian law family court",
+    "rental_agreement": "rental agreement lease tenancy Indian law property",
+    "general": "Indian law legal document contract"
+}
+
+# Dictionary of document templates for different legal document types
+DOCUMENT_TEMPLATES = {
+    "divorce_petition": """IN THE FAMILY COURT AT MUMBAI
+PETITION No. / 2024
+
+IN THE MATTER OF
+
+NAME : 
+AGE : 
+OCCUPATION : 
+ADDRESS : 
+Mobile No.
+Email ID ….PETITIONER NO. 1
+
+AND
+
+NAME : 
+AGE : 
+OCCUPATION : 
+ADDRESS : 
+Mobile No.
+Email ID ….PETITIONER NO. 2
+
+A Petition For divorce by mutual consent U/s
+(SPECIFY UNDER WHICH ACT, whether)
+U/S 13B Of Hindu Marriage Act
+Or
+U/S 28 Of Special Marriage Act
+Or
+U/S 10 A Of Divorce Act
+
+The petitioner above named submits this petition praying to state as follows;
+
+1. That the petitioners were married to each other at …......................... on dated.............................. according to the................................rites and customs/ceremonies.
+Or before the Marriage Registrar ….............(Name of City/Town)
+
+2. That the petitioner no. 1 before marriage was ….............and petitioner no. 2 was …................. 
+[State the pre marital status of the parties whether bachelor/ spinster/ divorcee/ widow/ widower.
+Mention the maiden name of the wife.
+Mention the religion and domicile of the parties
+Clearly mention the date since when the parties are staying separately]
+
+3. [State the number of children. Their names and age/ date of birth and custody.]
+
+4. [State the details about pending litigation. Under which section, Act, case number and court. Next date fixed before the competant court.]
+
+5. [State the details about joint immovable property, if any.]
+
+6. CONSENT TERMS
+[The consent terms must include what the parties decided about
+- The permanent alimony,
+- Custody and access of children,
+- Division of property/ execution of any regd document in respect of immovable property Exchange of articles/jwellery/utencils etc,
+- Withdrawal of pending litigations, and
+- Any other term to which the parties are consenting]
+
+7. That the petitioners due hereby declare and confirm that this petition preferred by them is not collusive.
+
+8. That there is no coercion, force, fraud, undue influence, misrepresentation etc. in filing the present petition, and our consent is free.
+
+9. That there is no collusion or connivance between the parties in filing this petition.
+
+10. That this Court has jurisdiction to try and decide this petition as
+[Mention clearly how this court has jurisdiction.
+- Whether the marriage was solemnized at Mumbai.
+- That the parties lastly stayed together at Mumbai.
+- The wife is staying at Mumbai.
+- Any other reason supported by document.]
+
+11. That the court fee of Rs. 100 is affixed.
+
+12. The petitioners will rely upon the documents, a list whereof is annexed herewith.
+
+13. The petitioners pray that;
+a) This Hon'ble court be pleased to dissolve the marriage between the petitioners, solemnized on ….............. by the decree of divorce by mutual consent under section ….............................
+b) Such other and further relief's as this Hon'ble Court may deem fit and proper in the nature and circumstances of the case;
+
+VERIFICATION
+
+I …............................. age :....................... years, residing at ….......... the petitioner no. 1 do hereby solemnly declare that what is stated in the foregoing paragraphs of the petition is true to best of my own knowledge and belief save and except for the legal submission.
+
+Solemnly Declared at ….........
+On this ….....................(Date)
+Signature of the petitioner no. 1
+
+Advocate
+
+I …............................. age :....................... years, residing at …......... ..the petitioner no. 2 do hereby solemnly declare that what is stated in the foregoing paragraphs of the petition is true to best of my own knowledge and belief save and except for the legal submission.
+
+Solemnly Declared at ….........
+On this ….....................(Date)
+Signature of the petitioner no. 2
+
+Advocate
+
+Documents to be attached:
+- ID proof of both the parties (Copy of Pan Card/ Driving license /Adhar Card / Election Card/ Passport).
+- Marriage proof (Marriage Registration Certificate/ Invitation Card/ Marriage Photograph/ Affidavit of blood relative) (Minimum two documents mandatory).
+- Residential proof (Passport/ Adhar Card/ Election Card/ any other permissable document).
+
+Additional Documents if required:
+- Birth Certificate of minor child.
+- Registered document for transfer of property.
+- Copy of receipt if articles, jwellery, or utencils are exchanged.""",
+
+    "rental_agreement": """RENT AGREEMENT
+
+THIS RENT AGREEMENT is made on this __ day of ______, 20__ at _______ BETWEEN ________________ S/o, D/o, W/o __________________, Residing at ___________________ (hereinafter referred to as the "LESSOR") of the ONE PART.
+
+AND
+
+_________________ S/o, D/o, W/o __________________, Residing at ___________________ (hereinafter referred to as the "LESSEE") of the OTHER PART.
+
+The terms "LESSOR" and "LESSEE" shall mean and include their respective heirs, successors, assigns, representatives, etc.
+
+WHEREAS the LESSOR is the absolute owner of the residential/commercial premises bearing No._____________ consisting of ______ situated at _____________ (hereinafter referred to as the "SCHEDULE PREMISES").
+
+AND WHEREAS the LESSEE has approached the LESSOR and requested to let out the SCHEDULE PREMISES for a period of _____ months/years commencing from __________ for residential/commercial purpose, and the LESSOR has agreed to the same on the following terms and conditions.
+
+NOW THIS RENT AGREEMENT WITNESSETH AS FOLLOWS:
+
+1. RENT:
+   The LESSEE shall pay to the LESSOR rent at the rate of Rs.______ (Rupees ______________ only) per month, payable in advance on or before the ___ day of each English Calendar month.
+
+2. DURATION:
+   This Agreement shall be for a period of ____ months/years commencing from __________ and ending on __________. This Agreement may be renewed for another term by mutual consent of both the parties on such terms and conditions as may be agreed upon by them.
+
+3. SECURITY DEPOSIT:
+   The LESSEE has paid to the LESSOR a sum of Rs.______ (Rupees ______________ only) as interest-free refundable security deposit, which shall be refunded by the LESSOR to the LESSEE at the time of vacating the SCHEDULE PREMISES, after deducting therefrom any arrears of rent, electricity, water charges or any other charges payable by the LESSEE under this Agreement or any damages caused to the SCHEDULE PREMISES by the LESSEE.
+
+4. PAYMENT OF ELECTRICITY AND WATER CHARGES:
+   The LESSEE shall pay the electricity and water charges as per the respective meter readings on the due dates to the concerned authorities directly.
+
+5. MAINTENANCE CHARGES:
+   The LESSEE shall pay the monthly maintenance charges of Rs.______ (Rupees ______________ only) to the [Society/Building/Corporation] directly.
+
+6. USE OF PREMISES:
+   The LESSEE shall use the SCHEDULE PREMISES for residential/commercial purpose only and shall not use it for any illegal or immoral purposes. The LESSEE shall not cause any nuisance or annoyance to the neighbors.
+
+7. REPAIRS AND MAINTENANCE:
+   The LESSEE shall keep the SCHEDULE PREMISES in good and tenantable condition and shall be responsible for minor repairs. Any major structural repairs shall be the responsibility of the LESSOR.
+
+8. SUB-LETTING:
+   The LESSEE shall not sub-let, sub-lease, or assign the SCHEDULE PREMISES or any part thereof to any third party under any circumstances without the prior written consent of the LESSOR.
+
+9. INSPECTION:
+   The LESSOR or his authorized representative shall have the right to inspect the SCHEDULE PREMISES after giving reasonable notice to the LESSEE.
+
+10. TERMINATION:
+    Either party may terminate this Agreement by giving ____ months' notice in writing to the other party.
+
+11. RETURN OF SCHEDULE PREMISES:
+    On the expiry of the term of this Agreement or its earlier termination, the LESSEE shall peacefully and quietly deliver vacant possession of the SCHEDULE PREMISES to the LESSOR in the same condition as it was at the time of taking possession, subject to natural wear and tear.
+
+12. JURISDICTION:
+    Any dispute arising out of this Agreement shall be subject to the jurisdiction of the Courts in ___________.
+
+IN WITNESS WHEREOF the parties hereto have set their hands to this Rent Agreement on the day, month and year first above written.
+
+LESSOR                                      LESSEE
+
+_________________                          _________________
+(Signature)                                (Signature)
+
+WITNESSES:
+
+1. ________________                        2. ________________
+   (Signature)                                (Signature)
+   Name:                                      Name:
+   Address:                                   Address:"""
+}
+
+# Phrases that mark each template type, used by the local document type classifier
+DOCUMENT_KEYWORDS = {
+    "divorce_petition": [
+        "divorce", "mutual consent", "family court", "dissolution of marriage", "hindu marriage act",
+        "section 13b", "petitioner", "decree of divorce",
+    ],
+    "rental_agreement": [
+        "rent agreement", "rental agreement", "lease", "lessor", "lessee", "tenant", "landlord",
+        "monthly rent", "security deposit",
+    ],
+}
+
+# Map step of the long-document mode: one part of the document, checked against its own BNS context
+LONG_DOCUMENT_MAP_PROMPT = """
+    You are a highly skilled legal assistant specializing in Indian law. You are reviewing PART {index} of {total} ({pages}) of a {doc_label}.
+    Analyze this part STRICTLY against Bharatiya Nyaya Sanhita (BNS) provisions and Indian law:
+
+    === BNS LEGAL CONTEXT ===
+    {legal_context}
+
+    === DOCUMENT PART {index} OF {total} ===
+    {text}
+
+    Provide your output as a single JSON object with these fields:
+    - "summary": two or three sentences on what this part covers, naming parties and key terms (string)
+    - "discrepancies": missing mandatory content, wrong statutory references or inconsistencies in this part, citing the clause number (list of strings)
+    - "incorrect_clauses": legally incorrect, outdated or unenforceable clauses in this part, with the reason (list of strings)
+    - "corrected_clauses": a compliant replacement for each incorrect clause (list of strings)
+    - "missing_clauses": leave empty; missing clauses are judged for the whole document (list of strings)
+    - "draft": leave empty (string)
+    """
+
+# Reduce step of the long-document mode: merge the per-part findings and draft from them
+LONG_DOCUMENT_REDUCE_PROMPT = """
+    You are a highly skilled legal assistant specializing in Indian law. A {doc_label} too long to review in one pass was reviewed in {total} parts against Bharatiya Nyaya Sanhita (BNS) provisions. Using the part summaries and findings below, produce the final analysis of the WHOLE document.
+
+    === BNS LEGAL CONTEXT ===
+    {legal_context}
+
+    === OPENING OF THE DOCUMENT ===
+    {opening}
+
+    === PART SUMMARIES ===
+    {summaries}
+
+    === FINDINGS FROM THE PARTS ===
+    Discrepancies:
+    {discrepancies}
+
+    Incorrect clauses:
+    {incorrect_clauses}
+
+    Suggested corrections:
+    {corrected_clauses}
+
+    Perform these tasks:
+    1. Summarize the whole document in one concise paragraph.
+    2. Merge the findings: remove duplicates, keep the part references, and resolve conflicting suggestions.
+    3. Identify clauses missing from the document as a whole that are mandatory or advisable under Indian law.
+    4. {draft_instruction} Apply the corrected clauses and add the missing ones.
+
+    {output_format}
+    """
@@ -0,0 +1,110 @@
+"""Optional cross-encoder rerank stage between retrieval and the prompt.
+
+With ``RERANK_MODE=on`` retrieval over-fetches ``RERANK_CANDIDATES`` matches,
+scores every (query, chunk) pair in one batch with a small local cross-encoder
+(``RERANKER_MODEL``, default ms-marco-MiniLM-L-6-v2, run on CPU) and keeps the
+chunks scoring at least ``RERANK_MIN_SCORE``, between ``RERANK_MIN_KEEP`` and
+``top_k`` of them. Fewer, better chunks go into the prompt.
+
+``RERANK_MODE=adaptive`` does the same but skips the cross-encoder when the
+dense ranking is already decisive: the best dense score is at least
+``RERANK_SKIP_SCORE`` and leads the runner-up by ``RERANK_SKIP_MARGIN``.
+Batch latency is bounded by truncating passages to ``RERANK_MAX_CHARS`` and
+capping the candidate count.
+"""
+from telemetry import span
+from resources import get_config, get_resource
+from vector_store import plain_match
+
+DEFAULT_RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+DEFAULT_CANDIDATES = 30
+DEFAULT_MIN_SCORE = 0.1  # sigmoid relevance in [0, 1]; _build_reranker sets the activation
+DEFAULT_MIN_KEEP = 3
+DEFAULT_SKIP_SCORE = 0.6
+DEFAULT_SKIP_MARGIN = 0.1
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_CHARS = 1000
+MAX_SEQUENCE_LENGTH = 256
+
+
+def rerank_mode(config=None):
+    """Return the configured rerank mode: "off" (default), "on" or "adaptive"."""
+    config = config or get_config()
+    return (config.get("RERANK_MODE") or "off").lower()
+
+
+def rerank_candidates(top_k, config=None):
+    """Matches to retrieve before reranking down to at most `top_k`."""
+    config = config or get_config()
+    if rerank_mode(config) == "off":
+        return top_k
+    return max(top_k, int(config.get("RERANK_CANDIDATES") or DEFAULT_CANDIDATES))
+
+
+def _build_reranker(config):
+    if (config.get("EMBEDDING_BACKEND") or "").lower() == "standin":
+        from standins import StandInCrossEncoder
+        return StandInCrossEncoder()
+    import torch
+    from sentence_transformers import CrossEncoder
+    model = CrossEncoder(config.get("RERANKER_MODEL") or DEFAULT_RERANKER_MODEL, max_length=MAX_SEQUENCE_LENGTH,
+                         device="cpu")
+    # The ms-marco checkpoints emit logits, and whether predict() applies a sigmoid depends on the library
+    # version and the model config. RERANK_MIN_SCORE is a probability, so the sigmoid is set explicitly
+    # (the attribute is activation_fn from sentence-transformers 4, default_activation_function before).
+    for attribute in ("activation_fn", "default_activation_function"):
+        if hasattr(model, attribute):
+            setattr(model, attribute, torch.nn.Sigmoid())
+    return model
+
+
+def get_reranker():
+    """Return the shared cross-encoder."""
+    return get_resource("reranker", _build_reranker, ("RERANKER_MODEL", "EMBEDDING_BACKEND"))
+
+
+def dense_is_decisive(dense_matches, config=None):
+    """Whether the dense ranking is clear enough to skip reranking in adaptive mode."""
+    config = config or get_config()
+    if not dense_matches:
+        return True
+    scores = sorted((match["score"] for match in dense_matches), reverse=True)
+    runner_up = scores[1] if len(scores) > 1 else float("-inf")
+    return (scores[0] >= float(config.get("RERANK_SKIP_SCORE") or DEFAULT_SKIP_SCORE)
+            and scores[0] - runner_up >= float(config.get("RERANK_SKIP_MARGIN") or DEFAULT_SKIP_MARGIN))
+
+
+def rerank(query, matches, top_k, dense_matches=None):
+    """Rerank candidate matches for `query`, keeping the relevant ones (at most `top_k`).
+
+    `dense_matches` carry the raw dense scores used by the adaptive skip; fused
+    matches only hold rank-based scores. Without reranking the first `top_k`
+    candidates are returned unchanged. Matches marked ``"cited"`` (chunks of a
+    section the query names) keep their places at the front and are not scored.
+    """
+    config = get_config()
+    mode = rerank_mode(config)
+    if mode == "off" or not query or not matches:
+        return matches[:top_k]
+    if mode == "adaptive" and dense_is_decisive(dense_matches if dense_matches is not None else matches, config):
+        with span("rerank", candidates=len(matches), chunks=min(top_k, len(matches)), skipped=True):
+            return matches[:top_k]
+
+    pinned = [match for match in matches if hasattr(match, "get") and match.get("cited")][:top_k]
+    matches = [plain_match(match) for match in matches if not (hasattr(match, "get") and match.get("cited"))]
+    if not matches or len(pinned) >= top_k:
+        return pinned
+    top_k -= len(pinned)
+    max_chars = int(config.get("RERANK_MAX_CHARS") or DEFAULT_MAX_CHARS)
+    min_score = float(config.get("RERANK_MIN_SCORE") or DEFAULT_MIN_SCORE)
+    min_keep = int(config.get("RERANK_MIN_KEEP") or DEFAULT_MIN_KEEP)
+    with span("rerank", candidates=len(matches), skipped=False) as s:
+        pairs = [(query, match["metadata"].get("text", "")[:max_chars]) for match in matches]
+        scores = get_reranker().predict(pairs, batch_size=int(config.get("RERANK_BATCH_SIZE") or DEFAULT_BATCH_SIZE),
+                                        show_progress_bar=False)
+        ranked = sorted(zip(matches, map(float, scores)), key=lambda pair: pair[1], reverse=True)
+        kept = [dict(match, score=score) for match, score in ranked[:top_k] if score >= min_score]
+        if len(kept) < min_keep:
+            kept = [dict(match, score=score) for match, score in ranked[:min(min_keep, top_k)]]
+        s.set(chunks=len(kept), top_score=round(ranked[0][1], 4), cited=len(pinned))
+    return pinned + kept
@@ -0,0 +1,362 @@
+"""Process-wide registry for the embedding model, vector index and Gemini clients.
+
+Streamlit re-executes the app script on every interaction, but imported modules
+stay loaded for the life of the server process. Heavy objects built through this
+module are therefore created once and shared by every session. Each resource is
+tagged with the config values it was built from, so editing key.env rebuilds
+only the resources whose settings changed.
+"""
+import os
+import json
+import time
+import logging
+import hashlib
+import datetime
+import threading
+from dotenv import dotenv_values
+
+ENV_FILE = "key.env"
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L12-v2"
+DEFAULT_GEMINI_MODEL = "gemini-2.0-flash"
+
+logger = logging.getLogger(__name__)
+
+_config_lock = threading.Lock()
+_config_cache = {"stamp": None, "values": {}}
+_config_overrides = {}
+
+_registry_lock = threading.Lock()
+_resource_locks = {}
+_resources = {}  # name -> (fingerprint, value)
+_load_timings = {}  # name -> seconds spent in the last load
+
+
+def file_stamp(path):
+    """Return a cheap change marker for a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def get_config(env_file=ENV_FILE):
+    """Return the merged configuration from the process environment and key.env.
+
+    As with ``load_dotenv``, variables already set in the environment take
+    precedence over key.env; edits to the file's other values are picked up
+    without restarting the server. Values set with set_config_overrides()
+    take precedence over both. The file is only re-read when it changes.
+    """
+    stamp = file_stamp(env_file)
+    with _config_lock:
+        if _config_cache["stamp"] != stamp or not _config_cache["values"]:
+            file_values = dotenv_values(env_file) if stamp is not None else {}
+            values = {k: v for k, v in file_values.items() if v is not None}
+            values.update(os.environ)
+            values.update(_config_overrides)
+            _config_cache["stamp"] = stamp
+            _config_cache["values"] = values
+        return _config_cache["values"]
+
+
+def set_config_overrides(overrides):
+    """Force config values for this process, e.g. to select stand-in backends for a benchmark."""
+    with _config_lock:
+        _config_overrides.update(overrides)
+        _config_cache["values"] = {}
+
+
+def _lock_for(name):
+    with _registry_lock:
+        return _resource_locks.setdefault(name, threading.Lock())
+
+
+def get_resource(name, factory, config_keys=(), extra_key=None, close=None):
+    """Return the shared resource `name`, building it with `factory(config)` if needed.
+
+    The resource is rebuilt whenever any of `config_keys` (or `extra_key`)
+    differs from the values it was last built with. `close(old)`, if given,
+    releases the replaced value once its successor is in place.
+    """
+    config = get_config()
+    fingerprint = (tuple(config.get(key) for key in config_keys), extra_key)
+
+    entry = _resources.get(name)
+    if entry is not None and entry[0] == fingerprint:
+        return entry[1]
+
+    with _lock_for(name):
+        # Another session may have finished loading while we waited.
+        entry = _resources.get(name)
+        if entry is not None and entry[0] == fingerprint:
+            return entry[1]
+
+        action = "Reloading" if entry is not None else "Loading"
+        start = time.perf_counter()
+        value = factory(config)
+        elapsed = time.perf_counter() - start
+        _resources[name] = (fingerprint, value)
+        _load_timings[name] = elapsed
+        logger.info("%s resource '%s' took %.2fs", action, name, elapsed)
+        if entry is not None and close is not None:
+            try:
+                close(entry[1])
+            except Exception as e:
+                logger.warning("Failed to close the replaced resource '%s': %s", name, e)
+        return value
+
+
+def clear_resources():
+    """Drop every cached resource so the next access rebuilds it."""
+    with _registry_lock:
+        _resources.clear()
+        _load_timings.clear()
+
+
+def load_timings():
+    """Return the last load duration in seconds for each resource."""
+    return dict(_load_timings)
+
+
+def _build_embedding_model(config):
+    from embedding_engine import build_embedding_engine, wrap_model
+    if (config.get("EMBEDDING_BACKEND") or "").lower() == "standin":
+        from standins import StandInEmbedder
+        return wrap_model(StandInEmbedder(), config, "standin")
+    return build_embedding_engine(config, config.get("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODEL)
+
+
+def _build_pinecone_index(config):
+    from pinecone import Pinecone
+    pc = Pinecone(api_key=config.get("PINECONE_API_KEY"))
+    return pc.Index(config.get("PINECONE_INDEX"))
+
+
+def _configure_genai(config):
+    if llm_backend(config) == "standin":
+        from standins import StandInGenAI, DEFAULT_LATENCY, DEFAULT_TOKENS_PER_SECOND, load_responses
+        return StandInGenAI(
+            latency=float(config.get("STANDIN_LATENCY") or DEFAULT_LATENCY),
+            tokens_per_second=float(config.get("STANDIN_TOKENS_PER_SECOND") or DEFAULT_TOKENS_PER_SECOND),
+            responses=load_responses(config.get("STANDIN_RESPONSES_FILE")),
+        )
+    import google.generativeai as genai
+    genai.configure(api_key=config.get("GEMINI_API_KEY"))
+    return genai
+
+
+def get_embedding_model():
+    """Return the shared embedding engine used for queries and ingestion (see embedding_engine)."""
+    return get_resource(
+        "embedding_model",
+        _build_embedding_model,
+        ("EMBEDDING_MODEL", "EMBEDDING_BACKEND", "EMBEDDING_ENGINE", "EMBEDDING_THREADS", "ONNX_MODEL_FILE",
+         "EMBEDDING_BATCH_WAIT_MS", "EMBEDDING_MAX_BATCH"),
+        close=lambda engine: engine.close(),
+    )
+
+
+def get_embedding_cache():
+    """Return the shared LRU cache of query embeddings, or None when EMBEDDING_CACHE_SIZE is 0.
+
+    It is loaded from EMBEDDING_CACHE_PATH and warmed with the document-type
+    retrieval queries when built, and saved again at exit.
+    """
+    def build(config):
+        import atexit
+        from prompts import DOCUMENT_QUERY_TERMS
+        from embedding_cache import EmbeddingCache, DEFAULT_DTYPE, DEFAULT_CACHE_PATH, DEFAULT_PERSIST_ENTRIES
+        engine = "standin" if (config.get("EMBEDDING_BACKEND") or "").lower() == "standin" else (
+            config.get("EMBEDDING_ENGINE") or "torch").lower()
+        cache = EmbeddingCache(
+            max_entries=max_entries,
+            dtype=config.get("EMBEDDING_CACHE_DTYPE") or DEFAULT_DTYPE,
+            path=config.get("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH) or None,
+            model_key=f"{config.get('EMBEDDING_MODEL') or DEFAULT_EMBEDDING_MODEL}:{engine}",
+            persist_entries=int(config.get("EMBEDDING_CACHE_PERSIST") or DEFAULT_PERSIST_ENTRIES),
+        )
+        cache.warm(DOCUMENT_QUERY_TERMS.values(), get_embedding_model())
+        atexit.register(cache.save)
+        return cache
+
+    from embedding_cache import DEFAULT_MAX_ENTRIES
+    size = get_config().get("EMBEDDING_CACHE_SIZE")
+    max_entries = int(size) if size not in (None, "") else DEFAULT_MAX_ENTRIES
+    if max_entries <= 0:
+        return None
+    return get_resource(
+        "embedding_cache",
+        build,
+        ("EMBEDDING_CACHE_SIZE", "EMBEDDING_CACHE_DTYPE", "EMBEDDING_CACHE_PATH", "EMBEDDING_CACHE_PERSIST",
+         "EMBEDDING_MODEL", "EMBEDDING_BACKEND", "EMBEDDING_ENGINE"),
+    )
+
+
+def get_index():
+    """Return the shared Pinecone index handle."""
+    return get_resource("pinecone_index", _build_pinecone_index, ("PINECONE_API_KEY", "PINECONE_INDEX"))
+
+
+def vector_backend(config=None):
+    """Return the configured vector backend name: "pinecone" (default), "local" or "standin"."""
+    config = config or get_config()
+    return (config.get("VECTOR_BACKEND") or "pinecone").lower()
+
+
+def llm_backend(config=None):
+    """Return the configured generation backend name: "gemini" (default) or "standin"."""
+    config = config or get_config()
+    return (config.get("LLM_BACKEND") or "gemini").lower()
+
+
+def _store_dir(config):
+    from vector_store import DEFAULT_STORE_DIR
+    return config.get("VECTOR_STORE_DIR") or DEFAULT_STORE_DIR
+
+
+def index_version(config=None):
+    """Return the current version of the configured vector index, or None if it has none.
+
+    The local store's version is read from its manifest on disk, so a re-ingest
+    by another process is seen without waiting for this process to reload.
+    """
+    config = config or get_config()
+    if vector_backend(config) == "local":
+        from vector_store import read_manifest
+        return read_manifest(_store_dir(config)).get("version")
+    return getattr(get_vector_store(), "version", None)
+
+
+def get_vector_store():
+    """Return the shared vector store selected by VECTOR_BACKEND.
+
+    Both backends answer ``query(vector=..., top_k=..., include_metadata=True)``
+    with Pinecone-shaped ``matches``. The local store is reloaded when its
+    manifest changes, e.g. after ingest.py wrote a new version.
+    """
+    def build(config):
+        from vector_store import LocalVectorStore, PineconeStore, DEFAULT_NPROBE
+        if vector_backend(config) == "standin":
+            from standins import StandInVectorIndex, DEFAULT_CORPUS_SIZE, DEFAULT_VECTOR_LATENCY
+            return StandInVectorIndex(
+                size=int(config.get("STANDIN_CORPUS_SIZE") or DEFAULT_CORPUS_SIZE),
+                latency=float(config.get("STANDIN_VECTOR_LATENCY") or DEFAULT_VECTOR_LATENCY),
+            )
+        if vector_backend(config) == "local":
+            return LocalVectorStore(
+                directory=_store_dir(config),
+                mode=config.get("VECTOR_SEARCH_MODE") or "exact",
+                nprobe=int(config.get("VECTOR_NPROBE") or DEFAULT_NPROBE),
+            )
+        return PineconeStore(get_index(), version=config.get("PINECONE_INDEX_VERSION"))
+
+    config = get_config()
+    manifest_stamp = None
+    if vector_backend(config) == "local":
+        from vector_store import MANIFEST_FILE
+        manifest_stamp = file_stamp(os.path.join(_store_dir(config), MANIFEST_FILE))
+    return get_resource(
+        "vector_store",
+        build,
+        ("VECTOR_BACKEND", "VECTOR_STORE_DIR", "VECTOR_SEARCH_MODE", "VECTOR_NPROBE",
+         "PINECONE_API_KEY", "PINECONE_INDEX", "PINECONE_INDEX_VERSION",
+         "STANDIN_CORPUS_SIZE", "STANDIN_VECTOR_LATENCY"),
+        extra_key=manifest_stamp,
+    )
+
+
+def get_genai():
+    """Return the google.generativeai module configured with the current API key (or its stand-in)."""
+    return get_resource(
+        "genai",
+        _configure_genai,
+        ("GEMINI_API_KEY", "LLM_BACKEND", "STANDIN_LATENCY", "STANDIN_TOKENS_PER_SECOND", "STANDIN_RESPONSES_FILE"),
+    )
+
+
+def get_generative_model(generation_config, system_instruction=None):
+    """Return a shared Gemini model for the given generation config and system instruction.
+
+    When PROMPT_CACHE_TTL is set the system instruction is stored once as a
+    Gemini cached context and the model is bound to that handle. The cache is
+    recreated every half TTL. If caching is unavailable (for example the
+    instruction is below the model's minimum cacheable size) the instruction is
+    sent as a plain system instruction instead.
+    """
+    cache_ttl = float(get_config().get("PROMPT_CACHE_TTL") or 0)
+
+    def build(config):
+        genai = get_genai()
+        model_name = config.get("GEMINI_MODEL") or DEFAULT_GEMINI_MODEL
+        if system_instruction and cache_ttl:
+            try:
+                cached_content = genai.caching.CachedContent.create(
+                    model=model_name,
+                    system_instruction=system_instruction,
+                    ttl=datetime.timedelta(seconds=cache_ttl),
+                )
+                return genai.GenerativeModel.from_cached_content(
+                    cached_content=cached_content,
+                    generation_config=generation_config,
+                )
+            except Exception as e:
+                logger.warning("Context caching unavailable, using a system instruction instead: %s", e)
+        return genai.GenerativeModel(
+            model_name=model_name,
+            generation_config=generation_config,
+            system_instruction=system_instruction,
+        )
+
+    config_key = json.dumps(generation_config, sort_keys=True)
+    instruction_key = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()[:16] if system_instruction else None
+    refresh_bucket = int(time.time() // (cache_ttl / 2)) if system_instruction and cache_ttl else None
+    return get_resource(
+        f"generative_model:{config_key}:{instruction_key}",
+        build,
+        ("GEMINI_API_KEY", "GEMINI_MODEL", "PROMPT_CACHE_TTL", "LLM_BACKEND",
+         "STANDIN_LATENCY", "STANDIN_TOKENS_PER_SECOND", "STANDIN_RESPONSES_FILE"),
+        extra_key=refresh_bucket,
+    )
+
+
+def get_upload_cache():
+    """Return the shared content-hash cache of files uploaded to Gemini."""
+    def build(config):
+        from upload_cache import UploadCache, DEFAULT_TTL_SECONDS, DEFAULT_MAX_ENTRIES
+        genai = get_genai()
+        return UploadCache(
+            upload_fn=genai.upload_file,
+            delete_fn=lambda remote_file: genai.delete_file(remote_file.name),
+            ttl_seconds=float(config.get("UPLOAD_CACHE_TTL") or DEFAULT_TTL_SECONDS),
+            max_entries=int(config.get("UPLOAD_CACHE_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES),
+        )
+
+    return get_resource(
+        "upload_cache",
+        build,
+        ("GEMINI_API_KEY", "LLM_BACKEND", "UPLOAD_CACHE_TTL", "UPLOAD_CACHE_MAX_ENTRIES"),
+    )
+
+
+def get_answer_cache():
+    """Return the shared semantic cache of Legal Query Assistant answers, saved again at exit."""
+    def build(config):
+        import atexit
+        from answer_cache import (SemanticAnswerCache, DEFAULT_THRESHOLD, DEFAULT_MAX_ENTRIES,
+                                  DEFAULT_TTL_SECONDS, DEFAULT_CACHE_PATH)
+        cache = SemanticAnswerCache(
+            threshold=float(config.get("ANSWER_CACHE_THRESHOLD") or DEFAULT_THRESHOLD),
+            max_entries=int(config.get("ANSWER_CACHE_MAX_ENTRIES") or DEFAULT_MAX_ENTRIES),
+            ttl_seconds=float(config.get("ANSWER_CACHE_TTL") or DEFAULT_TTL_SECONDS),
+            path=config.get("ANSWER_CACHE_PATH", DEFAULT_CACHE_PATH) or None,
+            model_name=config.get("EMBEDDING_MODEL") or DEFAULT_EMBEDDING_MODEL,
+        )
+        atexit.register(cache.save)
+        return cache
+
+    return get_resource(
+        "answer_cache",
+        build,
+        ("ANSWER_CACHE_THRESHOLD", "ANSWER_CACHE_MAX_ENTRIES", "ANSWER_CACHE_TTL", "ANSWER_CACHE_PATH", "EMBEDDING_MODEL"),
+    )
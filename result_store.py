@@ -0,0 +1,266 @@
+"""Durable store of finished validations, keyed by everything that produced them.
+
+Validating the same PDF again used to repeat the upload, the retrieval and
+the whole generation. Finished validations are now kept in a SQLite database
+(``RESULT_STORE_PATH``, default validation_results.sqlite3; empty disables it)
+under a key with five parts:
+
+    digest           SHA-256 of the PDF content
+    doc_type         the type detected for it
+    prompt_version   a hash of the validation prompt for that type, the analysis
+                     message, the long-document prompts and the generation settings
+    model            the Gemini model name (or "standin")
+    index_version    the vector index's version (the local store's is read from its manifest)
+
+A lookup needs only the digest: rows whose other parts do not match the
+running configuration are skipped, so a prompt edit, another model or a
+re-ingested index never serves an old result. They are left in place, since
+another process sharing the database may still be running that configuration;
+``purge --stale`` deletes them, and LRU eviction drops them once unused. Stores without a version (Pinecone unless PINECONE_INDEX_VERSION
+is set) keep results for ``RESULT_STORE_TTL`` seconds instead (default a day).
+Only complete results are stored: a cut-off response or one without a summary
+or draft is not kept (see DocumentAnalysis.is_complete). The database is held
+under ``RESULT_STORE_MB`` (default 256) by evicting the least recently used
+results.
+
+Administration:
+    python result_store.py stats
+    python result_store.py list [--limit 20]
+    python result_store.py purge (--all | --stale | --digest SHA256 | --older-than DAYS)
+"""
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from contextlib import contextmanager
+
+from resources import DEFAULT_GEMINI_MODEL, get_config, get_resource, index_version as read_index_version, llm_backend
+
+DEFAULT_STORE_PATH = "validation_results.sqlite3"
+DEFAULT_MAX_MB = 256
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    digest TEXT NOT NULL,
+    doc_type TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    index_version TEXT NOT NULL,
+    name TEXT,
+    text TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    docx BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (digest, doc_type, prompt_version, model, index_version)
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+"""
+
+
+def prompt_version(doc_type):
+    """Hash of everything in the prompt that is not retrieved context, for one document type."""
+    from prompts import LONG_DOCUMENT_MAP_PROMPT, LONG_DOCUMENT_REDUCE_PROMPT
+    from legal_engine import ANALYSIS_MESSAGE, build_document_prompt, generation_config, structured_output
+    structured = structured_output()
+    parts = [build_document_prompt(doc_type, "", structured=structured), ANALYSIS_MESSAGE,
+             LONG_DOCUMENT_MAP_PROMPT, LONG_DOCUMENT_REDUCE_PROMPT, json.dumps(generation_config, sort_keys=True)]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def current_versions(config=None):
+    """Return ``(model, index_version)`` for the running configuration; "" means an unversioned index."""
+    config = config or get_config()
+    model = "standin" if llm_backend(config) == "standin" else config.get("GEMINI_MODEL") or DEFAULT_GEMINI_MODEL
+    version = read_index_version(config)
+    return model, "" if version is None else str(version)
+
+
+class ResultStore:
+    """SQLite table of validation results with LRU eviction by total size.
+
+    Each call opens its own connection, so the store can be used from any thread.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, max_bytes=DEFAULT_MAX_MB * 1024 * 1024,
+                 ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()  # serializes writers within this process
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:  # commits, or rolls back on an error
+                yield conn
+        finally:
+            conn.close()
+
+    def _is_current(self, row, model, index_version, now):
+        if row["model"] != model or row["index_version"] != index_version:
+            return False
+        if not index_version and now - row["created_at"] >= self.ttl_seconds:
+            return False
+        return row["prompt_version"] == prompt_version(row["doc_type"])
+
+    def lookup(self, digest, model, index_version):
+        """Return the stored result for a PDF under the current prompt, model and index, or None.
+
+        The result is a dict with doc_type, text, analysis (a DocumentAnalysis)
+        and docx (bytes). Rows for the same PDF produced under anything else
+        are skipped.
+        """
+        from analysis_result import DocumentAnalysis
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT rowid, * FROM results WHERE digest = ? ORDER BY last_used DESC",
+                                (digest,)).fetchall()
+            found = next((row for row in rows if self._is_current(row, model, index_version, now)), None)
+            if found is None:
+                return None
+            conn.execute("UPDATE results SET hits = hits + 1, last_used = ? WHERE rowid = ?", (now, found["rowid"]))
+        return {"doc_type": found["doc_type"], "text": found["text"],
+                "analysis": DocumentAnalysis.from_dict(json.loads(found["analysis"])), "docx": bytes(found["docx"])}
+
+    def put(self, digest, doc_type, model, index_version, text, analysis, docx, name=None):
+        """Store a finished validation, then evict the least recently used results over the size bound.
+
+        Returns False without storing anything when the analysis is incomplete.
+        """
+        if not analysis.is_complete() or not docx:
+            print(f"Not storing the incomplete validation of {name or digest[:12]}")
+            return False
+        analysis_json = json.dumps(analysis.to_dict(), ensure_ascii=False)
+        size = len(text.encode("utf-8")) + len(analysis_json.encode("utf-8")) + len(docx)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (digest, doc_type, prompt_version, model, index_version, name, text, "
+                "analysis, docx, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, doc_type, prompt_version(doc_type), model, index_version, name, text, analysis_json,
+                 sqlite3.Binary(docx), size, now, now))
+            self._evict(conn)
+        return True
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT rowid, size FROM results ORDER BY last_used").fetchall()
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM results WHERE rowid = ?", (rowid,))
+            total -= size
+
+    def entries(self, limit=None):
+        """Return the stored results without their payloads, most recently used first."""
+        query = ("SELECT digest, doc_type, prompt_version, model, index_version, name, size, created_at, last_used, "
+                 "hits FROM results ORDER BY last_used DESC")
+        with self._connect() as conn:
+            rows = conn.execute(query + (" LIMIT ?" if limit else ""), (limit,) if limit else ()).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        with self._connect() as conn:
+            count, size, hits = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM results").fetchone()
+        return {"entries": count, "megabytes": round(size / (1024 * 1024), 2), "hits": hits,
+                "max_megabytes": round(self.max_bytes / (1024 * 1024), 2)}
+
+    def purge(self, digest=None, older_than=None, stale=False, everything=False):
+        """Delete results by digest prefix, by age in seconds, those no longer current, or all; return the count.
+
+        The database file is compacted only when something was deleted.
+        """
+        with self._lock, self._connect() as conn:
+            if everything:
+                deleted = conn.execute("DELETE FROM results").rowcount
+            elif digest:
+                deleted = conn.execute("DELETE FROM results WHERE digest LIKE ?", (f"{digest}%",)).rowcount
+            elif older_than is not None:
+                deleted = conn.execute("DELETE FROM results WHERE last_used < ?",
+                                       (time.time() - older_than,)).rowcount
+            elif stale:
+                model, index_version = current_versions()
+                now = time.time()
+                deleted = 0
+                for row in conn.execute("SELECT rowid, * FROM results").fetchall():
+                    if not self._is_current(row, model, index_version, now):
+                        conn.execute("DELETE FROM results WHERE rowid = ?", (row["rowid"],))
+                        deleted += 1
+            else:
+                return 0
+        if deleted:
+            with self._connect() as conn:
+                conn.execute("VACUUM")
+        return deleted
+
+
+def get_result_store():
+    """Return the shared result store, or None when RESULT_STORE_PATH is empty."""
+    def build(config):
+        path = config.get("RESULT_STORE_PATH", DEFAULT_STORE_PATH)
+        if not path:
+            return None
+        return ResultStore(
+            path=path,
+            max_bytes=float(config.get("RESULT_STORE_MB") or DEFAULT_MAX_MB) * 1024 * 1024,
+            ttl_seconds=float(config.get("RESULT_STORE_TTL") or DEFAULT_TTL_SECONDS),
+        )
+
+    return get_resource("result_store", build, ("RESULT_STORE_PATH", "RESULT_STORE_MB", "RESULT_STORE_TTL"))
+
+
+def _format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and purge stored validation results.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="entry count, size and hits")
+    listing = commands.add_parser("list", help="stored results, most recently used first")
+    listing.add_argument("--limit", type=int, default=20)
+    purge = commands.add_parser("purge", help="delete results")
+    which = purge.add_mutually_exclusive_group(required=True)
+    which.add_argument("--all", action="store_true", help="delete every result")
+    which.add_argument("--stale", action="store_true",
+                       help="delete results for another prompt, model or index version (or expired)")
+    which.add_argument("--digest", help="delete the results for one PDF content hash (or a prefix of it)")
+    which.add_argument("--older-than", type=float, metavar="DAYS", help="delete results unused for DAYS days")
+    args = parser.parse_args(argv)
+
+    store = get_result_store()
+    if store is None:
+        print("The result store is disabled (RESULT_STORE_PATH is empty).")
+        return 1
+    if args.command == "stats":
+        print(json.dumps(store.stats(), indent=2))
+    elif args.command == "list":
+        for entry in store.entries(args.limit):
+            print(f"{entry['digest'][:12]}  {entry['doc_type']:<17} {entry['model']:<18} "
+                  f"index={entry['index_version'] or '-':<12} prompt={entry['prompt_version'][:8]}  "
+                  f"{entry['size'] / 1024:7.1f} KB  {entry['hits']:>4} hits  used {_format_time(entry['last_used'])}  "
+                  f"{entry['name'] or ''}")
+    else:
+        older_than = args.older_than * 24 * 60 * 60 if args.older_than is not None else None
+        deleted = store.purge(digest=args.digest, older_than=older_than, stale=args.stale, everything=args.all)
+        print(f"Deleted {deleted} results from {store.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
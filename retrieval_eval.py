@@ -0,0 +1,195 @@
+"""Compare dense-only, hybrid, hybrid + section-lookup and reranked retrieval on recall and latency.
+
+Usage:
+    python retrieval_eval.py (--queries eval.jsonl | --generated) [--samples 100] [--top-k 10] [--from-store]
+                             [--json out.json]
+
+The evaluation set is a --queries file of hand-labelled, held-out
+``{"query", "relevant": [ids]}`` lines. --generated instead builds queries
+from the lexical index itself: for sampled chunks, a "What does Section N of
+the BNS say?" query (relevant: every chunk of that section) and a verbatim
+eight-word phrase from the chunk (relevant: that chunk), plus the
+REFERENCE_QUERIES below, which cite a BNS section next to the word "act"
+without naming another statute. Those queries are
+answered by construction by the section lookup and BM25, so they are a sanity
+check that every mode runs and finds exact text, not a measure of recall on
+real questions. --from-store builds the lexical index in memory from the
+vector store's own metadata instead of lexical_index.json; only the local and
+stand-in stores can list their contents.
+
+Reports recall@k, where a query scores the share of its relevant chunks found
+(capped at k), the mean number of chunks returned (reranking keeps fewer) and
+p50/p95 latency including query embedding. The "+rerank" and "+adaptive" rows
+run the full retrieve_documents path with RERANK_MODE=on and =adaptive.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from benchmark import percentile
+from legal_engine import check_config, embed, fuse_lexical, retrieve_documents
+from lexical_index import DEFAULT_INDEX_PATH, LexicalIndex, section_references
+from resources import get_config, get_vector_store, set_config_overrides
+
+PHRASE_WORDS = 8
+# Queries that say "act" without naming another Act, with the BNS section each one cites.
+REFERENCE_QUERIES = [
+    ("Punishment under Section 106 for a rash or negligent act", "106"),
+    ("Is any act done under section 100 an offence", "100"),
+    ("Section 2 definition of act", "2"),
+]
+
+
+def generate_queries(index, samples=100, seed=0):
+    """Build section-reference and verbatim-phrase queries from the chunks in `index`."""
+    rng = random.Random(seed)
+    index_ids = list(index.documents)
+    chosen = rng.sample(index_ids, min(samples, len(index_ids)))
+    sections = {}
+    for chunk_id, metadata in index.documents.items():
+        if metadata.get("section"):
+            sections.setdefault(str(metadata["section"]).upper(), set()).add(chunk_id)
+
+    queries = []
+    for chunk_id in chosen:
+        metadata = index.documents[chunk_id]
+        section = str(metadata.get("section") or "").upper()
+        if section in sections:
+            queries.append({"kind": "section", "query": f"What does Section {section} of the BNS say?",
+                            "relevant": sorted(sections[section])})
+        words = metadata.get("text", "").split()
+        if len(words) >= PHRASE_WORDS:
+            start = rng.randrange(0, len(words) - PHRASE_WORDS + 1)
+            queries.append({"kind": "phrase", "query": " ".join(words[start:start + PHRASE_WORDS]),
+                            "relevant": [chunk_id]})
+    for query, section in REFERENCE_QUERIES:
+        if section in sections:
+            queries.append({"kind": "section", "query": query, "relevant": sorted(sections[section])})
+    return queries
+
+
+def check_section_references():
+    """Return the REFERENCE_QUERIES whose cited section the section lookup does not find."""
+    return [query for query, section in REFERENCE_QUERIES if section_references(query) != [section]]
+
+
+def read_queries(path):
+    with open(path, encoding="utf-8") as f:
+        return [dict({"kind": "file"}, **json.loads(line)) for line in f if line.strip()]
+
+
+def dense_only(query, top_k):
+    results = get_vector_store().query(vector=list(map(float, embed(query, cache=False))), top_k=top_k, include_metadata=True)
+    return results["matches"]
+
+
+def hybrid(query, top_k):
+    results = get_vector_store().query(vector=list(map(float, embed(query, cache=False))), top_k=top_k * 2, include_metadata=True)
+    return fuse_lexical(query, results["matches"], top_k, sections=False)
+
+
+def full_pipeline(query, top_k):
+    return retrieve_documents(query, top_k, query_embedding=embed(query, cache=False))
+
+
+# mode -> (retrieval function, config overrides applied while it runs). Every mode embeds the query
+# itself, bypassing the embedding cache, so no mode's latency is measured on an earlier mode's vector.
+MODES = {
+    "dense": (dense_only, {}),
+    "hybrid": (hybrid, {}),
+    "hybrid+sections": (full_pipeline, {"RERANK_MODE": "off"}),
+    "+rerank": (full_pipeline, {"RERANK_MODE": "on"}),
+    "+adaptive": (full_pipeline, {"RERANK_MODE": "adaptive"}),
+}
+
+
+def recall(matches, relevant, top_k):
+    found = {match["id"] for match in matches} & set(relevant)
+    return len(found) / min(len(relevant), top_k)
+
+
+def evaluate(queries, top_k=10, modes=MODES):
+    """Return ``{mode: {kind: {"recall", "chunks", "p50_ms", "p95_ms", "queries"}}}``, with an "all" kind per mode."""
+    report = {}
+    previous = {key: get_config().get(key) for _, overrides in modes.values() for key in overrides}
+    for mode, (retrieve, overrides) in modes.items():
+        set_config_overrides(overrides)
+        scores, counts, latencies = {}, {}, {}
+        for item in queries:
+            started = time.perf_counter()
+            matches = retrieve(item["query"], top_k)
+            elapsed = time.perf_counter() - started
+            for kind in (item["kind"], "all"):
+                scores.setdefault(kind, []).append(recall(matches, item["relevant"], top_k))
+                counts.setdefault(kind, []).append(len(matches))
+                latencies.setdefault(kind, []).append(elapsed)
+        report[mode] = {
+            kind: {
+                "queries": len(values),
+                "recall": round(sum(values) / len(values), 3),
+                "chunks": round(sum(counts[kind]) / len(values), 1),
+                "p50_ms": round(percentile(latencies[kind], 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies[kind], 95) * 1000, 2),
+            }
+            for kind, values in scores.items()
+        }
+    set_config_overrides(previous)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare dense-only and hybrid retrieval.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--queries", help="hand-labelled JSONL file of {query, relevant} objects")
+    source.add_argument("--generated", action="store_true",
+                        help="generate queries from the lexical index (a sanity check, not a recall measure)")
+    parser.add_argument("--samples", type=int, default=100, help="chunks sampled for the generated query set")
+    parser.add_argument("--top-k", type=int, default=10, help="matches retrieved per query")
+    parser.add_argument("--from-store", action="store_true", help="index the vector store's metadata in memory")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    check_config()
+    for query in check_section_references():
+        print(f"Section lookup misses the section cited in {query!r}.")
+    if args.from_store:
+        store = get_vector_store()
+        if not hasattr(store, "ids"):
+            print(f"--from-store needs a store that lists its contents; {type(store).__name__} does not. "
+                  "Build lexical_index.json with ingest.py instead.")
+            return 1
+        index = LexicalIndex(dict(zip(store.ids, store.metadata)), getattr(store, "version", None))
+        path = os.path.join(tempfile.mkdtemp(), "lexical_index.json")
+        index.save(path)
+        set_config_overrides({"LEXICAL_INDEX_PATH": path})
+    else:
+        index = LexicalIndex.load(get_config().get("LEXICAL_INDEX_PATH", DEFAULT_INDEX_PATH))
+    if not len(index):
+        print("No lexical index found. Run ingest.py first or pass --from-store.")
+        return 1
+
+    if args.queries:
+        queries = read_queries(args.queries)
+    else:
+        queries = generate_queries(index, args.samples)
+        print("Generated queries are answerable from the index by construction: a sanity check only, "
+              "not a recall estimate.")
+    report = evaluate(queries, args.top_k)
+
+    print(f"{'mode':<16} {'kind':<8} {'n':>5} {'recall@' + str(args.top_k):>10} {'chunks':>7} {'p50 ms':>9} {'p95 ms':>9}")
+    for mode, kinds in report.items():
+        for kind, stats in sorted(kinds.items()):
+            print(f"{mode:<16} {kind:<8} {stats['queries']:>5} {stats['recall']:>10} {stats['chunks']:>7} "
+                  f"{stats['p50_ms']:>9} {stats['p95_ms']:>9}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"queries": args.queries or "generated", "modes": report}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
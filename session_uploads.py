@@ -0,0 +1,127 @@
+"""Per-session handling of uploaded PDFs and their cached previews.
+
+The validator used to write every upload to ``Path(uploaded_file.name)`` in the
+working directory, so two users uploading "agreement.pdf" overwrote each other,
+and it re-read and base64-encoded the whole PDF for the preview on every
+Streamlit rerun. Now each session keeps its upload in memory up to
+``UPLOAD_SPOOL_MB`` (default 5) and in its own temporary directory above that.
+The validator sends ``read()``'s bytes to the engine service, which keeps its
+own copy per job. The directory is removed when the upload is replaced or
+cleared, when the session ends and at exit. Reruns with the same upload reuse
+it without re-reading it.
+
+The preview iframe is encoded once per content hash and shared by every
+session, in a cache bounded to ``PREVIEW_CACHE_MB`` (default 64) of HTML.
+"""
+import base64
+import shutil
+import hashlib
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+from resources import get_config, get_resource
+
+DEFAULT_SPOOL_MB = 5
+DEFAULT_PREVIEW_CACHE_MB = 64
+PREVIEW_TEMPLATE = ('<iframe src="data:application/pdf;base64,{data}" width="100%" height="500" '
+                    'style="border: none;"></iframe>')
+
+
+class SessionUpload:
+    """One uploaded file: its name, size and content hash, with the bytes in memory or on disk."""
+
+    def __init__(self, name, data, directory, spool_bytes):
+        self.name = name
+        self.size = len(data)
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.suffix = Path(name).suffix or ".pdf"
+        self._directory = directory
+        self._path = None
+        self._data = None
+        if self.size > spool_bytes:
+            self._path = self._write(data)
+        else:
+            self._data = bytes(data)
+
+    def _write(self, data):
+        path = Path(self._directory) / f"{self.digest}{self.suffix}"
+        if not path.exists():
+            path.write_bytes(data)
+        return path
+
+    def read(self):
+        return self._data if self._data is not None else self._path.read_bytes()
+
+
+class SessionUploads:
+    """The current upload of one browser session and the private directory backing it."""
+
+    def __init__(self, spool_bytes=None):
+        if spool_bytes is None:
+            spool_bytes = float(get_config().get("UPLOAD_SPOOL_MB") or DEFAULT_SPOOL_MB) * 1024 * 1024
+        self.spool_bytes = spool_bytes
+        self.directory = tempfile.mkdtemp(prefix="legal-upload-")
+        self.current = None
+        self._upload_key = None
+        # Remove the directory when the session state is dropped, or at exit at the latest.
+        self._finalizer = weakref.finalize(self, shutil.rmtree, self.directory, ignore_errors=True)
+
+    def accept(self, uploaded_file):
+        """Return the SessionUpload for a Streamlit UploadedFile, reusing it on reruns."""
+        key = (getattr(uploaded_file, "file_id", None) or getattr(uploaded_file, "id", None),
+               uploaded_file.name, uploaded_file.size)
+        if self.current is not None and key == self._upload_key:
+            return self.current
+        self.clear()
+        # getbuffer() is a view of the uploader's bytes; only uploads under the spool size are copied.
+        self.current = SessionUpload(uploaded_file.name, uploaded_file.getbuffer(), self.directory, self.spool_bytes)
+        self._upload_key = key
+        return self.current
+
+    def clear(self):
+        """Forget the current upload and delete any file written for it."""
+        self.current, self._upload_key = None, None
+        for path in Path(self.directory).iterdir():
+            path.unlink(missing_ok=True)
+
+
+class PreviewCache:
+    """LRU cache of preview HTML by content hash, bounded by total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, upload):
+        with self._lock:
+            html = self._entries.get(upload.digest)
+            if html is not None:
+                self._entries.move_to_end(upload.digest)
+                return html
+        html = PREVIEW_TEMPLATE.format(data=base64.b64encode(upload.read()).decode("ascii"))
+        with self._lock:
+            if upload.digest not in self._entries:
+                self._entries[upload.digest] = html
+                self._size += len(html)
+                while self._size > self.max_bytes and len(self._entries) > 1:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+        return html
+
+
+def get_preview_cache():
+    return get_resource(
+        "pdf_previews",
+        lambda config: PreviewCache(float(config.get("PREVIEW_CACHE_MB") or DEFAULT_PREVIEW_CACHE_MB) * 1024 * 1024),
+        ("PREVIEW_CACHE_MB",),
+    )
+
+
+def pdf_preview_html(upload):
+    """Return the iframe HTML previewing `upload`, encoded once per distinct file."""
+    return get_preview_cache().get(upload)
@@ -0,0 +1,283 @@
+"""Local stand-ins for Gemini, the vector index and the embedding model.
+
+They implement the small part of each client API the app uses, with
+configurable latency, token rate and canned outputs, so the engine can be run,
+benchmarked and load-tested without network access or API keys. Select them
+in key.env or the environment:
+
+    LLM_BACKEND=standin          Gemini models, uploads and deletes
+    VECTOR_BACKEND=standin       vector queries over a synthetic BNS-sized corpus
+    EMBEDDING_BACKEND=standin    deterministic hashed embeddings and word-overlap reranking
+
+Tuning knobs: STANDIN_LATENCY (seconds before the first token),
+STANDIN_TOKENS_PER_SECOND, STANDIN_VECTOR_LATENCY, STANDIN_CORPUS_SIZE and
+STANDIN_RESPONSES_FILE (a JSON object overriding the canned "query", "analysis",
+"analysis_json" and "document_type" outputs).
+"""
+import json
+import time
+import asyncio
+import hashlib
+import numpy as np
+
+DEFAULT_LATENCY = 0.3
+DEFAULT_TOKENS_PER_SECOND = 200.0
+DEFAULT_VECTOR_LATENCY = 0.02
+DEFAULT_CORPUS_SIZE = 2000
+DEFAULT_RERANK_LATENCY = 0.001
+EMBEDDING_DIMENSION = 384
+WORDS_PER_CHUNK = 8
+
+CANNED_RESPONSES = {
+    "document_type": "Rental agreement",
+    "query": (
+        "Under the Bharatiya Nyaya Sanhita (BNS), Section 303, whoever commits theft shall be punished "
+        "with imprisonment of either description for a term which may extend to three years, or with fine, "
+        "or with both. Legal Advice: report the theft to the police and file an FIR under Section 303."
+    ),
+    "analysis": (
+        "Summary: This is a residential rental agreement between a lessor and a lessee for a fixed term.\n\n"
+        "Discrepancies:\n- The security deposit refund timeline is not specified.\n"
+        "- The jurisdiction clause is left blank.\n\n"
+        "Incorrect Clauses:\n- Clause 7 allows eviction without notice, which is not enforceable.\n\n"
+        "Corrected Clauses:\n- Clause 7: Either party may terminate with one month's written notice.\n\n"
+        "Missing Clauses:\n- Maintenance and repairs responsibilities.\n- Dispute resolution.\n\n"
+        "Draft: RENTAL AGREEMENT\nThis Rental Agreement is made and executed on this ___ day of ______, 20__.\n"
+        "1. TERM: The lease shall be for a period of 11 months.\n2. RENT: The LESSEE shall pay monthly rent.\n"
+        "LESSOR                                      LESSEE"
+    ),
+}
+
+CANNED_RESPONSES["analysis_json"] = json.dumps({
+    "summary": "This is a residential rental agreement between a lessor and a lessee for a fixed term.",
+    "discrepancies": ["The security deposit refund timeline is not specified.", "The jurisdiction clause is left blank."],
+    "incorrect_clauses": ["Clause 7 allows eviction without notice, which is not enforceable."],
+    "corrected_clauses": ["Clause 7: Either party may terminate with one month's written notice."],
+    "missing_clauses": ["Maintenance and repairs responsibilities.", "Dispute resolution."],
+    "draft": "RENT AGREEMENT\nThis Rental Agreement is made and executed on this ___ day of ______, 20__.\n"
+             "1. TERM: The lease shall be for a period of 11 months.\n2. RENT: The LESSEE shall pay monthly rent.",
+}, indent=2)
+
+
+def _text_of(contents):
+    """Flatten the prompt contents the app passes to Gemini into plain text."""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, dict):
+        return _text_of(contents.get("parts", []))
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_text_of(part) for part in contents)
+    return ""
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class _Response:
+    """Mimics a Gemini response: `.text`, plus sync/async iteration over chunks when streaming."""
+
+    def __init__(self, text, latency, tokens_per_second):
+        words = text.split(" ")
+        self.text = text
+        self._pieces = [" ".join(words[i:i + WORDS_PER_CHUNK]) + " " for i in range(0, len(words), WORDS_PER_CHUNK)]
+        self._latency = latency
+        self._delay = WORDS_PER_CHUNK / tokens_per_second if tokens_per_second else 0.0
+
+    def __iter__(self):
+        time.sleep(self._latency)
+        for i, piece in enumerate(self._pieces):
+            if i:
+                time.sleep(self._delay)
+            yield _Chunk(piece)
+
+    async def __aiter__(self):
+        await asyncio.sleep(self._latency)
+        for i, piece in enumerate(self._pieces):
+            if i:
+                await asyncio.sleep(self._delay)
+            yield _Chunk(piece)
+
+
+class _TokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class StandInGenerativeModel:
+    """Drop-in for genai.GenerativeModel that answers with canned text."""
+
+    def __init__(self, model_name=None, generation_config=None, system_instruction=None,
+                 latency=DEFAULT_LATENCY, tokens_per_second=DEFAULT_TOKENS_PER_SECOND, responses=None):
+        self.model_name = model_name
+        self.generation_config = generation_config
+        self.system_instruction = system_instruction
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.responses = dict(CANNED_RESPONSES, **(responses or {}))
+
+    def _pick(self, prompt):
+        # Every JSON-mode request in the app asks for the analysis shape.
+        if (self.generation_config or {}).get("response_mime_type") == "application/json":
+            return self.responses["analysis_json"]
+        if "identify what type of legal document" in prompt:
+            return self.responses["document_type"]
+        if "Generate legal analysis" in prompt or "Discrepancies:" in prompt:
+            return self.responses["analysis"]
+        return self.responses["query"]
+
+    def _respond(self, contents, stream):
+        text = self._pick(_text_of(contents))
+        if stream:
+            return _Response(text, self.latency, self.tokens_per_second)
+        # Non-streaming calls pay for the whole generation up front.
+        response = _Response(text, 0.0, 0.0)
+        time.sleep(self.latency + len(text.split(" ")) / self.tokens_per_second)
+        return response
+
+    async def _respond_async(self, contents, stream):
+        text = self._pick(_text_of(contents))
+        if stream:
+            return _Response(text, self.latency, self.tokens_per_second)
+        await asyncio.sleep(self.latency + len(text.split(" ")) / self.tokens_per_second)
+        return _Response(text, 0.0, 0.0)
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        return self._respond(contents, stream)
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        return await self._respond_async(contents, stream)
+
+    def start_chat(self, history=None):
+        return StandInChatSession(self, history or [])
+
+    def count_tokens(self, contents):
+        text = _text_of(contents) + (self.system_instruction or "")
+        return _TokenCount((len(text) + 3) // 4)
+
+
+class StandInChatSession:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history)
+
+    def send_message(self, content, stream=False, **kwargs):
+        return self.model._respond(self.history + [content], stream)
+
+    async def send_message_async(self, content, stream=False, **kwargs):
+        return await self.model._respond_async(self.history + [content], stream)
+
+
+class _UploadedFile:
+    def __init__(self, path):
+        digest = hashlib.sha256(str(path).encode("utf-8")).hexdigest()[:12]
+        self.name = f"files/standin-{digest}"
+        self.display_name = str(path)
+        self.uri = f"standin://{self.name}"
+
+
+class StandInGenAI:
+    """Module-shaped stand-in for google.generativeai as used through resources.get_genai()."""
+
+    def __init__(self, latency=DEFAULT_LATENCY, tokens_per_second=DEFAULT_TOKENS_PER_SECOND,
+                 upload_latency=0.05, responses=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.upload_latency = upload_latency
+        self.responses = responses
+        self.uploads = 0
+        self.deletes = 0
+
+    def configure(self, **kwargs):
+        pass
+
+    def GenerativeModel(self, model_name=None, generation_config=None, system_instruction=None):
+        return StandInGenerativeModel(model_name, generation_config, system_instruction,
+                                      self.latency, self.tokens_per_second, self.responses)
+
+    def upload_file(self, path, mime_type=None):
+        time.sleep(self.upload_latency)
+        self.uploads += 1
+        return _UploadedFile(path)
+
+    def delete_file(self, name):
+        self.deletes += 1
+
+
+class StandInEmbedder:
+    """Deterministic hashed bag-of-words embedder with the MiniLM output size."""
+
+    def __init__(self, dimension=EMBEDDING_DIMENSION):
+        self.dimension = dimension
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        return np.array([self._embed(text) for text in sentences], dtype=np.float32)
+
+
+class StandInCrossEncoder:
+    """Scores (query, passage) pairs by the share of query words found in the passage, after a per-pair delay."""
+
+    def __init__(self, latency_per_pair=DEFAULT_RERANK_LATENCY):
+        self.latency_per_pair = latency_per_pair
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        time.sleep(self.latency_per_pair * len(pairs))
+        scores = []
+        for query, passage in pairs:
+            words = set(query.lower().split())
+            scores.append(len(words & set(passage.lower().split())) / len(words) if words else 0.0)
+        return np.array(scores, dtype=np.float32)
+
+
+class StandInVectorIndex:
+    """Vector index over a synthetic corpus, answering with Pinecone-shaped matches after a fixed delay."""
+
+    def __init__(self, size=DEFAULT_CORPUS_SIZE, dimension=EMBEDDING_DIMENSION, latency=DEFAULT_VECTOR_LATENCY, seed=0):
+        rng = np.random.default_rng(seed)
+        vectors = rng.normal(size=(size, dimension)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.latency = latency
+        self.version = f"standin-{size}-{seed}"
+        self.ids = [f"standin-{i}" for i in range(size)]
+        self.metadata = [
+            {"text": f"Section {i % 358 + 1}. Stand-in BNS provision number {i} for offline benchmarking.",
+             "section": str(i % 358 + 1)}
+            for i in range(size)
+        ]
+
+    def query(self, vector, top_k=10, include_metadata=True, **kwargs):
+        time.sleep(self.latency)
+        scores = self.vectors @ np.asarray(vector, dtype=np.float32)
+        order = np.argsort(-scores)[:top_k]
+        matches = []
+        for position in order:
+            match = {"id": self.ids[position], "score": float(scores[position])}
+            if include_metadata:
+                match["metadata"] = self.metadata[position]
+            matches.append(match)
+        return {"matches": matches}
+
+    def upsert(self, vectors, **kwargs):
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids, **kwargs):
+        return {}
+
+
+def load_responses(path):
+    """Read canned response overrides from a JSON file, if one is configured."""
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
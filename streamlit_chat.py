@@ -3,11 +3,7 @@ os.environ["STREAMLIT_SERVER_FILE_WATCHER"] = "false"
 
 
 import streamlit as st
-import google.generativeai as genai
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
-
-from dotenv import load_dotenv
+from resources import get_embedding_model, get_generative_model, get_vector_store
 import sys
 import asyncio
 os.environ["STREAMLIT_SERVER_FILE_WATCHER"] = "false"
@@ -15,12 +11,6 @@ try:
     asyncio.get_running_loop()
 except RuntimeError:
     asyncio.run(asyncio.sleep(0))  # Start an event loop
-# Load environment variables
-load_dotenv("key.env")
-
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
 generation_config = {
     "temperature": 0,
     "top_p": 0.95,
@@ -29,11 +19,6 @@ generation_config = {
     "response_mime_type": "text/plain",
 }
 
-model = genai.GenerativeModel(
-    model_name="gemini-2.0-flash",
-    generation_config=generation_config,
-)
-
 PROMPT = """
 Act like a highly experienced legal expert specializing in Indian law, particularly the Bharatiya Nyaya Sanhita (BNS). You have access to a vector database containing all relevant legal provisions from the BNS and will use this database to answer legal queries with precision, confidence, and professionalism.
 
@@ -83,12 +68,11 @@ BNS imposes strict liability on hit-and-run incidents, ensuring accountability a
 
 """
 
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index(os.getenv("PINECONE_INDEX"))
-
-# Load embedding model
-embedding_model = SentenceTransformer("all-MiniLM-L12-v2")
+# Shared clients are built once per server process and reused across reruns;
+# PROMPT is sent once as the model's system instruction rather than with every query
+model = get_generative_model(generation_config, system_instruction=PROMPT)
+index = get_vector_store()
+embedding_model = get_embedding_model()
 
 def retrieve_documents(query, top_k=10):
     query_embedding = embedding_model.encode(query).tolist()
@@ -96,8 +80,7 @@ def retrieve_documents(query, top_k=10):
     return results['matches']
 
 def query_llm(query, context):
-    chat_session = model.start_chat(history=[{"role": "user", "parts": [PROMPT]}])
-    response = chat_session.send_message(f"Context: {context}\nQuery: {query}")
+    response = model.generate_content(f"Context: {context}\nQuery: {query}")
     return response.text
 
 def process_results(results):
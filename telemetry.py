@@ -0,0 +1,310 @@
+"""Per-stage spans and metrics for query answering and document validation.
+
+Every stage (embedding, vector query, upload, type detection, generation,
+section extraction, DOCX rendering, ...) runs inside ``span(stage)``. A span
+records its duration and status plus whatever the stage attaches to it: prompt
+and response token counts, chunk counts and cache hit/miss. Spans started
+during one request share a trace id, so a slow validation can be broken down
+into upload, retrieval and model time.
+
+Finished spans are:
+  * aggregated into process-wide metrics, served in the Prometheus text format
+    on ``METRICS_PORT`` (if set) at /metrics, bound to ``METRICS_HOST``
+    (default 127.0.0.1), and
+  * appended as JSON lines to ``TRACE_LOG_PATH`` when it is set (off by
+    default). The file is kept open and rotated once it reaches
+    ``TRACE_LOG_MB`` (default 64): the full file moves to ``<path>.1``,
+    replacing the previous one, so the log uses at most twice that.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from context_builder import estimate_tokens
+from resources import get_config, get_resource
+
+DEFAULT_TRACE_LOG_MB = 64
+DEFAULT_METRICS_HOST = "127.0.0.1"
+TRACE_LOG_RECHECK_SECONDS = 1.0
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_stage_listener = contextvars.ContextVar("stage_listener", default=None)
+
+_metrics_lock = threading.Lock()
+_durations = {}  # stage -> [bucket counts..., +Inf count, sum]
+_requests = {}  # (stage, status) -> count
+_tokens = {}  # (stage, kind) -> count
+_chunks = {}  # stage -> count
+_cache = {}  # (stage, result) -> count
+_metrics_server = None  # the running /metrics server, shut down when its settings change
+
+# Spans run on hot paths (each embedding, vector query and rerank), so the trace log is resolved
+# at most once per TRACE_LOG_RECHECK_SECONDS, and again only when the config itself has changed.
+_trace_log_lock = threading.Lock()
+_trace_log_state = {"checked_at": 0.0, "config": None, "log": None}
+
+
+def start_trace():
+    """Start a new trace for the current request and return its id.
+
+    The id is held in a context variable, so it follows the request into
+    asyncio tasks and ``asyncio.to_thread`` calls.
+    """
+    trace_id = uuid.uuid4().hex[:16]
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+def watch_stages(listener):
+    """Call ``listener(stage)`` whenever a span starts in the current context.
+
+    Like the trace id, the listener follows the request into asyncio tasks and
+    threads started from here; background jobs use it to report progress.
+    """
+    _stage_listener.set(listener)
+
+
+class Span:
+    """Attributes of one running stage; use ``set()`` to attach counts and cache results."""
+
+    def __init__(self, stage, attributes):
+        self.stage = stage
+        self.attributes = dict(attributes)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def set_tokens(self, response, prompt_text="", response_text=""):
+        """Record token counts from a Gemini response, estimating them when it carries no usage data."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and getattr(usage, "prompt_token_count", None) is not None:
+            self.set(prompt_tokens=usage.prompt_token_count,
+                     response_tokens=getattr(usage, "candidates_token_count", None) or 0)
+        else:
+            self.set(prompt_tokens=estimate_tokens(prompt_text), response_tokens=estimate_tokens(response_text))
+
+
+@contextmanager
+def span(stage, **attributes):
+    """Time the enclosed block as `stage` and record it when the block exits."""
+    current = Span(stage, attributes)
+    listener = _stage_listener.get()
+    if listener is not None:
+        listener(stage)
+    started_at = time.time()
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield current
+    except (GeneratorExit, asyncio.CancelledError):
+        # A stream closed early, e.g. when Streamlit reruns mid-answer.
+        status = "cancelled"
+        raise
+    except BaseException as e:
+        status = "error"
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _record(current, started_at, time.perf_counter() - started, status)
+
+
+def time_first_chunk(chunks, timings):
+    """Pass chunks through, recording seconds until the first one in timings["first_chunk"]."""
+    started = time.perf_counter()
+    for chunk in chunks:
+        timings.setdefault("first_chunk", time.perf_counter() - started)
+        yield chunk
+
+
+def _record(current, started_at, duration, status):
+    attributes = current.attributes
+    with _metrics_lock:
+        counts = _durations.setdefault(current.stage, [0] * (len(DURATION_BUCKETS) + 2))
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                counts[i] += 1
+        counts[-2] += 1
+        counts[-1] += duration
+        _requests[(current.stage, status)] = _requests.get((current.stage, status), 0) + 1
+        for kind in ("prompt", "response"):
+            if attributes.get(f"{kind}_tokens"):
+                key = (current.stage, kind)
+                _tokens[key] = _tokens.get(key, 0) + int(attributes[f"{kind}_tokens"])
+        if attributes.get("chunks"):
+            _chunks[current.stage] = _chunks.get(current.stage, 0) + int(attributes["chunks"])
+        if attributes.get("cache") in ("hit", "miss"):
+            key = (current.stage, attributes["cache"])
+            _cache[key] = _cache.get(key, 0) + 1
+
+    trace_log = get_trace_log()
+    if trace_log is None:
+        return
+    record = {
+        "trace_id": _trace_id.get(),
+        "stage": current.stage,
+        "start": round(started_at, 3),
+        "duration_ms": round(duration * 1000, 2),
+        "status": status,
+    }
+    record.update(attributes)
+    trace_log.write(json.dumps(record, ensure_ascii=False, default=str))
+
+
+class TraceLog:
+    """Append-only JSON-lines file kept open between spans and rotated by size."""
+
+    def __init__(self, path, max_bytes=DEFAULT_TRACE_LOG_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, line):
+        data = (line + "\n").encode("utf-8")
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, "ab")
+                if self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+                    self._rotate()
+                self._file.write(data)
+                self._file.flush()
+            except OSError as e:
+                print(f"Failed to write trace log '{self.path}': {e}")
+                self.close()
+
+    def _rotate(self):
+        self._file.close()
+        os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "ab")
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+
+def get_trace_log():
+    """Return the shared trace log, or None unless TRACE_LOG_PATH is set."""
+    def build(config):
+        import atexit
+        trace_log = TraceLog(path, max_bytes=float(config.get("TRACE_LOG_MB") or DEFAULT_TRACE_LOG_MB) * 1024 * 1024)
+        atexit.register(trace_log.close)
+        return trace_log
+
+    now = time.monotonic()
+    with _trace_log_lock:
+        if now - _trace_log_state["checked_at"] < TRACE_LOG_RECHECK_SECONDS:
+            return _trace_log_state["log"]
+        _trace_log_state["checked_at"] = now
+        config = get_config()
+        if config is _trace_log_state["config"]:
+            return _trace_log_state["log"]
+        path = config.get("TRACE_LOG_PATH")
+        trace_log = get_resource("trace_log", build, ("TRACE_LOG_PATH", "TRACE_LOG_MB"),
+                                 close=lambda replaced: replaced.close()) if path else None
+        _trace_log_state.update(config=config, log=trace_log)
+        return trace_log
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text():
+    """Render every metric in the Prometheus text exposition format."""
+    lines = []
+    with _metrics_lock:
+        lines.append("# HELP legal_stage_duration_seconds Time spent in each request stage.")
+        lines.append("# TYPE legal_stage_duration_seconds histogram")
+        for stage, counts in sorted(_durations.items()):
+            for bound, count in zip(DURATION_BUCKETS, counts):
+                lines.append(f"legal_stage_duration_seconds_bucket{_labels(stage=stage, le=bound)} {count}")
+            lines.append(f"legal_stage_duration_seconds_bucket{_labels(stage=stage, le='+Inf')} {counts[-2]}")
+            lines.append(f"legal_stage_duration_seconds_count{_labels(stage=stage)} {counts[-2]}")
+            lines.append(f"legal_stage_duration_seconds_sum{_labels(stage=stage)} {counts[-1]:.6f}")
+
+        lines.append("# HELP legal_stage_total Completed stages by status (ok, error, cancelled).")
+        lines.append("# TYPE legal_stage_total counter")
+        for (stage, status), count in sorted(_requests.items()):
+            lines.append(f"legal_stage_total{_labels(stage=stage, status=status)} {count}")
+
+        lines.append("# HELP legal_stage_tokens_total Prompt and response tokens per stage.")
+        lines.append("# TYPE legal_stage_tokens_total counter")
+        for (stage, kind), count in sorted(_tokens.items()):
+            lines.append(f"legal_stage_tokens_total{_labels(stage=stage, kind=kind)} {count}")
+
+        lines.append("# HELP legal_stage_chunks_total Chunks (retrieved, used or streamed) per stage.")
+        lines.append("# TYPE legal_stage_chunks_total counter")
+        for stage, count in sorted(_chunks.items()):
+            lines.append(f"legal_stage_chunks_total{_labels(stage=stage)} {count}")
+
+        lines.append("# HELP legal_stage_cache_total Cache lookups per stage by result.")
+        lines.append("# TYPE legal_stage_cache_total counter")
+        for (stage, result), count in sorted(_cache.items()):
+            lines.append(f"legal_stage_cache_total{_labels(stage=stage, result=result)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def stage_summary():
+    """Return ``{stage: {"count", "mean_ms"}}`` for display in the app."""
+    with _metrics_lock:
+        return {
+            stage: {"count": counts[-2], "mean_ms": counts[-1] * 1000 / counts[-2] if counts[-2] else 0.0}
+            for stage, counts in _durations.items()
+        }
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics():
+    """Start the /metrics endpoint on METRICS_PORT once per process; a no-op when it is not set.
+
+    It listens on METRICS_HOST, only the loopback interface by default; a
+    change to either setting stops the previous server and starts a new one.
+    """
+    if not get_config().get("METRICS_PORT"):
+        return None
+
+    def build(config):
+        global _metrics_server
+        if _metrics_server is not None:
+            _metrics_server.shutdown()
+            _metrics_server.server_close()
+            _metrics_server = None
+        host = config.get("METRICS_HOST") or DEFAULT_METRICS_HOST
+        server = ThreadingHTTPServer((host, int(config["METRICS_PORT"])), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Serving metrics on {host}:{config['METRICS_PORT']}")
+        _metrics_server = server
+        return server
+
+    return get_resource("metrics_server", build, ("METRICS_HOST", "METRICS_PORT"))
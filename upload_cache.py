@@ -0,0 +1,157 @@
+"""Content-hash keyed cache of files uploaded to Gemini.
+
+The Document Validator needs the same PDF for type detection, analysis and any
+repeat validation. Uploading it once and reusing the remote handle avoids paying
+the upload (and the remote storage) several times for identical bytes.
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+DEFAULT_TTL_SECONDS = 60 * 60
+DEFAULT_MAX_ENTRIES = 64
+DEFAULT_IN_USE_SECONDS = 15 * 60  # longer than any generation that reads a handle
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """Reuse remote Gemini file handles for identical file contents.
+
+    Entries expire `ttl_seconds` after upload (well inside Gemini's own 48 hour
+    retention) and at most `max_entries` are kept. An expired entry is never
+    handed out again: the next request re-uploads the file. Expired or evicted
+    handles are deleted from Gemini so remote storage does not grow unbounded,
+    except those handed out in the last `in_use_seconds`: a request may still be
+    generating from them, so they are kept (even past the bound) until that has
+    passed.
+    """
+
+    def __init__(self, upload_fn, delete_fn=None, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES,
+                 in_use_seconds=DEFAULT_IN_USE_SECONDS):
+        self.upload_fn = upload_fn
+        self.delete_fn = delete_fn
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.in_use_seconds = in_use_seconds
+        self._entries = OrderedDict()  # digest -> (uploaded_at, remote file, last handed out)
+        self._retired = []  # (remote file, last handed out) of expired handles still in use
+        self._digests = {}  # (path, mtime_ns, size) -> digest
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _digest_for(self, path):
+        stat = os.stat(path)
+        stamp = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(stamp)
+        if digest is None:
+            digest = file_sha256(path)  # outside the lock: hashing a large PDF must not block other lookups
+            with self._lock:
+                if len(self._digests) >= 4 * self.max_entries:
+                    self._digests.clear()
+                self._digests[stamp] = digest
+        return digest
+
+    def _delete(self, remote_file):
+        if self.delete_fn is None:
+            return
+        try:
+            self.delete_fn(remote_file)
+        except Exception as e:
+            print(f"Failed to delete uploaded file '{getattr(remote_file, 'name', remote_file)}': {e}")
+
+    def _in_use(self, entry, now):
+        return now - entry[2] < self.in_use_seconds
+
+    def _purge_expired(self, now):
+        # Called with the lock held; returns the handles to delete once it is released. Expired
+        # handles still in use are retired: no longer handed out, deleted when their window ends.
+        stale = []
+        for digest in [d for d, entry in self._entries.items() if now - entry[0] >= self.ttl_seconds]:
+            entry = self._entries.pop(digest)
+            if self._in_use(entry, now):
+                self._retired.append((entry[1], entry[2]))
+            else:
+                stale.append(entry[1])
+        retired = []
+        for remote_file, handed_out in self._retired:
+            if now - handed_out < self.in_use_seconds:
+                retired.append((remote_file, handed_out))
+            else:
+                stale.append(remote_file)
+        self._retired = retired
+        return stale
+
+    def _evict(self, now):
+        # Called with the lock held: drop least recently used handles over the bound, skipping those in use.
+        evicted = []
+        for digest in list(self._entries):
+            if len(self._entries) <= self.max_entries:
+                break
+            if not self._in_use(self._entries[digest], now):
+                evicted.append(self._entries.pop(digest)[1])
+        return evicted
+
+    def get_or_upload(self, path, mime_type=None):
+        """Return a remote handle for `path`, uploading only if its contents are new."""
+        return self.fetch(path, mime_type)[0]
+
+    def fetch(self, path, mime_type=None):
+        """Like get_or_upload, but return ``(remote handle, served_from_cache)``."""
+        digest = self._digest_for(path)
+        with self._lock:
+            if len(self._key_locks) >= 4 * self.max_entries:
+                self._key_locks = {d: l for d, l in self._key_locks.items() if d in self._entries or l.locked()}
+            key_lock = self._key_locks.setdefault(digest, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                now = time.time()
+                stale = self._purge_expired(now)
+                entry = self._entries.get(digest)
+                if entry is not None:
+                    self._entries[digest] = (entry[0], entry[1], now)
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+            for remote_file in stale:
+                self._delete(remote_file)
+            if entry is not None:
+                return entry[1], True
+
+            remote_file = self.upload_fn(path, mime_type=mime_type)
+            with self._lock:
+                self.misses += 1
+                now = time.time()
+                self._entries[digest] = (now, remote_file, now)
+                evicted = self._evict(now)
+            for old_file in evicted:
+                self._delete(old_file)
+            return remote_file, False
+
+    def clear(self):
+        """Forget every cached handle and delete it from Gemini."""
+        with self._lock:
+            remote_files = [entry[1] for entry in self._entries.values()]
+            remote_files += [remote_file for remote_file, _ in self._retired]
+            self._entries.clear()
+            self._retired = []
+            self._digests.clear()
+        for remote_file in remote_files:
+            self._delete(remote_file)
+
+    def stats(self):
+        """Return hit/miss counters and the number of live entries."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,393 @@
+"""Background document validation jobs with progress, persistence and admission control.
+
+A validation used to run inline in the Streamlit script. It tied up the
+session for minutes, was lost when the browser reconnected, and any number
+could run at once. Now the validator submits a job and polls it:
+
+  * Jobs run as tasks on the shared event loop, at most ``VALIDATION_WORKERS``
+    at a time (default 2). The others wait in the queue.
+  * Admission control rejects a submission with JobRejected when
+    ``VALIDATION_MAX_QUEUED`` jobs (default 8) are already waiting, or when the
+    session already has ``VALIDATION_SESSION_JOBS`` (default 1) unfinished.
+    An upload identical to a queued or running job of the same session
+    reattaches to that job instead of spending model quota again; other
+    sessions get their own job (which the result store may answer at once).
+  * A job first looks its document up in the result store (result_store).
+    A stored result from the current prompt, model and index finishes the
+    job at once; otherwise the finished validation is stored there.
+  * Progress follows the telemetry spans the pipeline already emits, mapped
+    onto the stages uploading, detecting, retrieving, generating and rendering.
+  * Each job keeps its own copy of the document under ``JOB_DIR`` (default
+    jobs/), with job.json (status), result.json (the response and parsed
+    analysis) and draft.docx. Any process can reattach by job id. job.json
+    records the owning process and host and is rewritten at least every
+    HEARTBEAT_SECONDS while the job is unfinished. A job read by another
+    process is reported as interrupted only when its owner is gone: the
+    owner's pid no longer exists (same host, POSIX), or its heartbeat is
+    older than STALE_SECONDS.
+    Job directories are removed after ``JOB_TTL`` seconds (default a day).
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import asyncio
+import hashlib
+import threading
+
+from telemetry import watch_stages
+from resources import get_resource
+
+DEFAULT_JOB_DIR = "jobs"
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_QUEUED = 8
+DEFAULT_SESSION_JOBS = 1
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+HEARTBEAT_SECONDS = 10
+STAGE_SAVE_SECONDS = 1  # stage changes closer together than this wait for the next save or heartbeat
+STALE_SECONDS = 6 * HEARTBEAT_SECONDS
+HOST = socket.gethostname()
+
+STAGES = ["queued", "uploading", "detecting", "retrieving", "generating", "rendering", "done"]
+# Telemetry span -> job stage. Stages only move forward, so concurrent spans cannot move a job back.
+SPAN_STAGES = {
+    "upload": "uploading",
+    "type_classification": "detecting",
+    "type_detection": "detecting",
+    "context_bundle": "retrieving",
+    "context_refinement": "retrieving",
+    "embedding": "retrieving",
+    "vector_query": "retrieving",
+    "section_lookup": "retrieving",
+    "lexical_query": "retrieving",
+    "rerank": "retrieving",
+    "context_build": "retrieving",
+    "long_document_map": "generating",
+    "generation": "generating",
+    "section_extraction": "rendering",
+    "docx_render": "rendering",
+}
+UNFINISHED = ("queued", "running")
+PERSISTED_FIELDS = ("id", "session_id", "name", "digest", "status", "stage", "doc_type", "error", "stored",
+                    "created_at", "started_at", "finished_at", "owner_pid", "owner_host", "heartbeat")
+
+
+class JobRejected(RuntimeError):
+    """Raised when admission control turns a validation away."""
+
+
+class ValidationJob:
+    """State of one validation; ``text`` holds the response streamed so far (in memory only)."""
+
+    def __init__(self, directory, **fields):
+        self.directory = directory
+        self.id = fields.get("id") or os.path.basename(directory)
+        self.session_id = fields.get("session_id")
+        self.name = fields.get("name")
+        self.digest = fields.get("digest")
+        self.status = fields.get("status", "queued")
+        self.stage = fields.get("stage", "queued")
+        self.doc_type = fields.get("doc_type")
+        self.error = fields.get("error")
+        self.stored = fields.get("stored", False)  # served from the result store
+        self.created_at = fields.get("created_at") or time.time()
+        self.started_at = fields.get("started_at")
+        self.finished_at = fields.get("finished_at")
+        self.owner_pid = fields.get("owner_pid")
+        self.owner_host = fields.get("owner_host")
+        self.heartbeat = fields.get("heartbeat") or self.created_at
+        self.text = ""
+        self.future = None
+        self._lock = threading.Lock()
+
+    @property
+    def document_path(self):
+        return os.path.join(self.directory, "document.pdf")
+
+    @property
+    def docx_path(self):
+        return os.path.join(self.directory, "draft.docx")
+
+    def _write(self, name, payload):
+        # Stages can advance from several threads of the same job at once.
+        tmp_path = os.path.join(self.directory, f"{name}.tmp")
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(self.directory, name))
+
+    def save(self):
+        self.heartbeat = time.time()
+        self._write("job.json", {name: getattr(self, name) for name in PERSISTED_FIELDS})
+
+    def reload(self):
+        """Re-read job.json, to follow a job that another process is running. Returns False if unreadable."""
+        try:
+            with open(os.path.join(self.directory, "job.json"), encoding="utf-8") as f:
+                fields = json.load(f)
+        except (OSError, ValueError):
+            return False
+        for name in PERSISTED_FIELDS:
+            if name in fields:
+                setattr(self, name, fields[name])
+        return True
+
+    def owner_alive(self):
+        """Whether the process running this job still exists and has saved the job recently."""
+        if time.time() - self.heartbeat >= STALE_SECONDS:
+            return False
+        if self.owner_pid is None or self.owner_host != HOST or os.name != "posix":
+            return True
+        try:
+            os.kill(self.owner_pid, 0)  # signal 0 only checks that the process exists
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass  # exists, owned by another user
+        return True
+
+    def advance(self, stage):
+        """Move to `stage` if it is later than the current one.
+
+        job.json is rewritten only on a transition, and at most every
+        STAGE_SAVE_SECONDS; the heartbeat saves any stage skipped that way.
+        """
+        if stage not in STAGES or STAGES.index(stage) <= STAGES.index(self.stage):
+            return
+        self.stage = stage
+        if time.time() - self.heartbeat >= STAGE_SAVE_SECONDS:
+            self.save()
+
+    def finish(self, status, error=None):
+        self.status, self.error, self.finished_at = status, error, time.time()
+        if status == "done":
+            self.stage = "done"
+        self.save()
+
+    def save_result(self, text, analysis):
+        self._write("result.json", {"text": text, "doc_type": self.doc_type, "analysis": analysis.to_dict()})
+
+    def result(self):
+        """Return ``(response text, DocumentAnalysis)`` for a finished job, or None."""
+        from analysis_result import DocumentAnalysis
+        try:
+            with open(os.path.join(self.directory, "result.json"), encoding="utf-8") as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return payload["text"], DocumentAnalysis.from_dict(payload["analysis"])
+
+    def progress(self):
+        """Return a snapshot for the UI: status, stage, its position and timings."""
+        end = self.finished_at or time.time()
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "fraction": STAGES.index(self.stage) / (len(STAGES) - 1),
+            "elapsed": round(end - (self.started_at or self.created_at), 1),
+            "waited": round((self.started_at or end) - self.created_at, 1),
+            "chars": len(self.text),
+            "doc_type": self.doc_type,
+            "stored": self.stored,
+            "error": self.error,
+        }
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JobManager:
+    """Admits, runs and tracks validation jobs for this process."""
+
+    def __init__(self, directory=DEFAULT_JOB_DIR, workers=DEFAULT_WORKERS, max_queued=DEFAULT_MAX_QUEUED,
+                 session_jobs=DEFAULT_SESSION_JOBS, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.directory = directory
+        self.workers = workers
+        self.max_queued = max_queued
+        self.session_jobs = session_jobs
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._slots = None  # asyncio.Semaphore, created on the event loop
+        os.makedirs(directory, exist_ok=True)
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            job = self._jobs.get(name)
+            if job is not None and job.status in UNFINISHED:
+                continue
+            try:
+                expired = os.path.getmtime(path) < cutoff
+            except OSError:
+                continue
+            if expired:
+                shutil.rmtree(path, ignore_errors=True)
+                self._jobs.pop(name, None)
+
+    def active(self):
+        return [job for job in self._jobs.values() if job.status in UNFINISHED]
+
+    def submit(self, session_id, file_path, name=None):
+        """Queue a validation of `file_path` and return its job, or raise JobRejected."""
+        digest = _file_digest(file_path)
+        with self._lock:
+            self._prune()
+            for job in self._jobs.values():
+                if job.digest == digest and job.session_id == session_id and job.status in UNFINISHED:
+                    return job
+            if sum(1 for job in self.active() if job.session_id == session_id) >= self.session_jobs:
+                raise JobRejected("You already have a validation in progress. Wait for it to finish.")
+            waiting = sum(1 for job in self.active() if job.status == "queued")
+            if waiting >= self.max_queued:
+                raise JobRejected("The validator is busy. Please try again in a few minutes.")
+            job_id = uuid.uuid4().hex[:12]
+            job = ValidationJob(os.path.join(self.directory, job_id), id=job_id, session_id=session_id,
+                                name=name or os.path.basename(file_path), digest=digest, owner_pid=os.getpid(),
+                                owner_host=HOST)
+            os.makedirs(job.directory)
+            shutil.copyfile(file_path, job.document_path)
+            job.save()
+            self._jobs[job.id] = job
+
+        from async_engine import submit
+        job.future = submit(self._run(job))
+        return job
+
+    def get(self, job_id):
+        """Return a job by id, loading it from JOB_DIR if this process did not start it (None if unknown)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job
+            directory = os.path.join(self.directory, os.path.basename(job_id or ""))
+            try:
+                with open(os.path.join(directory, "job.json"), encoding="utf-8") as f:
+                    fields = json.load(f)
+            except (OSError, ValueError):
+                return None
+            job = ValidationJob(directory, **fields)
+            if job.status in UNFINISHED:
+                if job.owner_alive():
+                    # Another process is running it; read it again on the next call to see its progress.
+                    return job
+                job.finish("interrupted", "The server restarted before this validation finished.")
+            self._jobs[job.id] = job
+            return job
+
+    def cancel(self, job_id):
+        """Cancel a job this process is running; it stops counting toward admission limits at once."""
+        job = self.get(job_id)
+        if job is not None and job.future is not None and job.future.cancel() and job.status in UNFINISHED:
+            job.finish("cancelled")
+
+    async def _run(self, job):
+        from async_engine import process_document_stream_async
+        from docx_renderer import render_draft
+        from legal_engine import parse_document_analysis
+        from result_store import current_versions, get_result_store
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        heartbeat = asyncio.ensure_future(self._heartbeat(job))
+        try:
+            async with self._slots:
+                job.status, job.started_at = "running", time.time()
+                job.save()
+                store = get_result_store()
+                model, index_version = await asyncio.to_thread(current_versions)
+                stored = await asyncio.to_thread(store.lookup, job.digest, model, index_version) if store else None
+                if stored is not None:
+                    job.doc_type, job.stored = stored["doc_type"], True
+                    text, analysis, docx_bytes = stored["text"], stored["analysis"], stored["docx"]
+                    job.text = text
+                else:
+                    watch_stages(lambda stage: job.advance(SPAN_STAGES.get(stage)))
+                    chunks, job.doc_type = await process_document_stream_async(job.document_path)
+                    job.save()
+                    parts = []
+                    async for chunk in chunks:
+                        parts.append(chunk)
+                        job.text += chunk
+                    text = "".join(parts)
+                    analysis = parse_document_analysis(text)
+                    docx_bytes = await asyncio.to_thread(render_draft, analysis, job.doc_type)
+                    if store is not None:
+                        await asyncio.to_thread(store.put, job.digest, job.doc_type, model, index_version, text,
+                                                analysis, docx_bytes, job.name)
+                with open(job.docx_path, "wb") as f:
+                    f.write(docx_bytes)
+                job.save_result(text, analysis)
+                job.finish("done")
+        except asyncio.CancelledError:
+            job.finish("cancelled")
+            raise
+        except Exception as e:
+            print(f"Validation job {job.id} failed: {e}")
+            job.finish("failed", f"{type(e).__name__}: {e}")
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job):
+        # Lets other processes tell a job that is waiting or generating from one whose process died.
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            job.save()
+
+
+def get_job_manager():
+    """Return the process-wide validation job manager."""
+    def build(config):
+        return JobManager(
+            directory=config.get("JOB_DIR") or DEFAULT_JOB_DIR,
+            workers=int(config.get("VALIDATION_WORKERS") or DEFAULT_WORKERS),
+            max_queued=int(config.get("VALIDATION_MAX_QUEUED") or DEFAULT_MAX_QUEUED),
+            session_jobs=int(config.get("VALIDATION_SESSION_JOBS") or DEFAULT_SESSION_JOBS),
+            ttl_seconds=float(config.get("JOB_TTL") or DEFAULT_TTL_SECONDS),
+        )
+
+    return get_resource(
+        "validation_jobs",
+        build,
+        ("JOB_DIR", "VALIDATION_WORKERS", "VALIDATION_MAX_QUEUED", "VALIDATION_SESSION_JOBS", "JOB_TTL"),
+    )
+
+
+def follow_job(job, on_progress=None, interval=0.25):
+    """Yield a job's response text as it streams in, calling ``on_progress(job.progress())`` while waiting.
+
+    Ends when the job finishes. A job reattached from another process has no
+    streamed text: its job.json is re-read on every iteration, and its stored
+    result is yielded in one piece once it is done. If that process goes away
+    first, the job is marked interrupted.
+    """
+    foreign = (job.owner_pid, job.owner_host) != (os.getpid(), HOST)
+    sent = 0
+    while True:
+        if foreign and job.status in UNFINISHED:
+            job.reload()
+            if job.status in UNFINISHED and not job.owner_alive():
+                job.finish("interrupted", "The server restarted before this validation finished.")
+        finished = job.status not in UNFINISHED
+        if on_progress is not None:
+            on_progress(job.progress())
+        text = job.text
+        if len(text) > sent:
+            yield text[sent:]
+            sent = len(text)
+        if finished:
+            break
+        time.sleep(interval)
+    if not sent:
+        result = job.result()
+        if result is not None:
+            yield result[0]
@@ -0,0 +1,331 @@
+"""Vector-store backends for BNS retrieval.
+
+Every backend exposes the small subset of the Pinecone index API the app uses:
+``query(vector=..., top_k=..., include_metadata=True)`` returning a mapping with
+a ``matches`` list of ``{"id", "score", "metadata"}`` entries, and
+``upsert(vectors=[...])``. That keeps ``retrieve_documents`` and
+``process_results`` unchanged whichever backend is configured.
+
+``LocalVectorStore`` keeps the corpus on disk as a float32 ``.npy`` matrix that
+is memory-mapped at load time, next to a JSON file with ids and metadata. It
+supports exact brute-force search and an IVF (inverted file) approximate mode.
+Each write produces new versioned files and then swaps ``manifest.json``, so
+readers never see a half-written store and mapped files are never overwritten.
+The version a write supersedes is kept until the next write, so a reader in
+another process that has just read the old manifest can still map its files.
+Inside ``with store.batch():`` upserts and deletes are collected in memory and
+written once when the block ends, so an ingest run costs one write, not one
+per upsert.
+"""
+import os
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+MANIFEST_FILE = "manifest.json"
+
+DEFAULT_STORE_DIR = "vector_store"
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 20
+
+
+def _normalize(matrix):
+    """Scale rows to unit length so a dot product equals cosine similarity."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores, k):
+    """Return the indices of the k highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def plain_match(match):
+    """Copy a match into a plain ``{"id", "score", "metadata"}`` dict.
+
+    Pinecone returns ScoredVector objects; the local stores and fusion return dicts.
+    """
+    if hasattr(match, "get"):
+        metadata, score = match.get("metadata"), match.get("score")
+    else:
+        metadata, score = getattr(match, "metadata", None), getattr(match, "score", None)
+    return {"id": match["id"], "score": None if score is None else float(score), "metadata": dict(metadata or {})}
+
+
+def read_manifest(directory):
+    """Return the store's manifest.json as a dict ({} when the store is empty or unreadable)."""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _atomic_write(path, write_fn, mode="wb"):
+    """Write a file through `write_fn(f)` and move it into place in one step."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode) as f:
+        write_fn(f)
+    os.replace(tmp_path, path)
+
+
+def build_ivf(vectors, nlist=None, iterations=KMEANS_ITERATIONS, seed=0):
+    """Cluster unit vectors with spherical k-means for IVF search.
+
+    Returns the centroid matrix and, for each vector, the list it belongs to.
+    """
+    count = vectors.shape[0]
+    if nlist is None:
+        nlist = max(1, int(np.sqrt(count)))
+    nlist = min(nlist, count)
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(count, size=nlist, replace=False)], dtype=np.float32)
+    assignments = np.zeros(count, dtype=np.int32)
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = np.bincount(assignments, minlength=nlist) == 0
+        # Re-seed empty lists so every centroid keeps covering part of the corpus.
+        sums[empty] = vectors[rng.choice(count, size=int(empty.sum()))]
+        centroids = _normalize(sums).astype(np.float32)
+    assignments = np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+    return centroids, assignments
+
+
+class LocalVectorStore:
+    """In-process vector store backed by a memory-mapped float32 matrix.
+
+    `mode` is ``"exact"`` for brute-force search over every vector or ``"ivf"``
+    to only scan the `nprobe` clusters closest to the query.
+    """
+
+    def __init__(self, directory=DEFAULT_STORE_DIR, mode="exact", nprobe=DEFAULT_NPROBE):
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"Unknown search mode '{mode}'. Use 'exact' or 'ivf'.")
+        self.directory = directory
+        self.mode = mode
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self._batch_depth = 0
+        self._pending = None  # uncommitted [matrix, ids, metadata, positions] inside batch()
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        manifest = read_manifest(self.directory)
+        if manifest:
+            vectors = np.load(self._path(manifest["vectors"]), mmap_mode="r")
+            with open(self._path(manifest["metadata"]), encoding="utf-8") as f:
+                records = json.load(f)
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+            records = []
+
+        ids = [record["id"] for record in records]
+        metadata = [record.get("metadata", {}) for record in records]
+        version = manifest.get("version")
+        centroids, lists = self._load_ivf(vectors, version) if self.mode == "ivf" and ids else (None, None)
+
+        # Queries read this tuple once, so a concurrent reload never mixes versions.
+        self._snapshot = (vectors, ids, metadata, centroids, lists)
+        self.vectors = vectors
+        self.ids = ids
+        self.metadata = metadata
+        self.positions = {vector_id: i for i, vector_id in enumerate(ids)}
+        self.version = version
+
+    def _load_ivf(self, vectors, version):
+        ivf_path = self._path(f"ivf-{version}.npz")
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as data:
+                centroids, assignments = data["centroids"], data["assignments"]
+        else:
+            centroids, assignments = build_ivf(np.asarray(vectors))
+            _atomic_write(ivf_path, lambda f: np.savez(f, centroids=centroids, assignments=assignments))
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(centroids.shape[0] + 1))
+        lists = [order[bounds[i]:bounds[i + 1]] for i in range(centroids.shape[0])]
+        return centroids, lists
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, vector, top_k=10, include_metadata=True, mode=None, **kwargs):
+        """Return the `top_k` nearest chunks in Pinecone's ``{"matches": [...]}`` shape."""
+        vectors, ids, metadata, centroids, lists = self._snapshot
+        if len(ids) == 0:
+            return {"matches": []}
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        mode = mode or self.mode
+
+        if mode == "ivf" and centroids is not None:
+            probes = _top_k(centroids @ query, self.nprobe)
+            candidates = np.concatenate([lists[i] for i in probes])
+            scores = vectors[candidates] @ query
+            ranked = _top_k(scores, top_k)
+            order = candidates[ranked]
+            best = scores[ranked]
+        else:
+            scores = vectors @ query
+            order = _top_k(scores, top_k)
+            best = scores[order]
+
+        matches = []
+        for position, score in zip(order, best):
+            match = {"id": ids[position], "score": float(score)}
+            if include_metadata:
+                match["metadata"] = metadata[position]
+            matches.append(match)
+        return {"matches": matches}
+
+    @contextmanager
+    def batch(self):
+        """Collect the upserts and deletes made inside the block and write the store once at its end.
+
+        Queries see the last written version until then. Nothing is written if
+        the block raises.
+        """
+        with self._lock:
+            self._batch_depth += 1
+        committed = False
+        try:
+            yield self
+            committed = True
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    pending, self._pending = self._pending, None
+                    if committed and pending is not None:
+                        self._save(pending[0], pending[1], pending[2])
+
+    def _working_copy(self):
+        # Called with the lock held: the uncommitted batch, or a writable copy of the store.
+        if self._pending is not None:
+            return self._pending
+        matrix = np.array(self.vectors, dtype=np.float32) if len(self.ids) else None
+        return [matrix, list(self.ids), list(self.metadata), dict(self.positions)]
+
+    def _write(self, state):
+        # Called with the lock held: keep the state for the end of the batch, or write it now.
+        if self._batch_depth:
+            self._pending = state
+        else:
+            self._save(state[0], state[1], state[2])
+
+    def upsert(self, vectors, **kwargs):
+        """Insert or replace records given as ``{"id", "values", "metadata"}`` dicts."""
+        if not vectors:
+            return {"upserted_count": 0}
+        with self._lock:
+            state = self._working_copy()
+            matrix, ids, metadata, positions = state
+            dimension = matrix.shape[-1] if matrix is not None else None
+            new_rows = []
+            for record in vectors:
+                values = _normalize(np.asarray(record["values"], dtype=np.float32))
+                if dimension is None:
+                    dimension = values.shape[-1]
+                if values.ndim != 1 or values.shape[0] != dimension:
+                    raise ValueError(f"Vector '{record['id']}' has dimension {values.shape[-1]}; "
+                                     f"the store holds {dimension}-dimensional vectors.")
+                position = positions.get(record["id"])
+                if position is not None:
+                    matrix[position] = values
+                    metadata[position] = record.get("metadata", {})
+                else:
+                    positions[record["id"]] = len(ids)
+                    ids.append(record["id"])
+                    metadata.append(record.get("metadata", {}))
+                    new_rows.append(values)
+            if new_rows:
+                new_matrix = np.vstack(new_rows)
+                state[0] = new_matrix if matrix is None else np.vstack([matrix, new_matrix])
+            self._write(state)
+            return {"upserted_count": len(vectors)}
+
+    def delete(self, ids, **kwargs):
+        """Remove the records with the given ids."""
+        with self._lock:
+            matrix, current_ids, metadata, positions = self._working_copy()
+            doomed = set(ids) & positions.keys()
+            if not doomed:
+                return
+            keep = [i for i, vector_id in enumerate(current_ids) if vector_id not in doomed]
+            kept_ids = [current_ids[i] for i in keep]
+            matrix = matrix[keep] if keep else np.zeros((0, matrix.shape[-1]), dtype=np.float32)
+            self._write([matrix, kept_ids, [metadata[i] for i in keep],
+                         {vector_id: i for i, vector_id in enumerate(kept_ids)}])
+
+    def _save(self, matrix, ids, metadata):
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        digest.update(json.dumps(ids).encode("utf-8"))
+        digest.update(np.ascontiguousarray(matrix).tobytes())
+        version = digest.hexdigest()[:16]
+        previous = read_manifest(self.directory).get("version")
+
+        records = [{"id": vector_id, "metadata": meta} for vector_id, meta in zip(ids, metadata)]
+        manifest = {
+            "version": version,
+            "count": len(ids),
+            "dimension": int(matrix.shape[-1]),
+            "vectors": f"vectors-{version}.npy",
+            "metadata": f"metadata-{version}.json",
+        }
+        _atomic_write(self._path(manifest["vectors"]), lambda f: np.save(f, matrix))
+        _atomic_write(self._path(manifest["metadata"]), lambda f: json.dump(records, f), mode="w")
+        _atomic_write(self._path(MANIFEST_FILE), lambda f: json.dump(manifest, f, indent=2), mode="w")
+        self._load()
+        self._remove_versions(keep={version, previous})
+
+    def _remove_versions(self, keep):
+        """Best-effort removal of the files of every version not in `keep`."""
+        for name in os.listdir(self.directory):
+            stem, _, extension = name.rpartition(".")
+            kind, _, version = stem.partition("-")
+            if kind in ("vectors", "metadata", "ivf") and extension in ("npy", "json", "npz") and version not in keep:
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    # Still mapped by a reader on some platforms; a later save retries.
+                    pass
+
+
+class PineconeStore:
+    """Thin adapter over a Pinecone index so it can be swapped with the local store."""
+
+    def __init__(self, index, version=None):
+        self.index = index
+        self.version = version
+
+    def query(self, vector, top_k=10, include_metadata=True, **kwargs):
+        results = self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata, **kwargs)
+        return {"matches": [plain_match(match) for match in results["matches"]]}
+
+    @contextmanager
+    def batch(self):
+        # Pinecone upserts are already incremental; nothing to defer.
+        yield self
+
+    def upsert(self, vectors, batch_size=100, **kwargs):
+        for start in range(0, len(vectors), batch_size):
+            self.index.upsert(vectors=vectors[start:start + batch_size], **kwargs)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids, **kwargs):
+        return self.index.delete(ids=ids, **kwargs)